@@ -0,0 +1,48 @@
+"""
+Validation HTTP (ETag / Last-Modified) des téléchargements et des résultats
+
+Un fichier généré ou le résultat d'un traitement réussi ne change plus : l'ETag fort est
+l'empreinte SHA-256 du contenu, Last-Modified sa date de création. Une requête
+conditionnelle (If-None-Match / If-Modified-Since) dont la version est encore à jour
+reçoit un 304 sans corps. `Cache-Control: no-cache` autorise le navigateur et les proxys
+à conserver la réponse à condition de la revalider.
+"""
+
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def content_hash(content):
+    """Empreinte SHA-256 (hexadécimale) d'un contenu binaire"""
+    return hashlib.sha256(bytes(content)).hexdigest()
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Ajoute ETag, Last-Modified et Cache-Control à `response`"""
+    if etag:
+        response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Réponse 304 (ou 412) si la version détenue par le client est à jour, None sinon.
+
+    À appeler avant de lire le contenu : un 304 n'en a pas besoin. If-None-Match est
+    prioritaire sur If-Modified-Since.
+    """
+    validators = set_validators(HttpResponse(), etag, last_modified)
+    response = get_conditional_response(
+        request,
+        etag=validators.get('ETag'),
+        last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+        response=validators,
+    )
+    # Sans condition vérifiée, Django renvoie la réponse fournie (200 sans corps)
+    return response if response.status_code in (304, 412) else None
@@ -0,0 +1,224 @@
+"""
+Catalogue des rapports AccountData (ReportCatalog)
+
+Une ligne par financial_report_id : nombre de lignes, exercices présents, première et
+dernière date de created_at, empreinte du contenu et statut de traitement. La liste des
+rapports, la période TFT et le seuil de comptes sont lus dans le catalogue (une requête
+indexée) au lieu d'être agrégés sur account_data.
+
+Chaque écriture incrémente la version de l'entrée de son rapport (`mark_reports_changed`,
+appelée par le journal des changements dans la transaction de l'écriture). Les chargeurs
+recalculent aussitôt leurs entrées ; après une écriture ligne à ligne (signaux), l'entrée
+est recalculée à la lecture suivante. Une entrée n'est marquée à jour que si sa version n'a
+pas changé pendant le calcul : une écriture concurrente la laisse à recalculer.
+
+Chaque traitement (BalanceUpload) garde l'empreinte des données qu'il a lues. Quand le
+dernier traitement d'un rapport ne correspond plus à ses données (lignes arrivées ou
+remplacées après la génération), son statut passe à « stale » : le rapport est de nouveau
+à traiter, comme un rapport jamais traité.
+"""
+
+import hashlib
+import logging
+
+from django.db import connection
+from django.db.models import Count, F, Max, Min
+from django.db.models.functions import ExtractYear
+
+from .models import AccountData, BalanceUpload, ReportCatalog
+
+logger = logging.getLogger(__name__)
+
+STATUS_UNPROCESSED = 'unprocessed'
+STATUS_STALE = 'stale'
+# Statuts d'un rapport à (re)traiter
+PENDING_STATUSES = (STATUS_UNPROCESSED, STATUS_STALE)
+REFRESH_BATCH_SIZE = 500
+
+
+def mark_reports_changed(financial_report_ids):
+    """Crée ou invalide l'entrée de chaque financial_report_id (deux requêtes)"""
+    financial_report_ids = sorted({fid for fid in financial_report_ids if fid})
+    if not financial_report_ids:
+        return
+    # Insertion d'abord : une création concurrente est attendue puis invalidée
+    ReportCatalog.objects.bulk_create(
+        [ReportCatalog(financial_report_id=fid) for fid in financial_report_ids],
+        ignore_conflicts=True,
+    )
+    ReportCatalog.objects.filter(financial_report_id__in=financial_report_ids).update(
+        version=F('version') + 1
+    )
+
+
+def set_processing_status(financial_report_ids, status):
+    """Reporte le statut du traitement (BalanceUpload) dans le catalogue"""
+    financial_report_ids = [fid for fid in financial_report_ids if fid]
+    if financial_report_ids:
+        ReportCatalog.objects.filter(financial_report_id__in=financial_report_ids).update(
+            processing_status=status
+        )
+
+
+def set_result_status(financial_report_id, status, data_fingerprint=''):
+    """
+    Reporte le statut d'un traitement qui vient d'être enregistré : « stale » si les données
+    du rapport ont changé depuis leur lecture par la génération (empreinte différente).
+    """
+    if not financial_report_id:
+        return
+    entries = ReportCatalog.objects.filter(financial_report_id=financial_report_id)
+    if not data_fingerprint:
+        entries.update(processing_status=status)
+        return
+    entries.filter(fingerprint=data_fingerprint).update(processing_status=status)
+    entries.exclude(fingerprint=data_fingerprint).update(processing_status=STATUS_STALE)
+
+
+def result_status(status, data_fingerprint, fingerprint, row_count):
+    """
+    Statut catalogue du dernier traitement d'un rapport : « stale » s'il a été généré à
+    partir d'autres données, ou marqué obsolète alors que le rapport a de nouveau des lignes
+    """
+    if row_count and status == 'obsolete':
+        return STATUS_STALE
+    if data_fingerprint and data_fingerprint != fingerprint:
+        return STATUS_STALE
+    return status
+
+
+def _fingerprints(financial_report_ids):
+    """
+    Empreinte md5 des (id, row_hash) de chaque rapport, lignes lues dans l'ordre des id.
+
+    Calculée par PostgreSQL (string_agg ordonné) sans transférer les lignes ; ailleurs, les
+    lignes sont lues et hachées en Python. Les deux calculs donnent la même empreinte.
+    """
+    if connection.vendor == 'postgresql':
+        qn = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(financial_report_ids))
+        sql = (
+            f"SELECT {qn('financial_report_id')}, "
+            f"md5(string_agg({qn('id')} || ':' || {qn('row_hash')} || E'\\n', '' ORDER BY {qn('id')})) "
+            f"FROM {qn(AccountData._meta.db_table)} "
+            f"WHERE {qn('financial_report_id')} IN ({placeholders}) "
+            f"GROUP BY {qn('financial_report_id')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, financial_report_ids)
+            return dict(cursor.fetchall())
+
+    digests = {}
+    rows = (
+        AccountData.objects.filter(financial_report_id__in=financial_report_ids)
+        .order_by('financial_report_id', 'id')
+        .values_list('financial_report_id', 'id', 'row_hash')
+    )
+    for fid, row_id, row_hash in rows.iterator(chunk_size=5000):
+        digest = digests.get(fid)
+        if digest is None:
+            digest = digests[fid] = hashlib.md5()
+        digest.update(f'{row_id}:{row_hash}\n'.encode())
+    return {fid: digest.hexdigest() for fid, digest in digests.items()}
+
+
+def _refresh_batch(versions):
+    financial_report_ids = sorted(versions)
+    entries = {
+        fid: {'row_count': 0, 'years': [], 'first_created_at': None, 'last_created_at': None}
+        for fid in financial_report_ids
+    }
+    rows = (
+        AccountData.objects.filter(financial_report_id__in=financial_report_ids)
+        .annotate(year=ExtractYear('created_at'))
+        .values('financial_report_id', 'year')
+        .annotate(count=Count('id'), first=Min('created_at'), last=Max('created_at'))
+        .order_by()
+    )
+    for row in rows:
+        entry = entries[row['financial_report_id']]
+        entry['row_count'] += row['count']
+        if row['year'] is not None:
+            entry['years'].append(row['year'])
+        if row['first'] is not None and (entry['first_created_at'] is None or row['first'] < entry['first_created_at']):
+            entry['first_created_at'] = row['first']
+        if row['last'] is not None and (entry['last_created_at'] is None or row['last'] > entry['last_created_at']):
+            entry['last_created_at'] = row['last']
+
+    fingerprints = _fingerprints(financial_report_ids)
+    # Dernier traitement de chaque rapport (statut et empreinte des données lues)
+    latest = {
+        fid: (status, data_fingerprint)
+        for fid, status, data_fingerprint in
+        BalanceUpload.objects.filter(financial_report_id__in=financial_report_ids)
+        .order_by('financial_report_id', 'id')
+        .values_list('financial_report_id', 'status', 'data_fingerprint')
+    }
+
+    refreshed = 0
+    for fid, entry in entries.items():
+        entry['years'].sort()
+        fingerprint = fingerprints.get(fid, '')
+        status = STATUS_UNPROCESSED
+        if fid in latest:
+            status = result_status(*latest[fid], fingerprint, entry['row_count'])
+        refreshed += ReportCatalog.objects.filter(financial_report_id=fid, version=versions[fid]).update(
+            fingerprint=fingerprint,
+            processing_status=status,
+            refreshed_version=versions[fid],
+            **entry
+        )
+    return refreshed
+
+
+def refresh_report_catalog(financial_report_ids=None):
+    """
+    Recalcule les entrées à mettre à jour (toutes, ou parmi `financial_report_ids`).
+
+    Une requête groupée par lot de rapports ; retourne le nombre d'entrées mises à jour.
+    """
+    stale = ReportCatalog.objects.filter(version__gt=F('refreshed_version'))
+    if financial_report_ids is not None:
+        stale = stale.filter(financial_report_id__in=[fid for fid in financial_report_ids if fid])
+    versions = dict(stale.values_list('financial_report_id', 'version'))
+
+    refreshed = 0
+    financial_report_ids = sorted(versions)
+    for start in range(0, len(financial_report_ids), REFRESH_BATCH_SIZE):
+        batch = financial_report_ids[start:start + REFRESH_BATCH_SIZE]
+        refreshed += _refresh_batch({fid: versions[fid] for fid in batch})
+    if refreshed:
+        logger.info("Catalogue: %s rapport(s) recalculé(s)", refreshed)
+    return refreshed
+
+
+def report_catalog(financial_report_ids=None, refresh=True):
+    """
+    Entrées du catalogue des rapports ayant des données (toutes, ou `financial_report_ids`).
+
+    Une requête si les entrées sont à jour ; les entrées à recalculer le sont avant lecture.
+    refresh=False (lectures sur le réplica) : aucune écriture, les entrées à recalculer sont
+    retournées telles que lors de leur dernier calcul (statut de traitement à jour).
+    Retourne {fid: {'count', 'years', 'first_created_at', 'last_created_at',
+    'fingerprint', 'processing_status'}}, trié par financial_report_id.
+    """
+    entries = ReportCatalog.objects.order_by('financial_report_id')
+    if financial_report_ids is not None:
+        entries = entries.filter(financial_report_id__in=[fid for fid in financial_report_ids if fid])
+    entries = list(entries)
+    stale = [entry.financial_report_id for entry in entries if entry.version > entry.refreshed_version]
+    if stale and refresh:
+        refresh_report_catalog(stale)
+        entries = ReportCatalog.objects.filter(pk__in=[entry.pk for entry in entries]).order_by('financial_report_id')
+    return {
+        entry.financial_report_id: {
+            'count': entry.row_count,
+            'years': entry.years,
+            'first_created_at': entry.first_created_at,
+            'last_created_at': entry.last_created_at,
+            'fingerprint': entry.fingerprint,
+            'processing_status': entry.processing_status,
+        }
+        for entry in entries
+        if entry.row_count > 0
+    }
@@ -0,0 +1,125 @@
+"""
+Journal des changements AccountData et position des moniteurs (high-water mark)
+
+Chaque chargement ajoute une entrée par financial_report_id touché dans
+AccountDataChange. Un moniteur ne lit que les entrées postérieures à sa position
+(MonitorCursor) : le coût d'un passage dépend du nombre de changements, pas de la taille
+de account_data.
+
+Un identifiant peut être attribué avant la validation d'une transaction plus ancienne :
+les entrées des CHANGE_LOG_GRACE_SECONDS dernières secondes sont donc relues à chaque
+passage (le filtre « déjà traité » rend la relecture sans effet).
+
+Sans position enregistrée (premier démarrage), le moniteur fait un balayage complet
+puis se place en fin de journal.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .catalog import PENDING_STATUSES, mark_reports_changed, report_catalog
+from .models import AccountData, AccountDataChange, MonitorCursor
+from .notifications import notify_report_changes
+from .triggers import pending_report_ids
+
+CHANGE_WRITE = 'write'
+CHANGE_DELETE = 'delete'
+
+
+def record_report_changes(financial_report_ids, kind=CHANGE_WRITE):
+    """
+    Ajoute une entrée de journal par financial_report_id (une requête) et invalide leurs
+    entrées du catalogue ; les écritures sont notifiées.
+    """
+    financial_report_ids = sorted({fid for fid in financial_report_ids if fid})
+    if not financial_report_ids:
+        return
+    AccountDataChange.objects.bulk_create(
+        [AccountDataChange(financial_report_id=fid, kind=kind) for fid in financial_report_ids]
+    )
+    mark_reports_changed(financial_report_ids)
+    if kind == CHANGE_WRITE:
+        notify_report_changes(financial_report_ids)
+
+
+def latest_change_id():
+    return AccountDataChange.objects.aggregate(position=Max('id'))['position'] or 0
+
+
+def read_report_changes(after_id, kinds=(CHANGE_WRITE,), now=None):
+    """
+    financial_report_id modifiés après `after_id` (plus la fenêtre de relecture).
+
+    Retourne (ensemble des financial_report_id, nouvelle position).
+    """
+    now = now or timezone.now()
+    grace = timedelta(seconds=getattr(settings, 'CHANGE_LOG_GRACE_SECONDS', 300))
+    rows = AccountDataChange.objects.filter(
+        Q(id__gt=after_id) | Q(created_at__gte=now - grace),
+        kind__in=kinds,
+    ).values_list('id', 'financial_report_id')
+
+    position = after_id
+    financial_report_ids = set()
+    for change_id, fid in rows:
+        position = max(position, change_id)
+        financial_report_ids.add(fid)
+    return financial_report_ids, position
+
+
+def get_watermark(name):
+    """Position enregistrée du moniteur, None s'il n'en a pas encore"""
+    return MonitorCursor.objects.filter(name=name).values_list('position', flat=True).first()
+
+
+def advance_watermark(name, position):
+    """Enregistre la position du moniteur (jamais en arrière)"""
+    cursor, created = MonitorCursor.objects.get_or_create(name=name, defaults={'position': position})
+    if not created and position > cursor.position:
+        MonitorCursor.objects.filter(pk=cursor.pk, position__lt=position).update(
+            position=position, updated_at=timezone.now()
+        )
+
+
+def prune_report_changes(now=None):
+    """Supprime les entrées plus anciennes que CHANGE_LOG_RETENTION_DAYS"""
+    retention = timedelta(days=getattr(settings, 'CHANGE_LOG_RETENTION_DAYS', 7))
+    deleted, _ = AccountDataChange.objects.filter(
+        created_at__lt=(now or timezone.now()) - retention
+    ).delete()
+    return deleted
+
+
+def unprocessed_changed_reports(monitor_name, after=None):
+    """
+    financial_report_id modifiés depuis le dernier passage du moniteur et à traiter : jamais
+    traités, ou dont le traitement est périmé (statut du catalogue).
+
+    `after` remplace la position enregistrée (relecture après un changement de nœuds).
+    Retourne (liste triée, position à enregistrer via `advance_watermark` une fois la
+    liste traitée). Les rapports encore en cours d'écriture sont laissés à leur
+    déclencheur (process_due_reports).
+    """
+    watermark = after if after is not None else get_watermark(monitor_name)
+    if watermark is None:
+        # Premier passage : balayage complet, la position est lue avant le balayage
+        position = latest_change_id()
+        candidates = set(AccountData.objects.values_list('financial_report_id', flat=True).distinct())
+    else:
+        candidates, position = read_report_changes(watermark)
+
+    candidates.discard('')
+    candidates.discard(None)
+    if not candidates:
+        return [], position
+
+    reports = report_catalog(None if watermark is None else candidates)
+    pending_ids = {
+        fid for fid, report in reports.items()
+        if fid in candidates and report['processing_status'] in PENDING_STATUSES
+    }
+    waiting_ids = pending_report_ids()
+    return sorted(pending_ids - waiting_ids), position
@@ -0,0 +1,119 @@
+"""
+Coordination des moniteurs lancés sur plusieurs nœuds
+
+Chaque moniteur s'inscrit dans MonitorNode et renouvelle son battement de cœur à chaque
+passage ; un nœud sans battement depuis MONITOR_NODE_TTL_SECONDS est considéré arrêté.
+Les financial_report_id sont répartis entre les nœuds vivants par hachage de rendez-vous :
+chaque rapport a un seul propriétaire, et l'arrivée ou le départ d'un nœud ne déplace que
+la part de ce nœud.
+
+Chaque nœud a sa propre position dans le journal des changements
+(`<moniteur>@<nœud>`). Quand la composition change, il relit le journal depuis la
+position la plus ancienne des nœuds connus : la part d'un nœud arrêté avant d'avoir
+traité ses changements est reprise par son nouveau propriétaire.
+"""
+
+import hashlib
+import logging
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import MonitorCursor, MonitorNode
+
+logger = logging.getLogger(__name__)
+
+# Un nœud arrêté depuis DEAD_NODE_TTL_FACTOR * MONITOR_NODE_TTL_SECONDS est oublié
+DEAD_NODE_TTL_FACTOR = 10
+
+
+def node_ttl():
+    return timedelta(seconds=getattr(settings, 'MONITOR_NODE_TTL_SECONDS', 120))
+
+
+def report_owner(financial_report_id, nodes):
+    """Nœud propriétaire d'un rapport (hachage de rendez-vous, stable entre les nœuds)"""
+    return max(
+        nodes,
+        key=lambda node: hashlib.md5(f'{node}:{financial_report_id}'.encode()).digest(),
+    )
+
+
+class MonitorCoordinator:
+    """Battement de cœur, composition et part des rapports d'un moniteur sur ce nœud"""
+
+    def __init__(self, monitor, node=None):
+        self.monitor = monitor
+        self.node = node or socket.gethostname()
+        self.cursor_name = f'{monitor}@{self.node}'
+        self.started_at = timezone.now()
+        self.members = None
+        self.members_changed = False
+
+    def heartbeat(self, now=None):
+        now = now or timezone.now()
+        MonitorNode.objects.bulk_create(
+            [MonitorNode(monitor=self.monitor, node=self.node, started_at=self.started_at, heartbeat_at=now)],
+            update_conflicts=True,
+            unique_fields=['monitor', 'node'],
+            update_fields=['heartbeat_at'],
+        )
+
+    def _prune_dead_nodes(self, now):
+        dead = list(
+            MonitorNode.objects.filter(
+                monitor=self.monitor, heartbeat_at__lt=now - node_ttl() * DEAD_NODE_TTL_FACTOR
+            ).values_list('node', flat=True)
+        )
+        if dead:
+            MonitorCursor.objects.filter(name__in=[f'{self.monitor}@{node}' for node in dead]).delete()
+            MonitorNode.objects.filter(monitor=self.monitor, node__in=dead).delete()
+            logger.info("Nœuds %s oubliés: %s", self.monitor, ', '.join(dead))
+
+    def refresh(self, now=None):
+        """Battement de cœur puis lecture des nœuds vivants ; retourne la liste triée"""
+        now = now or timezone.now()
+        self.heartbeat(now)
+        self._prune_dead_nodes(now)
+        members = sorted(
+            MonitorNode.objects.filter(
+                monitor=self.monitor, heartbeat_at__gte=now - node_ttl()
+            ).values_list('node', flat=True)
+        )
+        self.members_changed = self.members is not None and members != self.members
+        if self.members_changed:
+            logger.info("Nœuds %s: %s", self.monitor, ', '.join(members))
+        self.members = members
+        return members
+
+    def owns(self, financial_report_id):
+        if not self.members or len(self.members) == 1:
+            return True
+        return report_owner(financial_report_id, self.members) == self.node
+
+    def read_position(self):
+        """
+        Position de départ de la lecture du journal : None (position enregistrée) sauf au
+        premier passage du nœud ou après un changement de composition.
+        """
+        own = MonitorCursor.objects.filter(name=self.cursor_name).exists()
+        if own and not self.members_changed:
+            return None
+        nodes = MonitorNode.objects.filter(monitor=self.monitor).values_list('node', flat=True)
+        names = Q(name__in=[f'{self.monitor}@{node}' for node in nodes])
+        if not own:
+            # Premier passage : reprise depuis les autres nœuds (ou l'ancien curseur unique)
+            names |= Q(name=self.monitor)
+        return MonitorCursor.objects.filter(names).aggregate(position=Min('position'))['position']
+
+    def leave(self):
+        """
+        Quitte la composition : les autres nœuds reprennent la part de celui-ci sans
+        attendre l'expiration. Le nœud reste connu (sa position compte pour la relecture).
+        """
+        MonitorNode.objects.filter(monitor=self.monitor, node=self.node).update(
+            heartbeat_at=timezone.now() - node_ttl() - timedelta(seconds=1)
+        )
@@ -0,0 +1,284 @@
+"""
+Ingestion en flux d'une balance (CSV ou NDJSON) envoyée dans le corps d'une requête
+
+Le corps est lu par blocs directement depuis la requête, sans passer par MEDIA_ROOT :
+chaque bloc est validé par `normalize_chunk` puis écrit dans AccountData (COPY sur
+PostgreSQL, `bulk_create` ailleurs) dans une seule transaction. Toutes les lignes sont
+rattachées au financial_report_id fourni ou à un nouvel identifiant.
+
+L'écriture en masse (tableau JSON ou NDJSON, chaque ligne portant son propre
+financial_report_id) suit le même chemin ; dans les deux cas le déclencheur de chaque
+rapport touché est mis à jour une seule fois (voir `signals.coalesce_processing`).
+
+Le fichier brut n'est conservé (default_storage) que sur demande explicite.
+"""
+
+import io
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+import pandas as pd
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .loaders import (
+    ACCOUNT_DATA_COLUMNS, CSV_DTYPES, CSV_NA_VALUES, LoadError,
+    _copy_from_stdin, _frame_to_instances, check_columns, delete_report_rows,
+    frame_to_copy_buffer, normalize_chunk, resolve_mode, split_seen_ids,
+)
+from .catalog import refresh_report_catalog
+from .models import AccountData
+from .signals import coalesce_processing, schedule_processing
+
+logger = logging.getLogger(__name__)
+
+INGEST_FORMATS = ('csv', 'ndjson')
+INGEST_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+DEFAULT_INGEST_CHUNK_SIZE = 5000
+# Nombre de rejets détaillés renvoyés dans la réponse (le total est toujours compté)
+MAX_REPORTED_REJECTS = 100
+RAW_UPLOAD_DIR = 'balances/raw'
+
+
+def format_from_content_type(content_type):
+    """Déduit le format (csv / ndjson) du Content-Type, None s'il n'est pas reconnu"""
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    return INGEST_CONTENT_TYPES.get(media_type)
+
+
+class RequestBodyReader(io.RawIOBase):
+    """
+    Expose le corps d'une requête (tout objet avec `read(size)`) comme flux binaire.
+
+    Si `sink` est fourni, chaque octet lu y est recopié (conservation du brut sur demande).
+    """
+
+    def __init__(self, source, sink=None):
+        self.source = source
+        self.sink = sink
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        if not data:
+            return 0
+        size = len(data)
+        buffer[:size] = data
+        if self.sink is not None:
+            self.sink.write(data)
+        self.bytes_read += size
+        return size
+
+
+def _iter_csv_stream(text, chunk_size):
+    chunks = pd.read_csv(
+        text,
+        dtype=CSV_DTYPES,
+        na_values=CSV_NA_VALUES,
+        keep_default_na=False,
+        chunksize=chunk_size,
+    )
+    for chunk in chunks:
+        check_columns(chunk.columns)
+        yield chunk
+
+
+def _ndjson_frame(records, line_numbers):
+    frame = pd.DataFrame.from_records(records).astype('string')
+    # normalize_chunk numérote les rejets index + 2 (ligne d'en-tête CSV)
+    frame.index = pd.Index(line_numbers) - 2
+    check_columns(frame.columns)
+    return frame
+
+
+def _iter_ndjson_stream(text, chunk_size):
+    """Un objet JSON par ligne ; nombres lus en texte pour la validation vectorisée"""
+    records = []
+    line_numbers = []
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line, parse_float=str, parse_int=str)
+        except ValueError as e:
+            raise LoadError(f"Ligne {line_number}: JSON invalide ({e})")
+        if not isinstance(record, dict):
+            raise LoadError(f"Ligne {line_number}: objet JSON attendu")
+        records.append(record)
+        line_numbers.append(line_number)
+        if len(records) >= chunk_size:
+            yield _ndjson_frame(records, line_numbers)
+            records = []
+            line_numbers = []
+    if records:
+        yield _ndjson_frame(records, line_numbers)
+
+
+def iter_stream_chunks(stream, fmt, chunk_size=DEFAULT_INGEST_CHUNK_SIZE):
+    """Découpe un flux binaire (UTF-8) en blocs DataFrame de colonnes texte"""
+    if fmt not in INGEST_FORMATS:
+        raise LoadError(f"Format d'ingestion inconnu: {fmt}")
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        return _iter_csv_stream(text, chunk_size)
+    return _iter_ndjson_stream(text, chunk_size)
+
+
+def _write_chunk(cursor, valid, mode, batch_size):
+    if mode == 'copy':
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(name) for name in ACCOUNT_DATA_COLUMNS)
+        _copy_from_stdin(
+            cursor,
+            f"COPY {qn(AccountData._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            frame_to_copy_buffer(valid),
+        )
+    else:
+        AccountData.objects.bulk_create(_frame_to_instances(valid), batch_size=batch_size)
+
+
+class _ChunkWriter:
+    """Valide et écrit des blocs dans AccountData en accumulant le résumé (lignes, rejets, rapports)"""
+
+    def __init__(self, cursor, mode, batch_size):
+        self.cursor = cursor
+        self.mode = mode
+        self.batch_size = batch_size
+        self.rows = 0
+        self.errors = 0
+        self.rejects = []
+        self.financial_report_ids = set()
+        self.seen_ids = set()
+
+    def write(self, chunk):
+        valid, chunk_rejects = normalize_chunk(chunk)
+        # Un id déjà écrit par un bloc précédent est rejeté (pas d'échec de toute l'écriture)
+        valid, duplicates = split_seen_ids(valid, self.seen_ids)
+        if not duplicates.empty:
+            chunk_rejects = pd.concat([chunk_rejects, duplicates], ignore_index=True)
+        self.errors += len(chunk_rejects)
+        if len(self.rejects) < MAX_REPORTED_REJECTS and not chunk_rejects.empty:
+            remaining = MAX_REPORTED_REJECTS - len(self.rejects)
+            self.rejects.extend(
+                {'line': int(r.line), 'id': None if pd.isna(r.id) else r.id, 'reason': r.reason}
+                for r in chunk_rejects.head(remaining).itertuples(index=False)
+            )
+        if not valid.empty:
+            _write_chunk(self.cursor, valid, self.mode, self.batch_size)
+            self.rows += len(valid)
+            self.financial_report_ids.update(fid for fid in valid['financial_report_id'].unique() if fid)
+
+
+def ingest_account_data_stream(stream, fmt, financial_report_id=None, chunk_size=DEFAULT_INGEST_CHUNK_SIZE,
+                               batch_size=1000, keep_raw=False, raw_name=None, mode='auto'):
+    """
+    Écrit dans AccountData les lignes d'un flux CSV ou NDJSON.
+
+    - `financial_report_id` : rapport cible ; un UUID est généré s'il est absent. Les
+      lignes existantes de ce rapport sont remplacées (comme le chargeur CSV).
+    - `keep_raw` : recopie le flux dans default_storage (RAW_UPLOAD_DIR)
+
+    Le déclencheur de traitement du rapport est mis à jour une seule fois.
+
+    Retourne {'financial_report_id', 'mode', 'rows', 'errors', 'rejects', 'bytes', 'raw_file'} ;
+    `rejects` contient au plus MAX_REPORTED_REJECTS lignes rejetées (ligne, id, motif).
+    """
+    financial_report_id = financial_report_id or str(uuid.uuid4())
+    mode = resolve_mode(mode)
+
+    raw_copy = tempfile.TemporaryFile() if keep_raw else None
+    reader = RequestBodyReader(stream, sink=raw_copy)
+
+    try:
+        with transaction.atomic(), coalesce_processing(), connection.cursor() as cursor:
+            delete_report_rows([financial_report_id])
+
+            writer = _ChunkWriter(cursor, mode, batch_size)
+            for chunk in iter_stream_chunks(reader, fmt, chunk_size):
+                # Toutes les lignes sont rattachées au rapport de l'ingestion
+                chunk['financial_report_id'] = financial_report_id
+                writer.write(chunk)
+            schedule_processing(writer.financial_report_ids)
+
+        refresh_report_catalog([financial_report_id])
+
+        raw_file = None
+        if raw_copy is not None:
+            raw_copy.seek(0)
+            extension = 'csv' if fmt == 'csv' else 'ndjson'
+            name = os.path.basename(raw_name or '') or f'{financial_report_id}.{extension}'
+            raw_file = default_storage.save(os.path.join(RAW_UPLOAD_DIR, name), File(raw_copy))
+    except pd.errors.EmptyDataError:
+        raise LoadError("Flux vide")
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise LoadError(f"Flux illisible: {e}")
+    finally:
+        if raw_copy is not None:
+            raw_copy.close()
+
+    logger.info("Ingestion %s: %s lignes, %s rejets (%s octets)",
+                financial_report_id, writer.rows, writer.errors, reader.bytes_read)
+    return {
+        'financial_report_id': financial_report_id,
+        'mode': mode,
+        'rows': writer.rows,
+        'errors': writer.errors,
+        'rejects': writer.rejects,
+        'bytes': reader.bytes_read,
+        'raw_file': raw_file,
+    }
+
+
+def iter_json_array_chunks(body, chunk_size=DEFAULT_INGEST_CHUNK_SIZE):
+    """Découpe un tableau JSON d'objets en blocs ; `line` des rejets = position dans le tableau"""
+    try:
+        records = json.loads(body, parse_float=str, parse_int=str)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise LoadError(f"JSON invalide: {e}")
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise LoadError("Un tableau JSON d'objets est attendu")
+    for start in range(0, len(records), chunk_size):
+        batch = records[start:start + chunk_size]
+        yield _ndjson_frame(batch, range(start + 1, start + 1 + len(batch)))
+
+
+def bulk_write_account_data(chunks, batch_size=1000, mode='auto'):
+    """
+    Insère des lignes AccountData (chacune avec son financial_report_id) en une transaction.
+
+    Les signaux par ligne sont suspendus : le déclencheur de chaque financial_report_id
+    touché est mis à jour une seule fois.
+
+    Retourne {'mode', 'rows', 'errors', 'rejects', 'financial_report_ids'}.
+    """
+    mode = resolve_mode(mode)
+    with transaction.atomic(), coalesce_processing(), connection.cursor() as cursor:
+        writer = _ChunkWriter(cursor, mode, batch_size)
+        for chunk in chunks:
+            writer.write(chunk)
+        schedule_processing(writer.financial_report_ids)
+    refresh_report_catalog(writer.financial_report_ids)
+
+    logger.info("Écriture en masse: %s lignes, %s rejets, rapports %s",
+                writer.rows, writer.errors, sorted(writer.financial_report_ids))
+    return {
+        'mode': mode,
+        'rows': writer.rows,
+        'errors': writer.errors,
+        'rejects': writer.rejects,
+        'financial_report_ids': sorted(writer.financial_report_ids),
+    }
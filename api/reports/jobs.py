@@ -0,0 +1,525 @@
+"""
+File d'attente durable des traitements de rapports
+
+Les traitements sont enregistrés dans ProcessingJob puis exécutés hors des requêtes HTTP
+par `manage.py run_workers` (N processus). Un job est réservé avec
+SELECT ... FOR UPDATE SKIP LOCKED sur PostgreSQL ; sur SQLite (pas de verrou de ligne), la
+réservation est un UPDATE conditionnel (compare-and-set sur statut et tentatives).
+
+Les échecs sont retentés avec un backoff exponentiel jusqu'à `max_attempts` ; les durées
+(attente, génération, enregistrement, total) sont enregistrées sur le job, ainsi que
+l'étape en cours (`progress`) consultable via l'API de statut.
+
+Priorités : chaque job appartient à une file (interactive, scheduled, backfill). Les
+workers vident toujours la file la plus prioritaire en premier, et une part de la capacité
+(JOB_INTERACTIVE_WORKERS) est réservée aux demandes interactives : un utilisateur ne passe
+pas derrière un rattrapage de plusieurs centaines de rapports.
+
+Single-flight : une contrainte d'unicité partielle garantit au plus un job actif (en file
+ou en cours) par financial_report_id. Un appelant qui arrive pendant un traitement se
+rattache au job existant et attend son résultat au lieu de relancer la génération.
+
+Un fichier de balance uploadé est traité par un job sans financial_report_id
+(`enqueue_upload_job`, payload source « file ») qui complète le BalanceUpload créé à
+l'upload ; le fichier doit être lisible par les workers (MEDIA_ROOT partagé).
+"""
+
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .catalog import PENDING_STATUSES, report_catalog
+from .models import BalanceUpload, ProcessingJob
+from .persistence import persist_generation_results, persist_generation_error
+from .routers import PRIMARY_ALIAS, pin_to_primary, replica_alias
+from .stats import report_period
+from .tft_generator import generate_tft_and_sheets, generate_tft_and_sheets_from_database
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_SKIPPED = 'skipped'
+SOURCE_FILE = 'file'  # Job d'un fichier uploadé (payload['source'])
+ACTIVE_JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# Files de priorité (la plus petite valeur est servie en premier)
+PRIORITY_INTERACTIVE = 0  # Demande d'un utilisateur (process-account-data, upload)
+PRIORITY_SCHEDULED = 1  # Moniteurs et déclencheurs (process_due_reports)
+PRIORITY_BACKFILL = 2  # Rattrapage (auto-process)
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_SCHEDULED: 'scheduled',
+    PRIORITY_BACKFILL: 'backfill',
+}
+
+PROGRESS_LABELS = {
+    'load': 'Chargement des données',
+    'aggregate': 'Agrégation TFT',
+    'render': 'Rendu des feuilles maîtresses',
+    'persist': 'Enregistrement des résultats',
+    'done': 'Terminé',
+}
+
+
+class JobSkipped(Exception):
+    """Le job ne peut pas aboutir en l'état (données insuffisantes) : pas de nouvelle tentative"""
+
+
+class JobProgress:
+    """Enregistre l'étape en cours d'un job (un UPDATE par étape, visible des clients qui interrogent le statut)"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, stage, current=None, total=None, detail=None):
+        label = PROGRESS_LABELS.get(stage, stage)
+        if current is not None and total:
+            label = f'{label} ({current}/{total})'
+        progress = {
+            'stage': stage,
+            'current': current,
+            'total': total,
+            'detail': detail,
+            'label': label,
+            'updated_at': timezone.now().isoformat(),
+        }
+        self.job.progress = progress
+        ProcessingJob.objects.filter(pk=self.job.pk).update(progress=progress)
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def active_report_job(financial_report_id):
+    return ProcessingJob.objects.filter(
+        financial_report_id=financial_report_id, status__in=ACTIVE_JOB_STATUSES
+    ).first()
+
+
+def interactive_reserved_workers(workers):
+    """Part de `workers` réservée aux demandes interactives (au moins un worker sert toutes les files)"""
+    return min(getattr(settings, 'JOB_INTERACTIVE_WORKERS', 1), workers - 1) if workers > 1 else 0
+
+
+def interactive_jobs_active():
+    return ProcessingJob.objects.filter(
+        status__in=ACTIVE_JOB_STATUSES, priority=PRIORITY_INTERACTIVE
+    ).exists()
+
+
+def background_capacity(workers):
+    """
+    Traitements de fond (scheduled, backfill) autorisés en parallèle sur `workers` :
+    la part réservée est laissée libre tant qu'une demande interactive est active.
+    """
+    reserved = interactive_reserved_workers(workers)
+    if reserved and interactive_jobs_active():
+        return workers - reserved
+    return workers
+
+
+def _promote_job(job, priority):
+    """Un appelant plus prioritaire rattaché à un job actif le fait remonter de file"""
+    if priority < job.priority:
+        ProcessingJob.objects.filter(pk=job.pk, priority__gt=priority).update(priority=priority)
+        job.priority = priority
+
+
+def enqueue_report_job(financial_report_id, max_attempts=None, priority=PRIORITY_SCHEDULED, **payload):
+    """
+    Ajoute le traitement d'un financial_report_id à la file, sauf si un job est déjà actif.
+
+    `priority` : file du job (PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, PRIORITY_BACKFILL).
+    `payload` : start_date / end_date (sinon déduites des exercices), user_id, min_accounts.
+
+    Retourne (job, created) : `created` est False si l'appel s'est rattaché au job actif.
+    """
+    for key in ('start_date', 'end_date'):
+        if payload.get(key) is not None:
+            payload[key] = str(payload[key])
+
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                job = ProcessingJob.objects.create(
+                    financial_report_id=financial_report_id,
+                    payload=payload,
+                    priority=priority,
+                    max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+                )
+        except IntegrityError:
+            # Contrainte single-flight : un job est déjà en file ou en cours
+            job = active_report_job(financial_report_id)
+            if job is not None:
+                _promote_job(job, priority)
+                return job, False
+            # Le job actif vient de se terminer : nouvelle tentative d'insertion
+            continue
+        logger.info(f"Job {job.pk} en file pour financial_report_id: {financial_report_id}")
+        return job, True
+    raise RuntimeError(f"Impossible de mettre en file financial_report_id: {financial_report_id}")
+
+
+def enqueue_upload_job(balance_upload, max_attempts=None, priority=PRIORITY_INTERACTIVE):
+    """
+    Ajoute à la file la génération d'un fichier uploadé : le job complète `balance_upload`
+    (statut « processing ») avec ses résultats, ou l'enregistre en erreur. Retourne le job.
+    """
+    job = ProcessingJob.objects.create(
+        financial_report_id='',
+        payload={'source': SOURCE_FILE},
+        priority=priority,
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+        balance_upload=balance_upload,
+    )
+    logger.info(f"Job {job.pk} en file pour le fichier du traitement {balance_upload.pk}")
+    return job
+
+
+def _claimable_jobs(now, max_priority=None):
+    lease_expired = now - timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 1800))
+    jobs = ProcessingJob.objects.filter(
+        Q(status=JOB_QUEUED, run_after__lte=now)
+        # Worker arrêté brutalement : le job est repris après expiration du bail
+        | Q(status=JOB_RUNNING, locked_at__lt=lease_expired)
+    )
+    if max_priority is not None:
+        jobs = jobs.filter(priority__lte=max_priority)
+    return jobs.order_by('priority', 'run_after', 'id')
+
+
+def claim_job(worker_id, now=None, max_priority=None):
+    """
+    Réserve le prochain job exécutable pour `worker_id`, ou retourne None.
+
+    Les files les plus prioritaires sont servies en premier ; `max_priority` limite le
+    worker à ces files (PRIORITY_INTERACTIVE : worker réservé aux demandes interactives).
+    """
+    now = now or timezone.now()
+    claim = {
+        'status': JOB_RUNNING,
+        'locked_by': worker_id,
+        'locked_at': now,
+        'started_at': now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable_jobs(now, max_priority).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            for field, value in claim.items():
+                setattr(job, field, value)
+            job.attempts += 1
+            job.save(update_fields=list(claim) + ['attempts'])
+            return job
+
+    # Compare-and-set : seul le worker dont l'UPDATE trouve encore la ligne inchangée l'obtient
+    for candidate in _claimable_jobs(now, max_priority).values('id', 'status', 'attempts')[:10]:
+        claimed = ProcessingJob.objects.filter(
+            pk=candidate['id'], status=candidate['status'], attempts=candidate['attempts']
+        ).update(attempts=F('attempts') + 1, **claim)
+        if claimed:
+            return ProcessingJob.objects.get(pk=candidate['id'])
+    return None
+
+
+def claim_specific_job(job, worker_id):
+    """Réserve un job précis s'il est encore en file (exécution immédiate par l'appelant)"""
+    now = timezone.now()
+    claimed = ProcessingJob.objects.filter(pk=job.pk, status=JOB_QUEUED).update(
+        status=JOB_RUNNING,
+        locked_by=worker_id,
+        locked_at=now,
+        started_at=now,
+        attempts=F('attempts') + 1,
+    )
+    job.refresh_from_db()
+    return bool(claimed)
+
+
+def release_worker_jobs(worker_id, error):
+    """
+    Libère les jobs en cours d'un worker arrêté de force (délai dépassé, fin anormale) :
+    remis en file s'il leur reste une tentative, en échec (historisé) sinon. Retourne le
+    nombre de jobs libérés.
+    """
+    now = timezone.now()
+    running = ProcessingJob.objects.filter(status=JOB_RUNNING, locked_by=worker_id)
+    retried = running.filter(attempts__lt=F('max_attempts')).update(
+        status=JOB_QUEUED, run_after=now, locked_by='', locked_at=None, last_error=error,
+    )
+    failed_jobs = list(running)
+    failed = running.update(
+        status=JOB_FAILED, finished_at=now, locked_by='', locked_at=None, last_error=error,
+    )
+    for job in failed_jobs:
+        record_job_failure(job, error)
+    return retried + failed
+
+
+def record_job_failure(job, error):
+    """
+    Historise l'échec définitif d'un job interrompu (BalanceUpload en erreur, statut
+    « error » au catalogue), comme une dernière tentative en échec : le rapport n'est plus
+    considéré comme non traité et réapparaît à la prochaine modification de ses données.
+    """
+    financial_report_id = job.financial_report_id
+    payload = job.payload or {}
+    try:
+        if payload.get('source') == SOURCE_FILE:
+            persist_generation_error(error, balance_upload=job.balance_upload)
+            return
+        if payload.get('start_date') and payload.get('end_date'):
+            start_date, end_date = payload['start_date'], payload['end_date']
+        else:
+            start_date, end_date = report_period(financial_report_id)
+        report = report_catalog([financial_report_id]).get(financial_report_id)
+        persist_generation_error(
+            error,
+            file=None,
+            start_date=start_date,
+            end_date=end_date,
+            user_id=payload.get('user_id'),
+            financial_report_id=financial_report_id,
+            data_fingerprint=report['fingerprint'] if report else '',
+        )
+    except Exception as record_error:
+        logger.error(f"Impossible d'enregistrer l'échec du job {job.pk}: {record_error}")
+
+
+def wait_for_job(job, timeout=None, poll_interval=1):
+    """Attend la fin d'un job actif (ou l'expiration de `timeout`) et le retourne à jour"""
+    if timeout is None:
+        timeout = getattr(settings, 'JOB_WAIT_TIMEOUT_SECONDS', 600)
+    deadline = time.monotonic() + timeout
+    job.refresh_from_db()
+    while job.status in ACTIVE_JOB_STATUSES and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        job.refresh_from_db()
+    return job
+
+
+def run_report_job_now(financial_report_id, wait_timeout=None, priority=PRIORITY_SCHEDULED, **payload):
+    """
+    Traite un rapport immédiatement (appelant synchrone), en single-flight.
+
+    - aucun job actif : un job à tentative unique est créé et exécuté par l'appelant
+    - job en file : l'appelant le réserve et l'exécute sans attendre un worker
+    - job en cours : l'appelant attend son résultat
+
+    Retourne le job (succeeded, failed, skipped, ou encore actif si l'attente expire).
+    """
+    job, created = enqueue_report_job(financial_report_id, max_attempts=1, priority=priority, **payload)
+    if not created:
+        logger.info(f"Rattachement au job {job.pk} déjà actif pour financial_report_id: {financial_report_id}")
+    if claim_specific_job(job, worker_name()):
+        return run_job(job)
+    return wait_for_job(job, timeout=wait_timeout)
+
+
+def execute_upload_job(job, timings):
+    """Génère les résultats du fichier uploadé du job et complète son BalanceUpload"""
+    balance_upload = job.balance_upload
+    progress = JobProgress(job)
+    try:
+        progress('load')
+        step = time.monotonic()
+        results = generate_tft_and_sheets(balance_upload.file.path, balance_upload.start_date, balance_upload.end_date)
+        timings['generate'] = round(time.monotonic() - step, 3)
+
+        progress('persist')
+        step = time.monotonic()
+        persist_generation_results(results, balance_upload=balance_upload)
+        timings['persist'] = round(time.monotonic() - step, 3)
+    except Exception as e:
+        if job.attempts >= job.max_attempts:
+            persist_generation_error(e, balance_upload=balance_upload)
+        raise
+    return balance_upload
+
+
+def execute_report_job(job, timings):
+    """Génère et enregistre le rapport du job ; retourne le BalanceUpload"""
+    financial_report_id = job.financial_report_id
+    payload = job.payload or {}
+    if payload.get('source') == SOURCE_FILE:
+        return execute_upload_job(job, timings)
+
+    # Catalogue recalculé si besoin : l'empreinte lue ici est celle des données générées
+    report = report_catalog([financial_report_id]).get(financial_report_id)
+    existing_upload = BalanceUpload.objects.filter(financial_report_id=financial_report_id).order_by('-id').first()
+    if existing_upload and (report is None or report['processing_status'] not in PENDING_STATUSES):
+        logger.info(f"Traitement déjà existant pour financial_report_id: {financial_report_id}")
+        return existing_upload
+    if existing_upload:
+        # Lignes arrivées ou remplacées depuis le dernier traitement : régénération
+        logger.info(f"Traitement périmé pour financial_report_id: {financial_report_id}, régénération")
+
+    min_accounts = payload.get('min_accounts')
+    if min_accounts:
+        account_count = report['count'] if report else 0
+        if account_count < min_accounts:
+            raise JobSkipped(f"Données insuffisantes ({account_count} comptes, seuil: {min_accounts})")
+
+    if payload.get('start_date') and payload.get('end_date'):
+        start_date, end_date = payload['start_date'], payload['end_date']
+    else:
+        try:
+            start_date, end_date = report_period(financial_report_id)
+        except ValueError as e:
+            raise JobSkipped(str(e))
+
+    upload_fields = {
+        'file': None,
+        'start_date': start_date,
+        'end_date': end_date,
+        'user_id': payload.get('user_id'),
+        'financial_report_id': financial_report_id,
+        'data_fingerprint': report['fingerprint'] if report else '',
+    }
+    progress = JobProgress(job)
+    try:
+        step = time.monotonic()
+        results = generate_tft_and_sheets_from_database(
+            financial_report_id, start_date, end_date, progress=progress
+        )
+        timings['generate'] = round(time.monotonic() - step, 3)
+
+        progress('persist')
+        step = time.monotonic()
+        balance_upload, _, _ = persist_generation_results(results, **upload_fields)
+        timings['persist'] = round(time.monotonic() - step, 3)
+    except Exception as e:
+        if job.attempts >= job.max_attempts:
+            # Dernière tentative : l'échec apparaît dans l'historique
+            try:
+                persist_generation_error(e, **upload_fields)
+            except Exception as record_error:
+                logger.error(f"Impossible d'enregistrer l'échec du job {job.pk}: {record_error}")
+        raise
+    return balance_upload
+
+
+def run_job(job):
+    """Exécute un job réservé et enregistre son issue (succès, nouvelle tentative ou échec)"""
+    started = time.monotonic()
+    timings = {'wait': round((job.started_at - job.created_at).total_seconds(), 3)}
+    update_fields = ['status', 'finished_at', 'timings', 'last_error', 'locked_by', 'locked_at']
+
+    try:
+        job.balance_upload = execute_report_job(job, timings)
+        job.status = JOB_SUCCEEDED
+        job.last_error = None
+        job.progress = dict(job.progress or {}, stage='done', label=PROGRESS_LABELS['done'],
+                            updated_at=timezone.now().isoformat())
+        update_fields += ['balance_upload', 'progress']
+    except JobSkipped as e:
+        job.status = JOB_SKIPPED
+        job.last_error = str(e)
+    except Exception as e:
+        logger.error(f"Job {job.pk} ({job.financial_report_id}) tentative {job.attempts}/{job.max_attempts}: {e}")
+        job.last_error = str(e)
+        if job.attempts < job.max_attempts:
+            delay = getattr(settings, 'JOB_RETRY_BACKOFF_SECONDS', 30) * 2 ** (job.attempts - 1)
+            job.status = JOB_QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            update_fields.append('run_after')
+        else:
+            job.status = JOB_FAILED
+
+    timings['total'] = round(time.monotonic() - started, 3)
+    job.timings = timings
+    job.finished_at = timezone.now() if job.status != JOB_QUEUED else None
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=update_fields)
+    logger.info(f"Job {job.pk} ({job.financial_report_id}): {job.status} en {timings['total']}s")
+    return job
+
+
+def work(worker_id, poll_interval=5, stop_event=None, max_jobs=None, exit_when_idle=False, max_priority=None):
+    """
+    Boucle d'un worker : réserve et exécute les jobs jusqu'à `stop_event`.
+
+    - `exit_when_idle` : s'arrête dès que la file est vide (vidage ponctuel)
+    - `max_jobs` : s'arrête après ce nombre de jobs
+    - `max_priority` : files servies par le worker (toutes par défaut)
+
+    Retourne le nombre de jobs exécutés.
+    """
+    processed = 0
+    while stop_event is None or not stop_event.is_set():
+        # Recycle les connexions expirées ou cassées (CONN_MAX_AGE / CONN_HEALTH_CHECKS)
+        close_old_connections()
+        job = claim_job(worker_id, max_priority=max_priority)
+        if job is None:
+            if exit_when_idle:
+                break
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+
+        run_job(job)
+        processed += 1
+        if max_jobs and processed >= max_jobs:
+            break
+    close_old_connections()
+    return processed
+
+
+def pin_recent_results(**filters):
+    """
+    Épingle la lecture sur le primaire si un job correspondant à `filters` s'est terminé
+    depuis moins de REPLICA_PIN_SECONDS : le worker a écrit les résultats hors de la
+    requête du client (pas de cookie d'épinglage) et le réplica peut ne pas les avoir reçus
+    """
+    if replica_alias() is None:
+        return
+    since = timezone.now() - timedelta(seconds=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+    if ProcessingJob.objects.using(PRIMARY_ALIAS).filter(finished_at__gte=since, **filters).exists():
+        pin_to_primary()
+
+
+def job_status(job):
+    """Représentation API d'un job : état, étape en cours, durées et liens vers les résultats"""
+    result = None
+    if job.balance_upload_id:
+        # Le contenu binaire des fichiers n'est pas chargé
+        files = job.balance_upload.generated_files.values('id', 'file_type', 'group_name')
+        result = {
+            'balance_upload_id': job.balance_upload_id,
+            'status': job.balance_upload.status,
+            'generated_files': [
+                dict(f, download_url=f'/api/reports/download-generated/{f["id"]}/') for f in files
+            ],
+        }
+    return {
+        'id': job.id,
+        'financial_report_id': job.financial_report_id,
+        'status': job.status,
+        'priority': PRIORITY_NAMES.get(job.priority, job.priority),
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress': job.progress or None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'next_attempt_at': job.run_after if job.status == JOB_QUEUED else None,
+        'timings': job.timings,
+        'error': job.last_error,
+        'result': result,
+    }
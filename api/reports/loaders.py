@@ -0,0 +1,692 @@
+"""
+Chargement des balances (CSV) dans la table AccountData
+
+Le fichier est lu par blocs (`chunk_size` lignes) avec des types déclarés ; la conversion
+et la validation sont vectorisées sur chaque bloc et les lignes invalides sont écrites
+dans un fichier de rejets avec leur motif. Un id répété, dans le même bloc ou d'un bloc à
+l'autre, est rejeté ('id en double') : seule sa première occurrence valide est chargée.
+
+Deux modes d'écriture :
+- `copy` (PostgreSQL) : chaque bloc validé est transmis via COPY FROM STDIN dans une
+  table de staging temporaire, puis fusionné dans account_data (suppression et
+  remplacement par financial_report_id) dans la même transaction.
+- `orm` : `bulk_create` par lots (SQLite et autres bases).
+
+En stratégie `upsert`, seules les lignes dont l'empreinte de contenu (`row_hash`) a changé
+sont écrites et un résumé des changements (comptes et préfixes touchés) est retourné.
+
+Un répertoire ou un motif glob peut être chargé en parallèle (un processus et une
+transaction par fichier) avec reprise sur fichier de checkpoint.
+
+Les suppressions (remplacement, purge) passent par `delete_report_rows` : DELETE SQL par
+lots, sans signal post_delete par ligne, et une seule mise à jour des traitements.
+"""
+
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+
+from .catalog import refresh_report_catalog, set_processing_status
+from .changes import CHANGE_DELETE, record_report_changes
+from .models import AccountData, BalanceUpload
+from .processes import close_connections_for_children, init_child_process
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['id', 'account_number', 'balance', 'total_debit', 'total_credit', 'created_at']
+OPTIONAL_COLUMNS = ['account_label', 'account_class', 'entries_count', 'financial_report_id', 'account_lookup_key']
+ACCOUNT_DATA_COLUMNS = [
+    'id', 'account_number', 'account_label', 'account_class', 'balance', 'total_debit',
+    'total_credit', 'entries_count', 'created_at', 'financial_report_id', 'account_lookup_key',
+    'row_hash',
+]
+# Colonnes couvertes par l'empreinte de contenu (toutes sauf la clé et l'empreinte)
+HASHED_COLUMNS = ACCOUNT_DATA_COLUMNS[1:-1]
+TEXT_COLUMNS = {
+    'id': 36,
+    'account_number': 20,
+    'account_label': 200,
+    'account_class': 10,
+    'financial_report_id': 36,
+    'account_lookup_key': 20,
+}
+AMOUNT_COLUMNS = ['balance', 'total_debit', 'total_credit']
+# DecimalField(max_digits=15, decimal_places=2)
+MAX_AMOUNT = 10 ** 13
+
+# Toutes les colonnes sont lues en texte puis converties de manière vectorisée
+CSV_DTYPES = {column: 'string' for column in ACCOUNT_DATA_COLUMNS}
+CSV_NA_VALUES = ['', 'NULL', 'null', 'NaN', 'nan']
+
+STAGING_TABLE = 'account_data_staging'
+LOAD_MODES = ('auto', 'copy', 'orm')
+# replace : suppression et remplacement par financial_report_id
+# upsert : insertion / mise à jour / suppression des seules lignes modifiées (clé id + empreinte)
+LOAD_STRATEGIES = ('replace', 'upsert')
+DEFAULT_CHUNK_SIZE = 50000
+# Lignes supprimées par instruction DELETE (purge / remplacement d'un rapport)
+DEFAULT_DELETE_BATCH_SIZE = 10000
+
+
+class LoadError(Exception):
+    """Erreur bloquante lors du chargement d'un fichier de balance"""
+
+
+def read_csv_header(csv_file_path):
+    with open(csv_file_path, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+
+def check_columns(columns):
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise LoadError(f"Colonnes manquantes: {missing_columns}")
+
+
+def resolve_mode(mode):
+    """Choisit le mode effectif : COPY uniquement sur PostgreSQL"""
+    if mode not in LOAD_MODES:
+        raise LoadError(f"Mode de chargement inconnu: {mode}")
+    if mode == 'auto':
+        return 'copy' if connection.vendor == 'postgresql' else 'orm'
+    if mode == 'copy' and connection.vendor != 'postgresql':
+        logger.warning("COPY indisponible sur %s, repli sur bulk_create", connection.vendor)
+        return 'orm'
+    return mode
+
+
+def iter_csv_chunks(csv_file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lit le CSV par blocs avec des types déclarés (mémoire bornée par bloc)"""
+    return pd.read_csv(
+        csv_file_path,
+        dtype=CSV_DTYPES,
+        na_values=CSV_NA_VALUES,
+        keep_default_na=False,
+        chunksize=chunk_size,
+    )
+
+
+def _add_reason(reasons, mask, message):
+    if isinstance(mask, pd.Series):
+        mask = mask.fillna(False)
+    mask = np.asarray(mask, dtype=bool)
+    if mask.any():
+        reasons[mask] = reasons[mask] + f'{message}; '
+
+
+def normalize_chunk(chunk):
+    """
+    Convertit et valide un bloc de manière vectorisée.
+
+    Retourne (valid, rejects) : `valid` a exactement les colonnes ACCOUNT_DATA_COLUMNS,
+    `rejects` liste les lignes invalides (numéro de ligne du fichier, id, motif).
+    """
+    frame = pd.DataFrame(index=chunk.index)
+    reasons = np.full(len(chunk), '', dtype=object)
+
+    for column, max_length in TEXT_COLUMNS.items():
+        if column in chunk.columns:
+            values = chunk[column].astype('string').str.strip()
+        else:
+            values = pd.Series(pd.NA, index=chunk.index, dtype='string')
+        if column in REQUIRED_COLUMNS:
+            _add_reason(reasons, values.isna(), f'{column} manquant')
+        _add_reason(reasons, values.str.len().fillna(0) > max_length, f'{column} > {max_length} caractères')
+        frame[column] = values
+
+    for column in AMOUNT_COLUMNS:
+        raw = chunk[column]
+        amounts = pd.to_numeric(raw.str.replace(',', '.', regex=False), errors='coerce')
+        _add_reason(reasons, raw.isna(), f'{column} manquant')
+        _add_reason(reasons, raw.notna() & amounts.isna(), f'{column} non numérique')
+        _add_reason(reasons, amounts.abs() >= MAX_AMOUNT, f'{column} hors limites')
+        frame[column] = amounts.round(2)
+
+    if 'entries_count' in chunk.columns:
+        raw = chunk['entries_count']
+        counts = pd.to_numeric(raw, errors='coerce')
+        _add_reason(reasons, raw.notna() & (counts.isna() | (counts % 1 != 0)), 'entries_count non entier')
+        frame['entries_count'] = counts.fillna(0)
+    else:
+        frame['entries_count'] = 0
+
+    created_at = pd.to_datetime(chunk['created_at'], utc=True, errors='coerce', format='ISO8601')
+    _add_reason(reasons, chunk['created_at'].isna(), 'created_at manquant')
+    _add_reason(reasons, chunk['created_at'].notna() & created_at.isna(), 'created_at invalide')
+    frame['created_at'] = created_at
+
+    _add_reason(reasons, frame['id'].duplicated(keep='first') & frame['id'].notna(), 'id en double')
+
+    invalid = reasons != ''
+    rejects = pd.DataFrame({
+        # Ligne 1 = en-tête
+        'line': chunk.index[invalid] + 2,
+        'id': frame['id'][invalid].to_numpy(),
+        'reason': pd.Series(reasons[invalid], dtype='string').str.rstrip('; ').to_numpy(),
+    })
+
+    valid = frame[~invalid].copy()
+    valid['entries_count'] = valid['entries_count'].astype('int64')
+    for column in ('account_label', 'account_class', 'financial_report_id'):
+        valid[column] = valid[column].fillna('')
+    valid['row_hash'] = compute_row_hashes(valid)
+    return valid[ACCOUNT_DATA_COLUMNS], rejects
+
+
+def compute_row_hashes(frame):
+    """Empreinte (16 caractères hexadécimaux) du contenu de chaque ligne, hors id"""
+    if frame.empty:
+        return pd.Series([], index=frame.index, dtype='string')
+    canonical = None
+    for column in HASHED_COLUMNS:
+        values = frame[column]
+        if column == 'created_at':
+            values = values.dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+        elif column in AMOUNT_COLUMNS:
+            values = values.astype('Float64').round(2).astype('string')
+        values = values.astype('string').fillna('')
+        canonical = values if canonical is None else canonical + '\x1f' + values
+    hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    return pd.Series(hashes, index=frame.index).map('{:016x}'.format)
+
+
+def account_data_row_hash(instance):
+    """Empreinte d'une ligne AccountData enregistrée par l'ORM (mêmes conversions qu'un chargement)"""
+    frame = pd.DataFrame([{column: getattr(instance, column) for column in HASHED_COLUMNS}])
+    frame['created_at'] = pd.to_datetime(frame['created_at'], utc=True, format='ISO8601')
+    for column in AMOUNT_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column].astype('string').str.replace(',', '.', regex=False))
+    frame['entries_count'] = pd.to_numeric(frame['entries_count']).astype('int64')
+    return compute_row_hashes(frame).iloc[0]
+
+
+def account_prefixes(account_numbers):
+    """Préfixes de 3 chiffres (0000279-01 -> 279), selon la normalisation du générateur TFT"""
+    accounts = pd.Series(list(account_numbers), dtype='string')
+    dashed = accounts.str.contains('-', regex=False)
+    cleaned = accounts.where(~dashed, accounts.str.split('-').str[0].str.lstrip('0'))
+    return sorted(set(cleaned.str[:3].dropna()) - {''})
+
+
+def change_summary(inserted, updated, deleted, unchanged, accounts):
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': deleted,
+        'unchanged': unchanged,
+        'accounts': sorted(accounts),
+        'prefixes': account_prefixes(accounts),
+    }
+
+
+class RejectsWriter:
+    """Écrit les lignes rejetées dans un CSV, créé seulement au premier rejet"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._header_written = False
+
+    def write(self, rejects):
+        if rejects.empty:
+            return
+        rejects.to_csv(self.path, mode='a' if self._header_written else 'w',
+                       header=not self._header_written, index=False)
+        self._header_written = True
+        self.count += len(rejects)
+
+
+def default_rejects_path(csv_file_path):
+    return f'{csv_file_path}.rejects.csv'
+
+
+def load_account_data_csv(csv_file_path, mode='auto', batch_size=1000,
+                          chunk_size=DEFAULT_CHUNK_SIZE, rejects_path=None, strategy='replace'):
+    """
+    Charge un fichier CSV dans AccountData.
+
+    - strategy='replace' : remplace les données existantes des financial_report_id du fichier
+    - strategy='upsert' : n'écrit que les lignes modifiées ; le résumé contient alors
+      'changes' = {'inserted', 'updated', 'deleted', 'unchanged', 'accounts', 'prefixes'}
+
+    Retourne un résumé : {'mode', 'strategy', 'rows', 'errors', 'financial_report_ids', 'rejects_path'}.
+    """
+    if strategy not in LOAD_STRATEGIES:
+        raise LoadError(f"Stratégie de chargement inconnue: {strategy}")
+    header = read_csv_header(csv_file_path)
+    check_columns(header)
+
+    mode = resolve_mode(mode)
+    rejects = RejectsWriter(rejects_path or default_rejects_path(csv_file_path))
+    chunks = iter_csv_chunks(csv_file_path, chunk_size)
+    # Le journal des changements (lu par les moniteurs) est écrit dans la transaction du
+    # chargement : validé avec les données, ou annulé avec elles
+    with transaction.atomic():
+        if mode == 'copy':
+            summary = _load_with_copy(chunks, rejects, strategy)
+        else:
+            summary = _load_with_orm(chunks, rejects, batch_size, strategy)
+        record_report_changes(summary['financial_report_ids'])
+    refresh_report_catalog(summary['financial_report_ids'])
+    summary['strategy'] = strategy
+    summary['errors'] = rejects.count
+    summary['rejects_path'] = rejects.path if rejects.count else None
+    return summary
+
+
+def _mark_reports_obsolete(financial_report_ids):
+    # Équivalent de handle_account_data_deletion, que les suppressions SQL ne déclenchent pas
+    BalanceUpload.objects.filter(
+        financial_report_id__in=financial_report_ids
+    ).update(status='obsolete')
+    set_processing_status(financial_report_ids, 'obsolete')
+
+
+def delete_report_rows(financial_report_ids, batch_size=DEFAULT_DELETE_BATCH_SIZE):
+    """
+    Supprime les lignes AccountData des rapports par lots SQL, sans le signal post_delete
+    (une requête COUNT par ligne), puis marque leurs traitements obsolètes en une requête.
+
+    Appelée dans une transaction, la suppression en fait partie (remplacement) ; sinon
+    chaque lot est validé séparément (purge). Retourne le nombre de lignes supprimées.
+    """
+    financial_report_ids = sorted({fid for fid in financial_report_ids if fid})
+    if not financial_report_ids:
+        return 0
+
+    qn = connection.ops.quote_name
+    table = qn(AccountData._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(financial_report_ids))
+    sql = (
+        f"DELETE FROM {table} WHERE {qn('id')} IN ("
+        f"SELECT {qn('id')} FROM {table} WHERE {qn('financial_report_id')} IN ({placeholders}) LIMIT %s)"
+    )
+
+    # Purge (lots validés séparément) : traitements et journal sont mis à jour avant le
+    # premier lot, une interruption laisse les rapports invalidés plutôt qu'à jour
+    purge = not connection.in_atomic_block
+    if purge and AccountData.objects.filter(financial_report_id__in=financial_report_ids).exists():
+        _mark_reports_obsolete(financial_report_ids)
+        record_report_changes(financial_report_ids, kind=CHANGE_DELETE)
+
+    deleted = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(sql, [*financial_report_ids, batch_size])
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+
+    if deleted:
+        if not purge:
+            _mark_reports_obsolete(financial_report_ids)
+            record_report_changes(financial_report_ids, kind=CHANGE_DELETE)
+        logger.info("Suppression de %s lignes AccountData (rapports %s)", deleted, financial_report_ids)
+    return deleted
+
+
+def _delete_rows_by_id(ids, batch_size):
+    # Suppression SQL par identifiants, sans signal post_delete par ligne
+    qn = connection.ops.quote_name
+    table = qn(AccountData._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE {qn('id')} IN ({placeholders})", batch)
+
+
+def _copy_from_stdin(cursor, sql, stream):
+    """COPY FROM STDIN compatible psycopg2 (copy_expert) et psycopg 3 (copy)"""
+    raw_cursor = cursor.cursor
+    # Le curseur brut ne convertit pas les erreurs du pilote (IntegrityError Django, etc.)
+    with connection.wrap_database_errors:
+        if hasattr(raw_cursor, 'copy_expert'):
+            raw_cursor.copy_expert(sql, stream)
+            return
+        with raw_cursor.copy(sql) as copy:
+            while True:
+                data = stream.read(1024 * 1024)
+                if not data:
+                    break
+                copy.write(data)
+
+
+def split_seen_ids(valid, seen_ids):
+    """
+    Sépare les lignes dont l'id figure dans un bloc précédent : la première occurrence
+    est conservée, comme pour les doublons d'un même bloc. Retourne (valid, rejets).
+    """
+    repeated = valid['id'].isin(seen_ids)
+    duplicates = pd.DataFrame({
+        'line': valid.index[repeated] + 2,
+        'id': valid['id'][repeated].to_numpy(),
+        'reason': 'id en double',
+    })
+    valid = valid[~repeated]
+    seen_ids.update(valid['id'])
+    return valid, duplicates
+
+
+def _reject_staged_duplicates(cursor, staging, rejects):
+    """Retire du staging les id déjà présents à une ligne antérieure du fichier (rejets)"""
+    qn = connection.ops.quote_name
+    cursor.execute(
+        f"DELETE FROM {staging} s USING ("
+        f"SELECT {qn('id')}, MIN({qn('source_line')}) AS first_line FROM {staging} "
+        f"GROUP BY {qn('id')} HAVING COUNT(*) > 1) d "
+        f"WHERE s.{qn('id')} = d.{qn('id')} AND s.{qn('source_line')} > d.first_line "
+        f"RETURNING s.{qn('source_line')}, s.{qn('id')}"
+    )
+    duplicates = sorted(cursor.fetchall())
+    if duplicates:
+        rejects.write(pd.DataFrame({
+            'line': [line for line, _ in duplicates],
+            'id': [row_id for _, row_id in duplicates],
+            'reason': 'id en double',
+        }))
+
+
+def frame_to_copy_buffer(frame):
+    """Sérialise un bloc validé au format CSV attendu par COPY (NULL = \\N)"""
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False, na_rep='\\N', float_format='%.2f',
+                 date_format='%Y-%m-%d %H:%M:%S.%f%z')
+    buffer.seek(0)
+    return buffer
+
+
+def _load_with_copy(chunks, rejects, strategy='replace'):
+    qn = connection.ops.quote_name
+    staging = qn(STAGING_TABLE)
+    target = qn(AccountData._meta.db_table)
+    columns = ', '.join(qn(name) for name in ACCOUNT_DATA_COLUMNS)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # source_line : ligne du fichier, pour écarter les id répétés d'un bloc à l'autre
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging} (LIKE {target} INCLUDING DEFAULTS, "
+            f"{qn('source_line')} bigint) ON COMMIT DROP"
+        )
+        for chunk in chunks:
+            valid, chunk_rejects = normalize_chunk(chunk)
+            rejects.write(chunk_rejects)
+            if not valid.empty:
+                _copy_from_stdin(
+                    cursor,
+                    f"COPY {staging} ({columns}, {qn('source_line')}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    frame_to_copy_buffer(valid.assign(source_line=valid.index + 2)),
+                )
+        _reject_staged_duplicates(cursor, staging, rejects)
+
+        cursor.execute(
+            f"SELECT DISTINCT {qn('financial_report_id')} FROM {staging} "
+            f"WHERE {qn('financial_report_id')} <> ''"
+        )
+        financial_report_ids = [row[0] for row in cursor.fetchall()]
+
+        if strategy == 'upsert':
+            changes = _merge_staging_upsert(cursor, staging, target, columns)
+            return {
+                'mode': 'copy',
+                'rows': changes['inserted'] + changes['updated'] + changes['unchanged'],
+                'financial_report_ids': financial_report_ids,
+                'changes': changes,
+            }
+
+        # Suppression et remplacement par financial_report_id (les lignes sans rapport ne
+        # remplacent rien, comme en mode orm)
+        delete_report_rows(financial_report_ids)
+
+        cursor.execute(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging}")
+        rows = cursor.rowcount
+
+    return {
+        'mode': 'copy',
+        'rows': rows,
+        'financial_report_ids': financial_report_ids,
+    }
+
+
+def _merge_staging_upsert(cursor, staging, target, columns):
+    """Fusionne le staging dans la table cible en n'écrivant que les lignes modifiées"""
+    qn = connection.ops.quote_name
+    cursor.execute(f"CREATE INDEX ON {staging} ({qn('id')})")
+    cursor.execute(f"ANALYZE {staging}")
+    cursor.execute(f"SELECT COUNT(*) FROM {staging}")
+    staged = cursor.fetchone()[0]
+
+    assignments = ', '.join(
+        f"{qn(name)} = EXCLUDED.{qn(name)}" for name in ACCOUNT_DATA_COLUMNS if name != 'id'
+    )
+    cursor.execute(
+        f"INSERT INTO {target} AS t ({columns}) SELECT {columns} FROM {staging} "
+        f"ON CONFLICT ({qn('id')}) DO UPDATE SET {assignments} "
+        f"WHERE t.{qn('row_hash')} IS DISTINCT FROM EXCLUDED.{qn('row_hash')} "
+        f"RETURNING t.{qn('account_number')}, (t.xmax = 0) AS inserted"
+    )
+    written = cursor.fetchall()
+    inserted = sum(1 for _, is_insert in written if is_insert)
+
+    # Lignes disparues du fichier pour les financial_report_id chargés
+    cursor.execute(
+        f"DELETE FROM {target} t WHERE t.{qn('financial_report_id')} IN "
+        f"(SELECT DISTINCT {qn('financial_report_id')} FROM {staging} WHERE {qn('financial_report_id')} <> '') "
+        f"AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.{qn('id')} = t.{qn('id')}) "
+        f"RETURNING t.{qn('account_number')}"
+    )
+    removed = cursor.fetchall()
+
+    accounts = {row[0] for row in written} | {row[0] for row in removed}
+    return change_summary(
+        inserted=inserted,
+        updated=len(written) - inserted,
+        deleted=len(removed),
+        unchanged=staged - len(written),
+        accounts=accounts,
+    )
+
+
+def _frame_to_instances(valid):
+    valid = valid.astype(object).where(valid.notna(), None)
+    valid['created_at'] = [ts.to_pydatetime() for ts in valid['created_at']]
+    return [AccountData(**record) for record in valid.to_dict('records')]
+
+
+def _load_with_orm(chunks, rejects, batch_size, strategy='replace'):
+    if strategy == 'upsert':
+        return _upsert_with_orm(chunks, rejects, batch_size)
+
+    financial_report_ids = []
+    seen_ids = set()
+    rows = 0
+
+    with transaction.atomic():
+        for chunk in chunks:
+            valid, chunk_rejects = normalize_chunk(chunk)
+            rejects.write(chunk_rejects)
+            valid, duplicates = split_seen_ids(valid, seen_ids)
+            rejects.write(duplicates)
+
+            # Nettoyer les données existantes des financial_report_id rencontrés pour la première fois
+            new_ids = [fid for fid in valid['financial_report_id'].unique()
+                       if fid and fid not in financial_report_ids]
+            if new_ids:
+                delete_report_rows(new_ids)
+                financial_report_ids.extend(new_ids)
+
+            AccountData.objects.bulk_create(_frame_to_instances(valid), batch_size=batch_size)
+            rows += len(valid)
+
+    return {
+        'mode': 'orm',
+        'rows': rows,
+        'financial_report_ids': financial_report_ids,
+    }
+
+
+def _upsert_with_orm(chunks, rejects, batch_size):
+    update_fields = [name for name in ACCOUNT_DATA_COLUMNS if name != 'id']
+    financial_report_ids = set()
+    seen_ids = set()
+    accounts = set()
+    inserted = updated = unchanged = deleted = 0
+
+    with transaction.atomic():
+        for chunk in chunks:
+            valid, chunk_rejects = normalize_chunk(chunk)
+            rejects.write(chunk_rejects)
+            valid, duplicates = split_seen_ids(valid, seen_ids)
+            rejects.write(duplicates)
+            financial_report_ids.update(fid for fid in valid['financial_report_id'].unique() if fid)
+
+            ids = valid['id'].tolist()
+            existing = {}
+            for start in range(0, len(ids), batch_size):
+                existing.update(
+                    AccountData.objects.filter(id__in=ids[start:start + batch_size]).values_list('id', 'row_hash')
+                )
+
+            known = valid['id'].isin(existing.keys())
+            changed = known & (valid['row_hash'] != valid['id'].map(existing))
+            to_create = valid[~known]
+            to_update = valid[changed]
+
+            AccountData.objects.bulk_create(_frame_to_instances(to_create), batch_size=batch_size)
+            AccountData.objects.bulk_update(_frame_to_instances(to_update), update_fields, batch_size=batch_size)
+
+            inserted += len(to_create)
+            updated += len(to_update)
+            unchanged += int((known & ~changed).sum())
+            accounts.update(to_create['account_number'])
+            accounts.update(to_update['account_number'])
+
+        # Lignes disparues du fichier pour les financial_report_id chargés
+        stale = [
+            (row_id, account_number)
+            for row_id, account_number in AccountData.objects.filter(
+                financial_report_id__in=financial_report_ids
+            ).values_list('id', 'account_number').iterator()
+            if row_id not in seen_ids
+        ]
+        stale_ids = [row_id for row_id, _ in stale]
+        _delete_rows_by_id(stale_ids, batch_size)
+        deleted = len(stale)
+        accounts.update(account_number for _, account_number in stale)
+
+    changes = change_summary(inserted, updated, deleted, unchanged, accounts)
+    return {
+        'mode': 'orm',
+        'rows': inserted + updated + unchanged,
+        'financial_report_ids': sorted(financial_report_ids),
+        'changes': changes,
+    }
+
+
+def expand_csv_sources(source):
+    """Liste triée des fichiers CSV désignés par un fichier, un répertoire ou un motif glob"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '*.csv')
+    else:
+        pattern = source
+    paths = [path for path in glob.glob(pattern) if os.path.isfile(path)]
+    if not paths and os.path.isfile(source):
+        paths = [source]
+    return sorted(path for path in paths if not path.endswith('.rejects.csv'))
+
+
+def file_signature(path):
+    """Identifie une version de fichier (chemin absolu, taille, date de modification)"""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class LoadCheckpoint:
+    """
+    Fichier de reprise (JSON lines) : une ligne par fichier chargé avec succès.
+    Un fichier modifié depuis (taille ou date) est rechargé.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    self.done.add((entry['path'], entry['size'], entry['mtime']))
+
+    def is_done(self, csv_file_path):
+        signature = file_signature(csv_file_path)
+        return (signature['path'], signature['size'], signature['mtime']) in self.done
+
+    def record(self, result):
+        if not self.path:
+            return
+        entry = dict(file_signature(result['path']), rows=result['rows'], elapsed=result['elapsed'])
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.done.add((entry['path'], entry['size'], entry['mtime']))
+
+
+def load_file_worker(csv_file_path, options):
+    """Charge un fichier (une transaction) et retourne son résumé avec le débit obtenu"""
+    started = time.monotonic()
+    try:
+        summary = load_account_data_csv(csv_file_path, **options)
+    except Exception as e:
+        return {'path': csv_file_path, 'error': str(e), 'rows': 0,
+                'elapsed': time.monotonic() - started}
+    finally:
+        connection.close()
+    elapsed = time.monotonic() - started
+    summary.update({
+        'path': csv_file_path,
+        'elapsed': elapsed,
+        'rows_per_second': summary['rows'] / elapsed if elapsed > 0 else float(summary['rows']),
+    })
+    return summary
+
+
+def load_account_data_files(paths, workers=4, checkpoint_path=None, on_result=None, **options):
+    """
+    Charge plusieurs fichiers en parallèle dans un pool de `workers` processus.
+
+    Chaque fichier est chargé dans sa propre transaction. Les fichiers déjà présents
+    dans le fichier de reprise sont ignorés ; chaque succès y est enregistré dès la
+    fin du fichier. `on_result(result)` est appelé au fil de l'eau.
+    """
+    if connection.vendor == 'sqlite':
+        # SQLite n'accepte qu'un écrivain à la fois
+        workers = 1
+
+    checkpoint = LoadCheckpoint(checkpoint_path)
+    pending = [path for path in paths if not checkpoint.is_done(path)]
+    skipped = len(paths) - len(pending)
+    results = []
+
+    close_connections_for_children()
+
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=init_child_process) as pool:
+        futures = [pool.submit(load_file_worker, path, options) for path in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            if 'error' not in result:
+                checkpoint.record(result)
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    return {'results': results, 'skipped': skipped}
@@ -0,0 +1,46 @@
+"""
+Commande Django affichant les statistiques de chargement AccountData
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.reports.stats import account_data_stats, processing_status
+
+
+class Command(BaseCommand):
+    help = 'Affiche les totaux, le nombre de comptes par financial_report_id et les exercices (une requête groupée)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report',
+            action='append',
+            dest='reports',
+            help='Limiter à un financial_report_id (répétable)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Sortie JSON'
+        )
+
+    def handle(self, *args, **options):
+        stats = account_data_stats(options['reports'])
+        status = processing_status(stats)
+
+        if options['json']:
+            self.stdout.write(json.dumps(dict(stats, **status), indent=2))
+            return
+
+        processed = set(status['processed'])
+        stale = set(status['stale'])
+        self.stdout.write(f'📊 Statistiques:')
+        self.stdout.write(f'   - Total enregistrements: {stats["total"]}')
+        self.stdout.write(f'   - Financial Report IDs: {len(stats["reports"])}')
+        for fid, report in stats['reports'].items():
+            marker = '✅' if fid in processed else '🔁' if fid in stale else '⏳'
+            self.stdout.write(
+                f'     {marker} {fid}: {report["count"]} enregistrements, exercices {report["years"]}'
+            )
+        self.stdout.write(f'   - Exercices disponibles: {stats["years"]}')
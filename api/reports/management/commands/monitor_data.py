@@ -3,13 +3,16 @@ Commande Django pour surveiller et traiter automatiquement les nouvelles donnée
 """
 
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 from django.utils import timezone
-from api.reports.models import AccountData, BalanceUpload
-from api.reports.signals import process_financial_report_async
+from api.reports.monitor_pool import ReportMonitor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Nom du moniteur : positions dans le journal (MonitorCursor) et nœuds (MonitorNode)
+MONITOR_NAME = 'monitor_data'
+
 class Command(BaseCommand):
     help = 'Surveille et traite automatiquement les nouvelles données AccountData'
 
@@ -31,116 +34,104 @@ class Command(BaseCommand):
             default=10,
             help='Nombre minimum de comptes requis pour traiter (défaut: 10)'
         )
+        parser.add_argument(
+            '--poll',
+            action='store_true',
+            help='Polling seul, sans LISTEN/NOTIFY PostgreSQL'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Nombre de rapports traités en parallèle, un processus chacun (défaut: 1)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=None,
+            help='Durée maximale du traitement d\'un rapport en secondes (défaut: aucune)'
+        )
+        parser.add_argument(
+            '--node',
+            default=None,
+            help='Nom de ce nœud pour la répartition des rapports entre moniteurs (défaut: nom d\'hôte)'
+        )
 
     def handle(self, *args, **options):
         interval = options['interval']
         run_once = options['once']
         min_accounts = options['min_accounts']
+        self.monitor = ReportMonitor(
+            MONITOR_NAME, min_accounts=min_accounts, workers=options['workers'], timeout=options['timeout'],
+            node=options['node'], log=self.write,
+        )
         
         self.stdout.write(
             self.style.SUCCESS(
                 f'🚀 Démarrage de la surveillance automatique des données\n'
                 f'   Intervalle: {interval} secondes\n'
                 f'   Mode: {"Une fois" if run_once else "Continu"}\n'
-                f'   Seuil minimum: {min_accounts} comptes'
+                f'   Seuil minimum: {min_accounts} comptes\n'
+                f'   Workers: {self.monitor.workers}\n'
+                f'   Nœud: {self.monitor.coordinator.node}'
             )
         )
+        self.monitor.handle_signals()
         
-        if run_once:
-            self.process_new_data(min_accounts)
-        else:
-            self.monitor_continuously(interval, min_accounts)
+        try:
+            if run_once:
+                self.process_new_data()
+            else:
+                self.monitor_continuously(interval, listen=not options['poll'])
+        finally:
+            self.monitor.leave()
+
+    def write(self, level, message):
+        """Messages du moniteur sur la sortie de la commande"""
+        if level >= logging.ERROR:
+            message = self.style.ERROR(message)
+        elif level >= logging.WARNING:
+            message = self.style.WARNING(message)
+        self.stdout.write(message)
 
-    def process_new_data(self, min_accounts):
+    def process_new_data(self):
         """Traite toutes les nouvelles données non traitées"""
         self.stdout.write('🔍 Recherche des nouvelles données...')
-        
-        # Récupérer tous les financial_report_id non traités
-        all_financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        processed_ids = BalanceUpload.objects.filter(
-            financial_report_id__isnull=False
-        ).values_list('financial_report_id', flat=True).distinct()
-        
-        unprocessed_ids = [fid for fid in all_financial_report_ids if fid and fid not in processed_ids]
-        
-        if not unprocessed_ids:
-            self.stdout.write(
-                self.style.WARNING('⚠️  Aucune nouvelle donnée à traiter')
-            )
+        summary = self.monitor.run_pass()
+        if not summary['pending']:
             return
         
-        self.stdout.write(f'📊 {len(unprocessed_ids)} financial_report_id(s) à traiter')
-        
-        success_count = 0
-        error_count = 0
-        
-        for financial_report_id in unprocessed_ids:
-            try:
-                # Vérifier le nombre de comptes
-                account_count = AccountData.objects.filter(financial_report_id=financial_report_id).count()
-                
-                if account_count < min_accounts:
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'⚠️  {financial_report_id}: {account_count} comptes (seuil: {min_accounts})'
-                        )
-                    )
-                    continue
-                
-                self.stdout.write(f'🔄 Traitement de {financial_report_id} ({account_count} comptes)...')
-                
-                # Traiter le financial_report_id
-                process_financial_report_async(financial_report_id)
-                success_count += 1
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'✅ {financial_report_id}: Traité avec succès')
-                )
-                
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'❌ {financial_report_id}: Erreur - {str(e)}')
-                )
-        
         # Résumé
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n📊 Résumé du traitement:\n'
-                f'   ✅ Succès: {success_count}\n'
-                f'   ❌ Erreurs: {error_count}\n'
-                f'   📈 Total: {len(unprocessed_ids)}'
+                f'   ✅ Succès: {summary["succeeded"]}\n'
+                f'   ❌ Erreurs: {summary["failed"]}\n'
+                f'   📈 Total: {len(summary["pending"])}'
             )
         )
 
-    def monitor_continuously(self, interval, min_accounts):
+    def monitor_continuously(self, interval, listen=True):
         """Surveille en continu les nouvelles données"""
-        import time
-        
+        listener = self.monitor.open_listener(listen)
         self.stdout.write('🔄 Surveillance continue activée...')
+        self.stdout.write(f'   Mode: {"Notifications PostgreSQL (LISTEN)" if listener else "Polling"}')
         self.stdout.write('   Appuyez sur Ctrl+C pour arrêter')
         
         try:
-            while True:
+            while not self.monitor.stop_requested:
+                # Recycle les connexions expirées ou cassées (CONN_MAX_AGE / CONN_HEALTH_CHECKS)
+                close_old_connections()
                 self.stdout.write(f'\n⏰ {timezone.now().strftime("%Y-%m-%d %H:%M:%S")} - Vérification...')
                 
-                # Compter les nouvelles données
-                all_financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-                processed_ids = BalanceUpload.objects.filter(
-                    financial_report_id__isnull=False
-                ).values_list('financial_report_id', flat=True).distinct()
-                
-                unprocessed_ids = [fid for fid in all_financial_report_ids if fid and fid not in processed_ids]
-                
-                if unprocessed_ids:
-                    self.stdout.write(f'📊 {len(unprocessed_ids)} nouvelle(s) donnée(s) détectée(s)')
-                    self.process_new_data(min_accounts)
-                else:
-                    self.stdout.write('✅ Aucune nouvelle donnée')
+                # Seuls les changements depuis le passage précédent sont lus
+                self.process_new_data()
                 
-                # Attendre l'intervalle suivant
-                self.stdout.write(f'⏳ Attente de {interval} secondes...')
-                time.sleep(interval)
+                # Attendre l'intervalle suivant (ou une notification de chargement)
+                close_old_connections()
+                self.monitor.wait_for_changes(listener, interval)
+            
+            self.stdout.write(self.style.SUCCESS('✅ Traitements en cours terminés, surveillance arrêtée'))
                 
         except KeyboardInterrupt:
             self.stdout.write(
@@ -150,3 +141,6 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'\n❌ Erreur lors de la surveillance: {str(e)}')
             )
+        finally:
+            if listener is not None:
+                listener.close()
@@ -0,0 +1,53 @@
+"""
+Commande Django supprimant les données AccountData d'un ou plusieurs rapports par lots
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reports.catalog import refresh_report_catalog, report_catalog
+from api.reports.loaders import DEFAULT_DELETE_BATCH_SIZE, delete_report_rows
+
+
+class Command(BaseCommand):
+    help = 'Supprime les lignes AccountData des financial_report_id donnés (DELETE par lots) et marque leurs traitements obsolètes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'financial_report_ids',
+            nargs='+',
+            help='financial_report_id à purger'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_DELETE_BATCH_SIZE,
+            help=f'Lignes supprimées par instruction DELETE (défaut: {DEFAULT_DELETE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Afficher les lignes concernées sans rien supprimer'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size doit être positif')
+
+        financial_report_ids = options['financial_report_ids']
+        reports = report_catalog(financial_report_ids)
+
+        self.stdout.write(f'🗑️  Purge de {len(financial_report_ids)} rapport(s):')
+        for fid in financial_report_ids:
+            report = reports.get(fid)
+            count = report['count'] if report else 0
+            marker = '📄' if count else '⚪'
+            self.stdout.write(f'   {marker} {fid}: {count} enregistrements')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'🔍 Simulation : {sum(report["count"] for report in reports.values())} enregistrement(s) seraient supprimés'))
+            return
+
+        # Hors transaction : chaque lot est validé séparément
+        deleted = delete_report_rows(financial_report_ids, batch_size=options['batch_size'])
+        refresh_report_catalog(financial_report_ids)
+        self.stdout.write(self.style.SUCCESS(f'✅ {deleted} enregistrement(s) supprimé(s)'))
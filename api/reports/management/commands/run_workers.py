@@ -0,0 +1,116 @@
+"""
+Commande Django exécutant la file d'attente des traitements (ProcessingJob) dans N processus
+
+Les premiers workers (JOB_INTERACTIVE_WORKERS ou --interactive-workers) ne servent que les
+demandes interactives ; les autres vident les files par ordre de priorité.
+"""
+
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.reports.jobs import PRIORITY_INTERACTIVE, work, worker_name
+from api.reports.processes import close_connections_for_children, run_child
+
+
+def _worker_process(index, options, stop_event, max_priority):
+    work(
+        worker_name(index),
+        poll_interval=options['poll_interval'],
+        stop_event=stop_event,
+        max_jobs=options['max_jobs'],
+        exit_when_idle=options['once'],
+        max_priority=max_priority,
+    )
+
+
+class Command(BaseCommand):
+    help = "Exécute les traitements en file d'attente (ProcessingJob) dans N processus workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Nombre de processus workers (défaut: 2)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='Attente en secondes quand la file est vide (défaut: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Vider la file puis s'arrêter"
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=None,
+            help='Nombre maximum de jobs par worker'
+        )
+        parser.add_argument(
+            '--interactive-workers',
+            type=int,
+            default=None,
+            help='Workers réservés aux demandes interactives (défaut: JOB_INTERACTIVE_WORKERS, '
+                 'au moins un worker sert toutes les files)'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        reserved = options['interactive_workers']
+        if reserved is None:
+            reserved = getattr(settings, 'JOB_INTERACTIVE_WORKERS', 1)
+        reserved = max(0, min(reserved, workers - 1))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'🚀 Démarrage des workers de traitement\n'
+                f'   Workers: {workers} (dont {reserved} réservé(s) aux demandes interactives)\n'
+                f'   Mode: {"Vidage de la file" if options["once"] else "Continu"}'
+            )
+        )
+
+        stop_event = multiprocessing.Event()
+
+        def request_stop(signum, frame):
+            if not stop_event.is_set():
+                self.stdout.write(self.style.WARNING('\n🛑 Arrêt demandé : fin des jobs en cours...'))
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        if workers == 1:
+            processed = work(
+                worker_name(),
+                poll_interval=options['poll_interval'],
+                stop_event=stop_event,
+                max_jobs=options['max_jobs'],
+                exit_when_idle=options['once'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'✅ {processed} job(s) exécuté(s)'))
+            return
+
+        close_connections_for_children()
+        processes = [
+            # Ctrl+C est géré par le processus principal : le worker termine son job en cours
+            multiprocessing.Process(
+                target=run_child,
+                args=(f'{__name__}._worker_process', index, options, stop_event,
+                      PRIORITY_INTERACTIVE if index < reserved else None),
+                kwargs={'ignore_signals': True},
+                daemon=False,
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.stdout.write(self.style.SUCCESS('✅ Workers arrêtés'))
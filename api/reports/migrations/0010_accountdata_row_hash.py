@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_accountdata_balanceupload_financial_report_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountdata',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0010_accountdata_row_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingReportTrigger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('financial_report_id', models.CharField(max_length=36, unique=True)),
+                ('first_change_at', models.DateTimeField()),
+                ('last_change_at', models.DateTimeField()),
+                ('due_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated manually
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0011_pendingreporttrigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('financial_report_id', models.CharField(db_index=True, max_length=36)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(default='queued', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('balance_upload', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='reports.balanceupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='reports_pro_status_b76a4c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+def skip_duplicate_active_jobs(apps, schema_editor):
+    """Garde le plus ancien job actif de chaque rapport avant de poser la contrainte"""
+    ProcessingJob = apps.get_model('reports', 'ProcessingJob')
+    seen = set()
+    active = ProcessingJob.objects.filter(status__in=['queued', 'running']).order_by('id')
+    for job in active.only('id', 'financial_report_id'):
+        if job.financial_report_id in seen:
+            ProcessingJob.objects.filter(pk=job.pk).update(
+                status='skipped', last_error='Doublon d\'un job actif (single-flight)'
+            )
+        seen.add(job.financial_report_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0013_processingjob_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(skip_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='processingjob',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(status__in=['queued', 'running']),
+                fields=('financial_report_id',),
+                name='unique_active_job_per_report',
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0015_accountdatachange_monitorcursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitorNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monitor', models.CharField(max_length=100)),
+                ('node', models.CharField(max_length=200)),
+                ('started_at', models.DateTimeField()),
+                ('heartbeat_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('monitor', 'node'), name='unique_monitor_node')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0016_monitornode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='processingjob',
+            index=models.Index(fields=['status', 'priority', 'run_after'], name='reports_pro_status_bd1701_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+def create_catalog_entries(apps, schema_editor):
+    # Entrées à agréger : le catalogue est calculé à la première lecture (voir catalog.py)
+    AccountData = apps.get_model('reports', 'AccountData')
+    ReportCatalog = apps.get_model('reports', 'ReportCatalog')
+    financial_report_ids = (
+        AccountData.objects.exclude(financial_report_id='')
+        .values_list('financial_report_id', flat=True).distinct().order_by()
+    )
+    ReportCatalog.objects.bulk_create(
+        [ReportCatalog(financial_report_id=fid) for fid in financial_report_ids],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0017_processingjob_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('financial_report_id', models.CharField(max_length=36, unique=True)),
+                ('row_count', models.IntegerField(default=0)),
+                ('years', models.JSONField(blank=True, default=list)),
+                ('first_created_at', models.DateTimeField(blank=True, null=True)),
+                ('last_created_at', models.DateTimeField(blank=True, null=True)),
+                ('fingerprint', models.CharField(blank=True, default='', max_length=32)),
+                ('processing_status', models.CharField(default='unprocessed', max_length=20)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('refreshed_version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated manually
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_generated_files(apps, schema_editor):
+    GeneratedFile = apps.get_model('reports', 'GeneratedFile')
+    pending = []
+    rows = GeneratedFile.objects.exclude(file_content=None).values_list('pk', 'file_content')
+    for pk, content in rows.iterator(chunk_size=100):
+        pending.append(GeneratedFile(pk=pk, content_hash=hashlib.sha256(bytes(content)).hexdigest()))
+        if len(pending) >= 100:
+            GeneratedFile.objects.bulk_update(pending, ['content_hash'])
+            pending = []
+    if pending:
+        GeneratedFile.objects.bulk_update(pending, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0018_reportcatalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedfile',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(hash_generated_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated manually
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fingerprint_existing_uploads(apps, schema_editor):
+    # Les traitements existants sont rattachés à l'empreinte actuelle de leur rapport
+    # (entrée du catalogue à jour) ; sans empreinte, ils restent considérés à jour
+    BalanceUpload = apps.get_model('reports', 'BalanceUpload')
+    ReportCatalog = apps.get_model('reports', 'ReportCatalog')
+    fingerprints = ReportCatalog.objects.filter(
+        financial_report_id=OuterRef('financial_report_id'), refreshed_version=F('version')
+    ).values('fingerprint')[:1]
+    BalanceUpload.objects.exclude(financial_report_id=None).exclude(financial_report_id='').update(
+        data_fingerprint=Coalesce(Subquery(fingerprints), Value(''))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0019_generatedfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceupload',
+            name='data_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(fingerprint_existing_uploads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0020_balanceupload_data_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='processingjob',
+            name='unique_active_job_per_report',
+        ),
+        migrations.AddConstraint(
+            model_name='processingjob',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(financial_report_id=''),
+                fields=('financial_report_id',),
+                name='unique_active_job_per_report',
+            ),
+        ),
+    ]
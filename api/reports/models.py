@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -16,6 +17,7 @@ class AccountData(models.Model):
     created_at = models.DateTimeField(db_index=True)
     financial_report_id = models.CharField(max_length=36, blank=True)
     account_lookup_key = models.CharField(max_length=20, blank=True, null=True)
+    row_hash = models.CharField(max_length=16, blank=True, default='')  # Empreinte du contenu (chargement incrémental)
     
     class Meta:
         db_table = 'account_data'
@@ -24,9 +26,35 @@ class AccountData(models.Model):
             models.Index(fields=['financial_report_id']),
         ]
     
+    def save(self, *args, **kwargs):
+        # Empreinte recalculée à chaque enregistrement (admin, ORM) : une ligne modifiée
+        # change l'empreinte du rapport dans le catalogue (voir loaders.compute_row_hashes)
+        from .loaders import account_data_row_hash
+
+        self.row_hash = account_data_row_hash(self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'row_hash'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.account_number} - {self.account_label}"
 
+class ReportCatalog(models.Model):
+    """Catalogue des rapports AccountData : une ligne par financial_report_id (voir catalog.py)"""
+    financial_report_id = models.CharField(max_length=36, unique=True)
+    row_count = models.IntegerField(default=0)
+    years = models.JSONField(default=list, blank=True)  # Exercices présents (année de created_at), triés
+    first_created_at = models.DateTimeField(null=True, blank=True)
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    fingerprint = models.CharField(max_length=32, blank=True, default='')  # Empreinte des lignes (id, row_hash)
+    processing_status = models.CharField(max_length=20, default='unprocessed')  # unprocessed, success, error, obsolete, stale
+    version = models.PositiveIntegerField(default=1)  # Incrémentée à chaque écriture du rapport
+    refreshed_version = models.PositiveIntegerField(default=0)  # Version agrégée dans le catalogue
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.financial_report_id} ({self.row_count} lignes)"
+
 class BalanceUpload(models.Model):
     file = models.FileField(upload_to='balances/', null=True, blank=True)  # Rendu optionnel
     start_date = models.DateField()
@@ -39,11 +67,93 @@ class BalanceUpload(models.Model):
     feuilles_maitresses_json = models.JSONField(blank=True, null=True)
     coherence_json = models.JSONField(blank=True, null=True)
     financial_report_id = models.CharField(max_length=36, blank=True, null=True)  # Pour lier aux données AccountData
+    data_fingerprint = models.CharField(max_length=32, blank=True, default='')  # Empreinte des données traitées (catalogue)
 
 class GeneratedFile(models.Model):
     balance_upload = models.ForeignKey(BalanceUpload, related_name='generated_files', on_delete=models.CASCADE)
     file_type = models.CharField(max_length=30)  # 'TFT' ou 'feuille_maitresse'
     group_name = models.CharField(max_length=50, blank=True)  # ex: 'clients', 'fournisseurs', etc.
     file_content = models.BinaryField(blank=True, null=True)  # Stockage exclusif en base
+    content_hash = models.CharField(max_length=64, blank=True, default='')  # SHA-256 du contenu (ETag)
     comment = models.TextField(blank=True, null=True, help_text="Commentaire pour cette feuille maîtresse")
     created_at = models.DateTimeField(auto_now_add=True)
+
+class PendingReportTrigger(models.Model):
+    """Déclencheur de traitement en attente : un rapport est traité une fois `due_at` dépassé sans nouvelle écriture"""
+    financial_report_id = models.CharField(max_length=36, unique=True)
+    first_change_at = models.DateTimeField()
+    last_change_at = models.DateTimeField()
+    due_at = models.DateTimeField(db_index=True)  # last_change_at + PROCESSING_QUIET_SECONDS
+
+    def __str__(self):
+        return f"{self.financial_report_id} (échéance {self.due_at})"
+
+class AccountDataChange(models.Model):
+    """Journal append-only des écritures AccountData : une entrée par rapport et par chargement"""
+    financial_report_id = models.CharField(max_length=36)
+    kind = models.CharField(max_length=10, default='write')  # write, delete
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.financial_report_id}"
+
+class MonitorCursor(models.Model):
+    """Position (dernier AccountDataChange lu) de chaque moniteur dans le journal"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+class MonitorNode(models.Model):
+    """Moniteur en service sur un nœud : battement de cœur pour la répartition des rapports"""
+    monitor = models.CharField(max_length=100)
+    node = models.CharField(max_length=200)
+    started_at = models.DateTimeField()
+    heartbeat_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['monitor', 'node'], name='unique_monitor_node'),
+        ]
+
+    def __str__(self):
+        return f"{self.monitor}@{self.node} ({self.heartbeat_at})"
+
+class ProcessingJob(models.Model):
+    """File d'attente durable des traitements de rapports (consommée par `manage.py run_workers`)"""
+    financial_report_id = models.CharField(max_length=36, db_index=True)
+    payload = models.JSONField(default=dict, blank=True)  # start_date, end_date, user_id, min_accounts, source
+    status = models.CharField(max_length=20, default='queued')  # queued, running, succeeded, failed
+    priority = models.PositiveSmallIntegerField(default=1)  # 0 interactive, 1 scheduled, 2 backfill
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Prochaine tentative (backoff)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    timings = models.JSONField(default=dict, blank=True)  # Durées (s) : attente, génération, enregistrement, total
+    progress = models.JSONField(default=dict, blank=True)  # Étape en cours : load, aggregate, render k/10, persist
+    last_error = models.TextField(blank=True, null=True)
+    balance_upload = models.ForeignKey(BalanceUpload, related_name='jobs', on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'priority', 'run_after']),
+        ]
+        constraints = [
+            # Single-flight : au plus un job en file ou en cours par rapport (les jobs
+            # d'un fichier uploadé, sans rapport, ne sont pas concernés)
+            models.UniqueConstraint(
+                fields=['financial_report_id'],
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(financial_report_id=''),
+                name='unique_active_job_per_report',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.financial_report_id} ({self.status})"
@@ -0,0 +1,307 @@
+"""
+Pool borné de processus pour le traitement des rapports par les moniteurs
+
+Chaque rapport est traité dans son propre processus fils (au plus `workers` à la fois) :
+un traitement qui dépasse `timeout` secondes est interrompu sans bloquer les autres, et
+son job est libéré (voir `jobs.release_worker_jobs`) : sans tentative restante, l'échec
+est historisé comme celui d'une génération (BalanceUpload en erreur). Tant qu'une demande interactive est
+active, la part réservée (JOB_INTERACTIVE_WORKERS) n'est pas utilisée.
+
+`process_reports` ne lance un rapport que lorsqu'une place se libère (back-pressure) et
+s'arrête proprement sur demande : plus aucun rapport n'est lancé, ceux en cours sont
+terminés.
+
+`ReportMonitor` regroupe le passage commun aux moniteurs (`manage.py monitor_data`,
+`monitor_realtime_data.py`) : déclencheurs échus, journal des changements, part du nœud,
+traitement et arrêt progressif. Chaque moniteur garde sa boucle et sa sortie.
+"""
+
+import logging
+import multiprocessing
+import signal
+import socket
+import sys
+import time
+from multiprocessing.connection import wait
+
+from django.db import connections
+
+from .catalog import report_catalog
+from .changes import advance_watermark, prune_report_changes, unprocessed_changed_reports
+from .coordination import MonitorCoordinator
+from .jobs import JOB_FAILED, JOB_SKIPPED, JOB_SUCCEEDED, background_capacity, release_worker_jobs
+from .notifications import ReportChangeListener, notifications_available
+from .processes import close_connections_for_children, run_child
+from .signals import process_due_reports, process_financial_report_async
+from .triggers import seconds_until_next_due
+
+logger = logging.getLogger(__name__)
+
+# Issue d'un traitement, transmise par le code de sortie du processus fils
+OUTCOME_SUCCEEDED = JOB_SUCCEEDED
+OUTCOME_SKIPPED = JOB_SKIPPED
+OUTCOME_FAILED = JOB_FAILED
+OUTCOME_TIMEOUT = 'timeout'
+EXIT_CODES = {0: OUTCOME_SUCCEEDED, 3: OUTCOME_SKIPPED}
+
+
+def _report_process(financial_report_id, min_accounts):
+    job = process_financial_report_async(financial_report_id, min_accounts=min_accounts)
+    connections.close_all()
+    if job is None or job.status == JOB_SUCCEEDED:
+        sys.exit(0)
+    sys.exit(3 if job.status == JOB_SKIPPED else 1)
+
+
+class ReportProcessPool:
+    """Au plus `workers` rapports traités en parallèle, chacun dans un processus fils"""
+
+    def __init__(self, workers, min_accounts=10, timeout=None):
+        self.workers = max(1, workers)
+        self.min_accounts = min_accounts
+        self.timeout = timeout
+        self.running = {}  # financial_report_id -> (processus, début)
+
+    @property
+    def free_slots(self):
+        # La part réservée reste libre tant qu'une demande interactive est active
+        return background_capacity(self.workers) - len(self.running)
+
+    def submit(self, financial_report_id):
+        close_connections_for_children()
+        # L'arrêt est piloté par le processus principal : le rapport en cours est terminé
+        process = multiprocessing.Process(
+            target=run_child,
+            args=(f'{__name__}._report_process', financial_report_id, self.min_accounts),
+            kwargs={'ignore_signals': True},
+            daemon=False,
+        )
+        process.start()
+        self.running[financial_report_id] = (process, time.monotonic())
+
+    def _wait_timeout(self, timeout):
+        if self.timeout is None:
+            return timeout
+        now = time.monotonic()
+        remaining = min(started + self.timeout - now for _, started in self.running.values())
+        remaining = max(remaining, 0)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _release(self, process, error):
+        # Le job réservé par le processus interrompu ne doit pas rester « running » ; sans
+        # tentative restante, son échec est historisé (BalanceUpload en erreur)
+        release_worker_jobs(f'{socket.gethostname()}:{process.pid}:0', error)
+
+    def collect(self, timeout=None):
+        """
+        Attend qu'au moins un traitement se termine (ou `timeout`) et retourne les
+        traitements terminés : [(financial_report_id, issue, durée en secondes)].
+        """
+        if not self.running:
+            return []
+        wait([process.sentinel for process, _ in self.running.values()], self._wait_timeout(timeout))
+
+        finished = []
+        now = time.monotonic()
+        for financial_report_id, (process, started) in list(self.running.items()):
+            elapsed = now - started
+            if process.exitcode is not None:
+                process.join()
+                outcome = EXIT_CODES.get(process.exitcode, OUTCOME_FAILED)
+                if process.exitcode not in EXIT_CODES:
+                    # Sans effet si le job a enregistré son issue ; sinon (signal, mémoire,
+                    # exception hors job), il est libéré
+                    self._release(process, f"Traitement interrompu (code de sortie {process.exitcode})")
+            elif self.timeout is not None and elapsed >= self.timeout:
+                # SIGTERM est ignoré par le fils (arrêt progressif) : arrêt forcé
+                process.kill()
+                process.join()
+                self._release(process, f"Délai de traitement dépassé ({self.timeout}s)")
+                logger.warning("%s: délai de %ss dépassé, traitement interrompu", financial_report_id, self.timeout)
+                outcome = OUTCOME_TIMEOUT
+            else:
+                continue
+            del self.running[financial_report_id]
+            finished.append((financial_report_id, outcome, round(elapsed, 3)))
+        return finished
+
+    def drain(self):
+        """Attend la fin de tous les traitements en cours"""
+        while self.running:
+            yield from self.collect()
+
+
+def process_reports(financial_report_ids, pool, on_result=None, should_stop=None, on_start=None):
+    """
+    Traite les rapports via le pool en gardant au plus `pool.workers` traitements en cours.
+
+    `on_start(financial_report_id)` est appelé au lancement d'un traitement et
+    `on_result(financial_report_id, issue, durée)` à chaque fin de traitement.
+    Si `should_stop()` devient vrai, plus aucun rapport n'est lancé et ceux en cours sont
+    terminés. Retourne True si tous les rapports ont été lancés.
+    """
+    def report(results):
+        for result in results:
+            if on_result:
+                on_result(*result)
+
+    completed = True
+    for financial_report_id in financial_report_ids:
+        while pool.free_slots <= 0:
+            report(pool.collect())
+        if should_stop and should_stop():
+            completed = False
+            break
+        if on_start:
+            on_start(financial_report_id)
+        pool.submit(financial_report_id)
+    report(pool.drain())
+    return completed
+
+
+class ReportMonitor:
+    """
+    Passage de surveillance d'un moniteur `name` sur ce nœud
+
+    Les messages sont transmis à `log(niveau, message)` (niveaux du module logging).
+    """
+
+    def __init__(self, name, min_accounts=10, workers=1, timeout=None, node=None, log=None):
+        self.min_accounts = min_accounts
+        self.workers = max(1, workers)
+        self.log = log or logger.log
+        # Répartition des rapports entre les moniteurs de plusieurs nœuds
+        self.coordinator = MonitorCoordinator(name, node=node)
+        # Pool de processus (délai par rapport) dès qu'il y a plusieurs workers ou un délai
+        self.pool = None
+        if self.workers > 1 or timeout:
+            self.pool = ReportProcessPool(self.workers, min_accounts=min_accounts, timeout=timeout)
+        self.stop_requested = False
+        self.draining = False
+
+    def handle_signals(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+    def request_stop(self, signum=None, frame=None):
+        """SIGTERM / Ctrl+C : plus aucun rapport lancé, ceux en cours sont terminés"""
+        if not self.stop_requested:
+            self.log(logging.WARNING, '🛑 Arrêt demandé : fin des traitements en cours...')
+        self.stop_requested = True
+        # Hors traitement, l'arrêt est immédiat
+        if not self.draining:
+            raise KeyboardInterrupt
+
+    def open_listener(self, listen=True):
+        """LISTEN/NOTIFY sur PostgreSQL, polling sinon (None)"""
+        return ReportChangeListener() if listen and notifications_available() else None
+
+    def wait_for_changes(self, listener, interval):
+        """Attend `interval` secondes, ou une notification de chargement si `listener`"""
+        if listener is None:
+            self.log(logging.INFO, f'⏳ Attente de {interval} secondes...')
+            time.sleep(interval)
+            return
+        # Réveil au plus tard à l'échéance du prochain déclencheur (période de calme)
+        timeout = interval
+        next_due = seconds_until_next_due()
+        if next_due is not None:
+            timeout = min(timeout, max(next_due, 1))
+        financial_report_ids = listener.wait(timeout)
+        if financial_report_ids:
+            self.log(logging.INFO, f'🔔 Changements notifiés: {", ".join(sorted(financial_report_ids))}')
+
+    def run_pass(self):
+        """
+        Met en file les rapports dont la période de calme est écoulée, puis traite les
+        rapports modifiés depuis le passage précédent (part de ce nœud).
+
+        Retourne {'queued', 'pending', 'succeeded', 'failed'} : rapports mis en file,
+        rapports à traiter lus dans le journal, nombres de traitements réussis et en échec.
+        """
+        # Rapports dont les écritures ont cessé depuis PROCESSING_QUIET_SECONDS
+        queued = process_due_reports(min_accounts=self.min_accounts)
+        for financial_report_id in queued:
+            self.log(logging.INFO, f'⏱️  {financial_report_id}: mis en file après la période de calme')
+
+        # Rapports modifiés depuis le dernier passage (journal des changements) et non traités,
+        # limités à la part de ce nœud quand plusieurs moniteurs tournent
+        self.coordinator.refresh()
+        pending, position = unprocessed_changed_reports(
+            self.coordinator.cursor_name, after=self.coordinator.read_position()
+        )
+        pending = [fid for fid in pending if self.coordinator.owns(fid)]
+        prune_report_changes()
+        summary = {'queued': queued, 'pending': pending, 'succeeded': 0, 'failed': 0}
+
+        if not pending:
+            advance_watermark(self.coordinator.cursor_name, position)
+            self.log(logging.INFO, '✅ Aucune nouvelle donnée à traiter')
+            return summary
+
+        self.log(logging.INFO, f'📊 {len(pending)} financial_report_id(s) à traiter')
+
+        # Nombre de comptes de tous les rapports lu dans le catalogue
+        reports = report_catalog(pending)
+        eligible_ids = []
+        for financial_report_id in pending:
+            account_count = reports.get(financial_report_id, {}).get('count', 0)
+            if account_count < self.min_accounts:
+                self.log(
+                    logging.WARNING, f'⚠️  {financial_report_id}: {account_count} comptes (seuil: {self.min_accounts})'
+                )
+                continue
+            eligible_ids.append(financial_report_id)
+
+        def on_start(financial_report_id):
+            account_count = reports[financial_report_id]['count']
+            self.log(logging.INFO, f'🔄 Traitement de {financial_report_id} ({account_count} comptes)...')
+
+        def on_result(financial_report_id, outcome, elapsed):
+            # Un long passage ne doit pas faire passer ce nœud pour arrêté
+            self.coordinator.heartbeat()
+            if outcome in (OUTCOME_SUCCEEDED, OUTCOME_SKIPPED):
+                summary['succeeded'] += 1
+                self.log(logging.INFO, f'✅ {financial_report_id}: Traité avec succès ({elapsed}s)')
+            else:
+                summary['failed'] += 1
+                label = 'Délai dépassé' if outcome == OUTCOME_TIMEOUT else 'Échec du traitement'
+                self.log(logging.ERROR, f'❌ {financial_report_id}: {label} ({elapsed}s)')
+
+        self.draining = True
+        try:
+            if self.pool is not None:
+                # Au plus `workers` rapports en cours ; un rapport n'est lancé que sur une place libre
+                completed = process_reports(
+                    eligible_ids, self.pool, on_result=on_result, on_start=on_start,
+                    should_stop=lambda: self.stop_requested,
+                )
+            else:
+                completed = self._process_in_process(eligible_ids, on_start, on_result, summary)
+        finally:
+            self.draining = False
+
+        # Arrêt en cours de passage : les rapports non lancés seront relus au démarrage suivant
+        if completed:
+            advance_watermark(self.coordinator.cursor_name, position)
+        return summary
+
+    def _process_in_process(self, financial_report_ids, on_start, on_result, summary):
+        """Traitement un à un dans ce processus (un worker, sans délai) ; False si interrompu"""
+        for financial_report_id in financial_report_ids:
+            if self.stop_requested:
+                return False
+            try:
+                on_start(financial_report_id)
+                started = time.monotonic()
+                job = process_financial_report_async(financial_report_id, min_accounts=self.min_accounts)
+                outcome = job.status if job is not None else OUTCOME_SUCCEEDED
+                on_result(financial_report_id, outcome, round(time.monotonic() - started, 3))
+            except Exception as e:
+                summary['failed'] += 1
+                self.log(logging.ERROR, f'❌ {financial_report_id}: Erreur - {str(e)}')
+        return True
+
+    def leave(self):
+        # Les autres nœuds reprennent immédiatement la part de celui-ci
+        self.coordinator.leave()
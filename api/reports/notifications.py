@@ -0,0 +1,109 @@
+"""
+Notifications PostgreSQL (LISTEN / NOTIFY) des changements AccountData
+
+Chaque entrée d'écriture du journal des changements émet un NOTIFY sur CHANNEL avec le
+financial_report_id. NOTIFY est transactionnel : la notification n'est délivrée qu'à la
+validation du chargement.
+
+Les moniteurs écoutent CHANNEL sur une connexion dédiée et réagissent immédiatement au
+lieu d'attendre la fin de leur intervalle. Sur SQLite, ou tant que la connexion d'écoute
+est coupée, ils reviennent au polling (attente de l'intervalle) ; le journal des
+changements reste la source de vérité, une notification perdue est rattrapée au passage
+suivant.
+"""
+
+import logging
+import select
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'account_data_changes'
+
+
+def notifications_available(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'postgresql'
+
+
+def notify_report_changes(financial_report_ids):
+    """NOTIFY CHANNEL pour chaque financial_report_id (une requête, PostgreSQL uniquement)"""
+    financial_report_ids = sorted({fid for fid in financial_report_ids if fid})
+    if not financial_report_ids or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, fid) FROM unnest(%s::text[]) AS fid",
+            [CHANNEL, financial_report_ids],
+        )
+
+
+class ReportChangeListener:
+    """
+    Écoute CHANNEL sur une connexion dédiée, hors du pool et des transactions Django.
+
+    `wait(timeout)` retourne les financial_report_id notifiés ; si la connexion est
+    indisponible, il attend simplement `timeout` secondes (polling) et retente la
+    connexion à l'appel suivant.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.wrapper = connections[using]
+        self.connection = None
+
+    @property
+    def listening(self):
+        return self.connection is not None
+
+    def connect(self):
+        if self.connection is not None:
+            return True
+        try:
+            raw = self.wrapper.Database.connect(**self.wrapper.get_connection_params())
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+        except self.wrapper.Database.Error as e:
+            logger.warning("LISTEN %s indisponible, polling: %s", CHANNEL, e)
+            return False
+        self.connection = raw
+        logger.info("Écoute des notifications sur %s", CHANNEL)
+        return True
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except self.wrapper.Database.Error:
+                pass
+            self.connection = None
+
+    def _read_notifies(self, timeout):
+        raw = self.connection
+        if hasattr(raw, 'poll'):
+            # psycopg2
+            if select.select([raw], [], [], timeout) != ([], [], []):
+                raw.poll()
+            notifies = list(raw.notifies)
+            raw.notifies.clear()
+            return [notify.payload for notify in notifies]
+        # psycopg 3 (>= 3.2)
+        payloads = [notify.payload for notify in raw.notifies(timeout=timeout, stop_after=1)]
+        if payloads:
+            payloads.extend(notify.payload for notify in raw.notifies(timeout=0))
+        return payloads
+
+    def wait(self, timeout):
+        """Attend au plus `timeout` secondes une notification ; retourne les financial_report_id reçus"""
+        if not self.connect():
+            time.sleep(timeout)
+            return set()
+        try:
+            return set(self._read_notifies(timeout))
+        except (self.wrapper.Database.Error, OSError, ValueError) as e:
+            # Connexion coupée : polling jusqu'à la reconnexion
+            logger.warning("Écoute de %s interrompue, polling: %s", CHANNEL, e)
+            self.close()
+            time.sleep(timeout)
+            return set()
@@ -0,0 +1,98 @@
+"""
+Persistance des résultats de génération (TFT, feuilles maîtresses, cohérence)
+
+Partagée par les vues et les signaux : le BalanceUpload, les fichiers générés et les
+résultats JSON sont écrits dans une seule transaction avec `bulk_create`, de sorte
+qu'un échec ne laisse jamais de traitement avec des fichiers partiels.
+
+Le moteur produit des valeurs JSON natives : les résultats sont encodés une seule fois,
+par le JSONField, sans parcours préalable de l'arbre.
+"""
+
+from django.db import transaction
+
+from .caching import content_hash
+from .catalog import set_result_status
+from .models import BalanceUpload, GeneratedFile
+
+
+def build_generated_files(balance_upload, tft_content, sheets_contents):
+    """Prépare (sans les enregistrer) les GeneratedFile d'un traitement, avec leur empreinte (ETag)"""
+    files = [
+        GeneratedFile(
+            balance_upload=balance_upload,
+            file_type='TFT',
+            file_content=tft_content,
+            content_hash=content_hash(tft_content) if tft_content else ''
+        )
+    ]
+    for group_name, sheet_content in sheets_contents.items():
+        files.append(
+            GeneratedFile(
+                balance_upload=balance_upload,
+                file_type='feuille_maitresse',
+                group_name=group_name,
+                file_content=sheet_content,
+                content_hash=content_hash(sheet_content) if sheet_content else ''
+            )
+        )
+    return files
+
+
+def persist_generation_results(results, balance_upload=None, **upload_fields):
+    """
+    Enregistre atomiquement le résultat de `generate_tft_and_sheets*`.
+
+    - `results` : tuple (tft_content, sheets_contents, tft_data, sheets_data, coherence)
+    - `balance_upload` : BalanceUpload existant à compléter (upload de fichier),
+      sinon un BalanceUpload est créé avec `upload_fields`
+
+    Retourne (balance_upload, tft_data, sheets_data).
+    """
+    tft_content, sheets_contents, tft_data, sheets_data, coherence = results
+
+    with transaction.atomic():
+        if balance_upload is None:
+            balance_upload = BalanceUpload.objects.create(
+                status='success',
+                tft_json=tft_data,
+                feuilles_maitresses_json=sheets_data,
+                coherence_json=coherence,
+                **upload_fields
+            )
+        else:
+            balance_upload.status = 'success'
+            balance_upload.error_message = None
+            balance_upload.tft_json = tft_data
+            balance_upload.feuilles_maitresses_json = sheets_data
+            balance_upload.coherence_json = coherence
+            balance_upload.save(update_fields=[
+                'status', 'error_message', 'tft_json', 'feuilles_maitresses_json', 'coherence_json'
+            ])
+        GeneratedFile.objects.bulk_create(
+            build_generated_files(balance_upload, tft_content, sheets_contents)
+        )
+        if balance_upload.financial_report_id:
+            # Régénération : les traitements précédents du rapport sont remplacés
+            BalanceUpload.objects.filter(
+                financial_report_id=balance_upload.financial_report_id, status='success'
+            ).exclude(pk=balance_upload.pk).update(status='obsolete')
+        set_result_status(balance_upload.financial_report_id, 'success', balance_upload.data_fingerprint)
+
+    return balance_upload, tft_data, sheets_data
+
+
+def persist_generation_error(error, balance_upload=None, **upload_fields):
+    """Enregistre l'échec d'un traitement (un seul INSERT ou UPDATE, plus le catalogue)"""
+    if balance_upload is None:
+        balance_upload = BalanceUpload.objects.create(
+            status='error',
+            error_message=str(error),
+            **upload_fields
+        )
+    else:
+        balance_upload.status = 'error'
+        balance_upload.error_message = str(error)
+        balance_upload.save(update_fields=['status', 'error_message'])
+    set_result_status(balance_upload.financial_report_id, 'error', balance_upload.data_fingerprint)
+    return balance_upload
@@ -0,0 +1,69 @@
+"""
+Processus fils des traitements (run_workers, chargement parallèle, pool des moniteurs)
+
+Un processus fils ne réutilise aucune connexion du parent : avant d'en lancer, le parent
+ferme ses connexions et ses pools (`close_connections_for_children`), et chaque fils
+initialise Django puis repart de pools vides (`init_child_process`).
+
+Ce module n'importe aucun modèle : en mode spawn, il est chargé dans le fils avant
+`django.setup()`. `run_child` sert de point d'entrée aux `multiprocessing.Process` : la
+fonction cible (dont le module importe les modèles) n'est importée qu'après
+l'initialisation.
+"""
+
+import importlib
+import signal
+
+# Connexions et pools hérités du parent (fork) : gardés en vie sans être fermés, leur
+# fermeture terminerait aussi les connexions du parent
+_inherited = []
+
+
+def _connection_pools(conn):
+    # Pools psycopg (OPTIONS['pool']) : attribut de classe des DatabaseWrapper PostgreSQL
+    return getattr(type(conn), '_connection_pools', None)
+
+
+def close_connections_for_children():
+    """Ferme les connexions et les pools du processus courant avant de lancer des fils"""
+    from django.db import connections
+
+    connections.close_all()
+    for conn in connections.all(initialized_only=True):
+        pools = _connection_pools(conn)
+        if pools and conn.alias in pools:
+            conn.close_pool()
+
+
+def init_child_process(ignore_signals=False):
+    """
+    Initialise un processus fils : Django (mode spawn), connexions et pools hérités
+    abandonnés et, avec `ignore_signals`, SIGINT / SIGTERM ignorés (l'arrêt est piloté
+    par le parent).
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from django.db import connections
+
+    for conn in connections.all():
+        if conn.connection is not None:
+            _inherited.append(conn.connection)
+            conn.connection = None
+        pools = _connection_pools(conn)
+        if pools and conn.alias in pools:
+            _inherited.append(pools.pop(conn.alias))
+
+    if ignore_signals:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def run_child(target, *args, ignore_signals=False):
+    """Point d'entrée d'un processus fils : initialisation puis appel de `target` ('module.fonction')"""
+    init_child_process(ignore_signals=ignore_signals)
+    module_name, _, name = target.rpartition('.')
+    return getattr(importlib.import_module(module_name), name)(*args)
@@ -0,0 +1,208 @@
+"""
+Résultats JSON des traitements (tft_json, feuilles_maitresses_json, coherence_json) servis pré-encodés
+
+Les résultats sont encodés une seule fois, à l'enregistrement. À la lecture, le texte JSON
+stocké est lu tel quel (CAST en texte : jsonb::text sur PostgreSQL) et inséré dans la
+réponse sans être décodé en objets Python ni ré-sérialisé par DRF.
+
+`conditional_json_response` ajoute un ETag fort (empreinte du corps) : un client qui
+présente la version courante reçoit un 304 sans corps.
+
+`tft_rubric` et `sheet_page` extraient une rubrique du TFT ou une page d'un onglet de
+feuille maîtresse. Sur PostgreSQL, l'extraction est faite en base (opérateur jsonb `#>`,
+`jsonb_path_query_array` pour la page) : seule la partie demandée est lue. Sur les autres
+bases, le document est lu puis découpé en Python.
+"""
+
+import json
+import math
+import re
+import uuid
+
+from django.db import connections
+from django.db.models import Case, F, Func, IntegerField, JSONField, TextField, Value, When
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .caching import content_hash, not_modified, set_validators
+from .models import BalanceUpload
+
+# Clé de la réponse -> champ de BalanceUpload
+RESULT_FIELDS = {
+    'tft_json': 'tft_json',
+    'feuilles_maitresses_json': 'feuilles_maitresses_json',
+    'coherence': 'coherence_json',
+}
+
+# Onglets (listes de lignes) d'une feuille maîtresse
+SHEET_TABS = ('comparatif', 'exercice_n', 'exercice_n1')
+
+
+class ResultNotFound(Exception):
+    """Traitement, résultat ou partie de résultat absent"""
+
+
+class RawJSON:
+    """Texte JSON déjà encodé, inséré tel quel par `encode_json`"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text if text is not None else 'null'
+
+
+def encode_json(payload):
+    """Encode `payload` comme le rendu JSON de DRF ; chaque RawJSON est inséré sans réencodage"""
+    marker = uuid.uuid4().hex
+    fragments = []
+
+    class Encoder(JSONEncoder):
+        def default(self, obj):
+            if isinstance(obj, RawJSON):
+                fragments.append(obj.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return super().default(obj)
+
+    text = json.dumps(payload, cls=Encoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    if not fragments:
+        return text
+    parts = re.split(f'"{marker}:(\\d+)"', text)
+    parts[1::2] = [fragments[int(index)] for index in parts[1::2]]
+    return ''.join(parts)
+
+
+def json_response(payload, status=200):
+    """Réponse JSON encodée en une passe (hors rendu DRF)"""
+    return HttpResponse(encode_json(payload).encode('utf-8'), content_type='application/json', status=status)
+
+
+def conditional_json_response(request, payload, last_modified=None):
+    """
+    Réponse JSON avec ETag (SHA-256 du corps) et Last-Modified facultatif ; 304 si le
+    client détient déjà cette version.
+    """
+    body = encode_json(payload).encode('utf-8')
+    etag = content_hash(body)
+    cached = not_modified(request, etag=etag, last_modified=last_modified)
+    if cached is not None:
+        return cached
+    response = HttpResponse(body, content_type='application/json')
+    return set_validators(response, etag=etag, last_modified=last_modified)
+
+
+def with_raw_results(queryset):
+    """Lit les résultats JSON de BalanceUpload sous forme de texte, sans charger les champs décodés"""
+    return queryset.defer(*RESULT_FIELDS.values()).annotate(**{
+        f'{field}_text': Cast(field, output_field=TextField()) for field in RESULT_FIELDS.values()
+    })
+
+
+def raw_results(upload):
+    """Résultats d'un BalanceUpload lu via `with_raw_results` : {'tft_json', 'feuilles_maitresses_json', 'coherence'}"""
+    return {key: RawJSON(getattr(upload, f'{field}_text')) for key, field in RESULT_FIELDS.items()}
+
+
+def _json_path(field, *keys):
+    """Valeur jsonb de `field` au chemin `keys` (opérateur #>, clés passées en paramètre)"""
+    return Func(F(field), Value(list(keys)), arg_joiner=' #> ', template='(%(expressions)s)', output_field=JSONField())
+
+
+def _json_type(expression):
+    """Type jsonb de la valeur (object, array, string...), NULL si absente"""
+    return Func(expression, function='jsonb_typeof', output_field=TextField())
+
+
+def _json_text(expression):
+    return Cast(expression, output_field=TextField())
+
+
+def _upload_results(upload_id):
+    uploads = BalanceUpload.objects.filter(pk=upload_id)
+    return uploads, connections[uploads.db].vendor == 'postgresql'
+
+
+def _get(queryset):
+    try:
+        return queryset.get()
+    except BalanceUpload.DoesNotExist:
+        raise ResultNotFound('Traitement non trouvé')
+
+
+def tft_rubric(upload_id, ref):
+    """Rubrique `ref` du TFT d'un traitement : {'balance_upload_id', 'ref', 'rubrique'}"""
+    uploads, in_database = _upload_results(upload_id)
+    if in_database:
+        available, text = _get(uploads.annotate(
+            available=_json_type(F('tft_json')),
+            rubric=_json_text(_json_path('tft_json', ref)),
+        ).values_list('available', 'rubric'))
+        rubric = RawJSON(text) if text is not None else None
+    else:
+        tft = _get(uploads.values_list('tft_json', flat=True))
+        available, rubric = tft is not None, (tft or {}).get(ref)
+    if not available:
+        raise ResultNotFound('Résultats non disponibles pour ce traitement')
+    if rubric is None:
+        raise ResultNotFound(f'Rubrique {ref} non trouvée')
+    return {'balance_upload_id': upload_id, 'ref': ref, 'rubrique': rubric}
+
+
+def sheet_page(upload_id, group, tab, page, page_size):
+    """
+    Page `page` (à partir de 1) de l'onglet `tab` de la feuille maîtresse `group` :
+    {'balance_upload_id', 'group', 'tab', 'exercices', 'has_two_exercices', 'count',
+    'page', 'page_size', 'num_pages', 'rows'}
+    """
+    uploads, in_database = _upload_results(upload_id)
+    start = (page - 1) * page_size
+    if in_database:
+        field = 'feuilles_maitresses_json'
+        lines = _json_path(field, group, tab)
+        row = _get(uploads.annotate(
+            available=_json_type(F(field)),
+            sheet=_json_type(_json_path(field, group)),
+            tab_type=_json_type(lines),
+            exercices=_json_text(_json_path(field, group, 'exercices')),
+            has_two_exercices=_json_text(_json_path(field, group, 'has_two_exercices')),
+        ).annotate(
+            # jsonb_array_length échoue sur une valeur qui n'est pas un tableau
+            count=Case(
+                When(tab_type='array', then=Func(lines, function='jsonb_array_length')), output_field=IntegerField(),
+            ),
+            rows=_json_text(Func(
+                lines, Value(f'$[{start} to {start + page_size - 1}]'),
+                template='jsonb_path_query_array(%(expressions)s::jsonpath)', output_field=JSONField(),
+            )),
+        ).values('available', 'sheet', 'count', 'exercices', 'has_two_exercices', 'rows'))
+        available, found = row['available'], row['sheet'] == 'object'
+        count, rows = row['count'], RawJSON(row['rows'])
+        exercices, has_two_exercices = RawJSON(row['exercices']), RawJSON(row['has_two_exercices'])
+    else:
+        sheets = _get(uploads.values_list('feuilles_maitresses_json', flat=True))
+        available, sheet = sheets is not None, (sheets or {}).get(group)
+        found = isinstance(sheet, dict)
+        sheet = sheet if found else {}
+        lines = sheet.get(tab)
+        count = len(lines) if isinstance(lines, list) else None
+        rows = lines[start:start + page_size] if count is not None else None
+        exercices, has_two_exercices = sheet.get('exercices'), sheet.get('has_two_exercices')
+    if not available:
+        raise ResultNotFound('Résultats non disponibles pour ce traitement')
+    if not found:
+        raise ResultNotFound(f'Feuille maîtresse {group} non trouvée')
+    if count is None:
+        # Onglet absent, ou qui n'est pas une liste de lignes
+        raise ResultNotFound(f'Onglet {tab} absent de la feuille maîtresse {group}')
+    return {
+        'balance_upload_id': upload_id,
+        'group': group,
+        'tab': tab,
+        'exercices': exercices,
+        'has_two_exercices': has_two_exercices,
+        'count': count,
+        'page': page,
+        'page_size': page_size,
+        'num_pages': max(1, math.ceil(count / page_size)),
+        'rows': rows,
+    }
@@ -0,0 +1,132 @@
+"""
+Routage des lectures vers un réplica PostgreSQL pour les endpoints en lecture seule
+
+Les lectures ne partent vers le réplica qu'à l'intérieur de `use_replica()` (ou d'une vue
+décorée par `read_from_replica`). Toute écriture effectuée pendant la requête, ou dans
+les REPLICA_PIN_SECONDS précédentes pour le même client, épingle les lectures sur le
+primaire afin de relire ses propres écritures (read-your-writes).
+"""
+
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY_ALIAS = 'default'
+PIN_COOKIE_NAME = 'db_primary_pin'
+
+_routing_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    """État de routage propre à une requête (ou à un bloc `use_replica`)"""
+
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_alias():
+    """Retourne l'alias du réplica s'il est configuré, sinon None"""
+    alias = getattr(settings, 'DB_REPLICA_ALIAS', 'replica')
+    return alias if alias in connections.settings else None
+
+
+def begin_routing(pinned=False):
+    """Démarre un nouvel état de routage et retourne le jeton de réinitialisation"""
+    return _routing_state.set(RoutingState(pinned=pinned))
+
+
+def end_routing(token):
+    _routing_state.reset(token)
+
+
+def current_routing():
+    return _routing_state.get()
+
+
+@contextmanager
+def use_replica():
+    """Autorise les lectures sur le réplica pour la durée du bloc"""
+    state = _routing_state.get()
+    token = None
+    if state is None:
+        token = begin_routing()
+        state = _routing_state.get()
+    previous = state.replica_reads
+    state.replica_reads = True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+        if token is not None:
+            end_routing(token)
+
+
+def pin_to_primary():
+    """Relit le primaire jusqu'à la fin de la requête (ou du bloc `use_replica`)"""
+    state = _routing_state.get()
+    if state is not None:
+        state.pinned = True
+
+
+def read_from_replica(func):
+    """Décorateur de méthode de vue : exécute la lecture sur le réplica"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    """Envoie les lectures autorisées vers le réplica, toutes les écritures vers le primaire"""
+
+    def db_for_read(self, model, **hints):
+        state = _routing_state.get()
+        if state is None or not state.replica_reads or state.pinned or state.wrote:
+            return PRIMARY_ALIAS
+        return replica_alias() or PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Le réplica est une copie du primaire : les relations entre alias sont valides
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Le réplica reçoit le schéma par réplication, jamais par migrate
+        return db != replica_alias()
+
+
+class ReplicaPinningMiddleware:
+    """
+    Isole l'état de routage par requête et épingle le client sur le primaire
+    pendant REPLICA_PIN_SECONDS après une écriture (cookie)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_routing(pinned=PIN_COOKIE_NAME in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if _routing_state.get().wrote and replica_alias():
+                response.set_cookie(
+                    PIN_COOKIE_NAME,
+                    '1',
+                    max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        finally:
+            end_routing(token)
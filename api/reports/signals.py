@@ -1,167 +1,190 @@
 """
 Signals Django pour le traitement automatique des données AccountData
+
+Les écritures (créations, modifications et suppressions) ne lancent pas le traitement
+directement : elles repoussent le déclencheur en attente du rapport (voir triggers.py). Le moniteur le consomme via
+`process_due_reports()` une fois le rapport resté calme PROCESSING_QUIET_SECONDS et met
+le traitement en file (jobs.py, exécuté par `manage.py run_workers`).
+
+Les écritures en masse s'exécutent dans `coalesce_processing()` : les signaux par ligne
+y sont suspendus et un seul déclencheur par financial_report_id est mis à jour.
+
+Chaque écriture est aussi inscrite au journal des changements (changes.py) lu par les
+moniteurs.
 """
 
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.db import transaction
-from django.utils import timezone
+from contextlib import contextmanager
+import contextvars
 import logging
-from .models import AccountData, BalanceUpload, GeneratedFile
-from .tft_generator import generate_tft_and_sheets_from_database
-from datetime import date
-import math
-import pandas as pd
-import numpy as np
+from .models import AccountData, BalanceUpload
+from .catalog import PENDING_STATUSES, report_catalog, set_processing_status
+from .triggers import touch_report_triggers, due_report_triggers, release_trigger
+from .changes import record_report_changes, CHANGE_DELETE
+from .jobs import enqueue_report_job, run_report_job_now, JOB_SUCCEEDED
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
+# Écritures regroupées du bloc coalesce_processing() en cours (None hors bloc)
+_coalesced_writes = contextvars.ContextVar('coalesced_account_data_writes', default=None)
+
+
+class CoalescedWrites:
+    """financial_report_id écrits (créations, modifications) / supprimés pendant un bloc coalesce_processing()"""
+
+    def __init__(self):
+        self.created = set()
+        self.deleted = set()
+
+
+@contextmanager
+def coalesce_processing():
+    """
+    Suspend les signaux par ligne d'AccountData pour la durée du bloc.
+
+    À la sortie sans erreur : les rapports vidés par des suppressions sont marqués
+    obsolètes en une requête, et les déclencheurs des autres financial_report_id écrits ou
+    supprimés sont repoussés en une requête. Les blocs imbriqués sont fusionnés dans le bloc
+    externe.
+    """
+    writes = _coalesced_writes.get()
+    if writes is not None:
+        yield writes
+        return
+
+    writes = CoalescedWrites()
+    token = _coalesced_writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _coalesced_writes.reset(token)
+
+    emptied = []
+    if writes.deleted:
+        record_report_changes(writes.deleted, kind=CHANGE_DELETE)
+        emptied = mark_emptied_reports_obsolete(writes.deleted)
+    schedule_processing((writes.created | writes.deleted) - set(emptied))
+
+
+def schedule_processing(financial_report_ids):
+    """Repousse le déclencheur de chaque financial_report_id (regroupé dans un bloc coalesce)"""
+    financial_report_ids = {fid for fid in financial_report_ids if fid}
+    writes = _coalesced_writes.get()
+    if writes is not None:
+        writes.created.update(financial_report_ids)
+        return
+    # Même transaction que les données : un rollback annule aussi le déclencheur
+    touch_report_triggers(financial_report_ids)
+    record_report_changes(financial_report_ids)
+
+
+def process_due_reports(limit=None, min_accounts=10):
+    """
+    Met en file le traitement des rapports dont la période de calme est écoulée.
+
+    Chaque déclencheur n'est consommé qu'une fois, même avec plusieurs moniteurs ;
+    retourne la liste des financial_report_id mis en file.
+    """
+    queued = []
+    for trigger in due_report_triggers(limit=limit):
+        if not release_trigger(trigger):
+            continue
+        # Déjà en file ou en cours : rattachement au job actif (single-flight)
+        enqueue_report_job(trigger.financial_report_id, min_accounts=min_accounts)
+        queued.append(trigger.financial_report_id)
+    return queued
+
+
+def mark_emptied_reports_obsolete(financial_report_ids):
+    """Marque obsolètes les traitements des rapports qui n'ont plus aucune donnée"""
+    financial_report_ids = {fid for fid in financial_report_ids if fid}
+    if not financial_report_ids:
+        return []
+    remaining = set(
+        AccountData.objects.filter(financial_report_id__in=financial_report_ids)
+        .values_list('financial_report_id', flat=True).distinct()
+    )
+    emptied = sorted(financial_report_ids - remaining)
+    if emptied:
+        logger.info(f"Aucune donnée restante pour financial_report_id: {', '.join(emptied)}")
+        BalanceUpload.objects.filter(financial_report_id__in=emptied).update(status='obsolete')
+        set_processing_status(emptied, 'obsolete')
+    return emptied
+
+
 @receiver(post_save, sender=AccountData)
 def auto_process_new_account_data(sender, instance, created, **kwargs):
     """
     Signal déclenché à chaque création/modification d'AccountData
     Traite automatiquement les nouvelles données si nécessaire
     """
+    writes = _coalesced_writes.get()
+    if writes is not None:
+        writes.created.add(instance.financial_report_id)
+        return
+
     if created:
         logger.info(f"Nouvelle donnée AccountData créée: {instance.account_number} - {instance.account_label}")
-        
-        # Traitement différé pour éviter les conflits
-        transaction.on_commit(lambda: process_financial_report_async(instance.financial_report_id))
     else:
         logger.info(f"Donnée AccountData modifiée: {instance.account_number}")
 
-def process_financial_report_async(financial_report_id):
+    # Traitement différé jusqu'à ce que les lignes du rapport cessent d'arriver ; une
+    # modification rend aussi le traitement existant périmé (empreinte du rapport changée)
+    schedule_processing([instance.financial_report_id])
+
+def process_financial_report_async(financial_report_id, min_accounts=10):
     """
-    Traite de manière asynchrone un financial_report_id
+    Traite un financial_report_id (moniteurs, traitement automatique)
+
+    Single-flight : si le rapport est déjà en file ou en cours de traitement, l'appel se
+    rattache au job existant au lieu de le générer une seconde fois.
+
+    Retourne le job exécuté, None si le rapport était déjà traité (et à jour) ou en cas
+    d'erreur.
     """
     if not financial_report_id:
         return
     
     try:
-        # Vérifier si le traitement existe déjà
-        existing_upload = BalanceUpload.objects.filter(
-            financial_report_id=financial_report_id
-        ).first()
-        
-        if existing_upload:
-            logger.info(f"Traitement déjà existant pour financial_report_id: {financial_report_id}")
+        # Données et traitement existant lus dans le catalogue (une requête indexée)
+        report = report_catalog([financial_report_id]).get(financial_report_id)
+        if report is None:
+            logger.info(f"Aucune donnée pour financial_report_id: {financial_report_id}")
             return
         
-        # Vérifier si on a suffisamment de données pour traiter
-        account_data = AccountData.objects.filter(financial_report_id=financial_report_id)
-        if account_data.count() < 10:  # Seuil minimum de données
-            logger.info(f"Données insuffisantes pour financial_report_id: {financial_report_id} ({account_data.count()} comptes)")
+        # Un traitement périmé (données modifiées depuis) est régénéré
+        if report['processing_status'] not in PENDING_STATUSES:
+            logger.info(f"Traitement déjà existant pour financial_report_id: {financial_report_id}")
             return
         
         logger.info(f"Début du traitement automatique pour financial_report_id: {financial_report_id}")
         
-        # Déterminer les dates automatiquement
-        exercices = set()
-        for data in account_data:
-            exercices.add(data.created_at.year)
-        
-        exercices = sorted(exercices)
+        # Seuil minimum de données et dates SYSCOHADA déterminées par le job
+        job = run_report_job_now(financial_report_id, min_accounts=min_accounts)
         
-        if len(exercices) >= 2:
-            n_1 = exercices[-2]
-            n = exercices[-1]
-            start_date = date(n_1, 1, 1)
-            end_date = date(n, 12, 31)
-        elif len(exercices) == 1:
-            n = exercices[0]
-            start_date = date(n, 1, 1)
-            end_date = date(n, 12, 31)
+        if job.status == JOB_SUCCEEDED:
+            logger.info(f"Traitement automatique réussi pour financial_report_id: {financial_report_id}")
         else:
-            logger.warning(f"Aucun exercice détecté pour financial_report_id: {financial_report_id}")
-            return
-        
-        # Créer le BalanceUpload
-        balance_upload = BalanceUpload.objects.create(
-            file=None,
-            start_date=start_date,
-            end_date=end_date,
-            user=None,  # Traitement automatique
-            status='processing',
-            financial_report_id=financial_report_id,
-            comment=f"Traitement automatique - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        
-        # Générer les rapports
-        tft_content, sheets_contents, tft_data, sheets_data, coherence = generate_tft_and_sheets_from_database(
-            financial_report_id, start_date, end_date
-        )
-        
-        # Enregistrer le fichier TFT
-        GeneratedFile.objects.create(
-            balance_upload=balance_upload,
-            file_type='TFT',
-            file_content=tft_content
-        )
-        
-        # Enregistrer les feuilles maîtresses
-        for group_name, sheet_content in sheets_contents.items():
-            GeneratedFile.objects.create(
-                balance_upload=balance_upload,
-                file_type='feuille_maitresse',
-                group_name=group_name,
-                file_content=sheet_content
-            )
-        
-        # Fonction de nettoyage des données
-        def sanitize(obj):
-            if isinstance(obj, dict):
-                return {k: sanitize(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [sanitize(v) for v in obj]
-            elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                return int(obj)
-            elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                if math.isnan(obj) or math.isinf(obj):
-                    return None
-                return float(obj)
-            elif isinstance(obj, float):
-                if math.isnan(obj) or math.isinf(obj):
-                    return None
-                return obj
-            elif isinstance(obj, pd.Timestamp):
-                return obj.isoformat()
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            else:
-                return obj
-        
-        # Mettre à jour le BalanceUpload avec les résultats
-        balance_upload.status = 'success'
-        balance_upload.tft_json = sanitize(tft_data)
-        balance_upload.feuilles_maitresses_json = sanitize(sheets_data)
-        balance_upload.coherence_json = coherence
-        balance_upload.save()
-        
-        logger.info(f"Traitement automatique réussi pour financial_report_id: {financial_report_id}")
+            logger.info(f"Traitement automatique {job.status} pour financial_report_id {financial_report_id}: {job.last_error}")
+        return job
         
     except Exception as e:
         logger.error(f"Erreur lors du traitement automatique pour financial_report_id {financial_report_id}: {str(e)}")
-        
-        # Marquer le traitement comme échoué
-        try:
-            balance_upload = BalanceUpload.objects.filter(
-                financial_report_id=financial_report_id,
-                status='processing'
-            ).first()
-            if balance_upload:
-                balance_upload.status = 'error'
-                balance_upload.error_message = str(e)
-                balance_upload.save()
-        except:
-            pass
 
 @receiver(post_delete, sender=AccountData)
 def handle_account_data_deletion(sender, instance, **kwargs):
     """
     Signal déclenché lors de la suppression d'AccountData
     """
+    writes = _coalesced_writes.get()
+    if writes is not None:
+        writes.deleted.add(instance.financial_report_id)
+        return
+
     logger.info(f"Donnée AccountData supprimée: {instance.account_number} - {instance.account_label}")
+    record_report_changes([instance.financial_report_id], kind=CHANGE_DELETE)
     
     # Vérifier si il reste des données pour ce financial_report_id
     remaining_data = AccountData.objects.filter(financial_report_id=instance.financial_report_id)
@@ -171,3 +194,7 @@ def handle_account_data_deletion(sender, instance, **kwargs):
         BalanceUpload.objects.filter(
             financial_report_id=instance.financial_report_id
         ).update(status='obsolete')
+        set_processing_status([instance.financial_report_id], 'obsolete')
+    else:
+        # Rapport modifié : régénéré une fois les suppressions terminées
+        schedule_processing([instance.financial_report_id])
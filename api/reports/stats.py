@@ -0,0 +1,91 @@
+"""
+Statistiques de chargement AccountData en une seule requête groupée
+
+GROUP BY financial_report_id, année(created_at) : les totaux, les comptes par rapport et
+les exercices disponibles sont dérivés du même résultat.
+"""
+
+from datetime import date
+
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+from .catalog import PENDING_STATUSES, STATUS_STALE, report_catalog
+from .models import AccountData
+
+
+def account_data_stats(financial_report_ids=None):
+    """
+    Retourne {'total', 'reports': {fid: {'count', 'years'}}, 'years'}.
+
+    Les lignes sans financial_report_id comptent dans le total mais pas dans `reports`.
+    """
+    queryset = AccountData.objects.all()
+    if financial_report_ids is not None:
+        queryset = queryset.filter(financial_report_id__in=financial_report_ids)
+
+    rows = (
+        queryset
+        .annotate(year=ExtractYear('created_at'))
+        .values('financial_report_id', 'year')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    total = 0
+    years = set()
+    reports = {}
+    for row in rows:
+        total += row['count']
+        if row['year'] is not None:
+            years.add(row['year'])
+        fid = row['financial_report_id']
+        if not fid:
+            continue
+        report = reports.setdefault(fid, {'count': 0, 'years': []})
+        report['count'] += row['count']
+        if row['year'] is not None:
+            report['years'].append(row['year'])
+
+    for report in reports.values():
+        report['years'].sort()
+
+    return {
+        'total': total,
+        'reports': dict(sorted(reports.items())),
+        'years': sorted(years),
+    }
+
+
+def processing_status(stats=None):
+    """
+    Croise les statistiques avec le statut des traitements (catalogue) : rapports traités,
+    à traiter (jamais traités ou périmés) et, parmi eux, périmés.
+    """
+    if stats is None:
+        stats = account_data_stats()
+    report_ids = list(stats['reports'])
+    statuses = {fid: report['processing_status'] for fid, report in report_catalog(report_ids).items()}
+    pending = [fid for fid in report_ids if statuses.get(fid) in PENDING_STATUSES or fid not in statuses]
+    return {
+        'total_financial_report_ids': len(report_ids),
+        'processed': [fid for fid in report_ids if fid not in pending],
+        'unprocessed': pending,
+        'stale': [fid for fid in pending if statuses.get(fid) == STATUS_STALE],
+    }
+
+
+def report_period(financial_report_id):
+    """
+    Période TFT d'un rapport selon la logique SYSCOHADA, à partir de ses exercices
+    (catalogue des rapports)
+    - Si N et N-1 disponibles : 01/01/N-1 à 31/12/N
+    - Si N uniquement : 01/01/N à 31/12/N
+    """
+    report = report_catalog([financial_report_id]).get(financial_report_id)
+    exercices = report['years'] if report else []
+    if not exercices:
+        raise ValueError("Aucun exercice détecté dans les données")
+    n = exercices[-1]
+    n_1 = exercices[-2] if len(exercices) >= 2 else n
+    return date(n_1, 1, 1), date(n, 12, 31)
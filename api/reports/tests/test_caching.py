@@ -0,0 +1,84 @@
+"""
+Validation HTTP (caching.py) : ETag / Last-Modified et réponses 304
+"""
+
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils.http import http_date
+
+from api.reports.caching import content_hash
+from api.reports.jobs import enqueue_report_job
+from api.reports.models import BalanceUpload, GeneratedFile, ProcessingJob
+
+
+class ConditionalRequestCases(TestCase):
+    def setUp(self):
+        self.upload = BalanceUpload.objects.create(
+            start_date='2024-01-01', end_date='2024-12-31', tft_json={'ZA': {'montant': 10}},
+        )
+        self.content = b'PK\x03\x04 classeur'
+        self.file = GeneratedFile.objects.create(
+            balance_upload=self.upload, file_type='TFT', file_content=self.content,
+            content_hash=content_hash(self.content),
+        )
+
+    def assertRevalidates(self, url):
+        """Première réponse 200 avec ETag, puis 304 sans corps sur If-None-Match ; retourne l'ETag"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], etag)
+        return etag
+
+
+class DownloadTests(ConditionalRequestCases):
+    def url(self):
+        return f'/api/reports/download-generated/{self.file.pk}/'
+
+    def test_etag_is_content_hash(self):
+        etag = self.assertRevalidates(self.url())
+        self.assertEqual(etag, f'"{content_hash(self.content)}"')
+        response = self.client.get(self.url())
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(response['Last-Modified'], http_date(self.file.created_at.timestamp()))
+
+    def test_if_modified_since(self):
+        last_modified = http_date(self.file.created_at.timestamp())
+        self.assertEqual(self.client.get(self.url(), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        earlier = http_date((self.file.created_at - timedelta(days=1)).timestamp())
+        self.assertEqual(self.client.get(self.url(), HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_if_none_match_takes_precedence(self):
+        last_modified = http_date(self.file.created_at.timestamp())
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH='"autre"', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_does_not_read_content(self):
+        etag = f'"{self.file.content_hash}"'
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class JSONEndpointTests(ConditionalRequestCases):
+    def test_history_etag_follows_content(self):
+        etag = self.assertRevalidates('/api/reports/balance-history/')
+        GeneratedFile.objects.filter(pk=self.file.pk).update(comment='Revu')
+        response = self.client.get('/api/reports/balance-history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_job_status_changes_with_progress(self):
+        job, _ = enqueue_report_job('fr-1')
+        url = f'/api/reports/jobs/{job.pk}/'
+        etag = self.assertRevalidates(url)
+        ProcessingJob.objects.filter(pk=job.pk).update(progress={'stage': 'load'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_tft_rubric(self):
+        self.assertRevalidates(f'/api/reports/results/{self.upload.pk}/tft/ZA/')
@@ -0,0 +1,111 @@
+"""
+Catalogue des rapports (catalog.py) : recalcul, versions concurrentes, empreintes et statuts
+"""
+
+import unittest
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+
+from api.reports import catalog
+from api.reports.catalog import (
+    STATUS_STALE, STATUS_UNPROCESSED, mark_reports_changed, refresh_report_catalog, report_catalog,
+    result_status, set_result_status,
+)
+from api.reports.models import AccountData, ReportCatalog
+
+from .utils import account_row, account_rows, create_account_data
+
+
+class RefreshTests(TestCase):
+    def setUp(self):
+        create_account_data(account_rows('fr-1', 3, year=2023) + account_rows('fr-1', 2, year=2024, prefix='701'))
+        mark_reports_changed(['fr-1'])
+
+    def test_entry_is_refreshed_on_read(self):
+        entry = ReportCatalog.objects.get(financial_report_id='fr-1')
+        self.assertGreater(entry.version, entry.refreshed_version)
+
+        report = report_catalog(['fr-1'])['fr-1']
+        self.assertEqual((report['count'], report['years']), (5, [2023, 2024]))
+        self.assertEqual(report['first_created_at'], datetime(2023, 6, 30, 12, tzinfo=dt_timezone.utc))
+        self.assertEqual(report['processing_status'], STATUS_UNPROCESSED)
+        entry.refresh_from_db()
+        self.assertEqual(entry.refreshed_version, entry.version)
+        self.assertEqual(refresh_report_catalog(), 0)
+
+    def test_write_bumps_version(self):
+        entry = ReportCatalog.objects.get(financial_report_id='fr-1')
+        mark_reports_changed(['fr-1', 'fr-2'])
+        versions = dict(ReportCatalog.objects.values_list('financial_report_id', 'version'))
+        self.assertEqual(versions['fr-1'], entry.version + 1)
+        self.assertGreater(versions['fr-2'], 0)
+
+    def test_write_during_refresh_leaves_entry_to_refresh(self):
+        fingerprints = catalog._fingerprints
+
+        def write_during_refresh(financial_report_ids):
+            result = fingerprints(financial_report_ids)
+            # Écriture concurrente validée pendant le calcul de l'entrée
+            create_account_data([account_row('fr-1', '70200000', year=2025)])
+            mark_reports_changed(['fr-1'])
+            return result
+
+        with mock.patch.object(catalog, '_fingerprints', side_effect=write_during_refresh):
+            self.assertEqual(refresh_report_catalog(['fr-1']), 0)
+
+        entry = ReportCatalog.objects.get(financial_report_id='fr-1')
+        self.assertGreater(entry.version, entry.refreshed_version)
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['count'], 6)
+
+    def test_emptied_report_is_hidden(self):
+        AccountData.objects.filter(financial_report_id='fr-1').delete()
+        mark_reports_changed(['fr-1'])
+        self.assertEqual(report_catalog(), {})
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        create_account_data([
+            account_row('fr-1', f'601{index:05d}', row_hash=f'{index:016x}') for index in range(4)
+        ] + [account_row('fr-2', row_hash='f' * 16)])
+
+    def test_fingerprint_follows_content(self):
+        before = catalog._fingerprints(['fr-1', 'fr-2'])
+        row = AccountData.objects.filter(financial_report_id='fr-1').first()
+        AccountData.objects.filter(pk=row.pk).update(row_hash='e' * 16)
+        after = catalog._fingerprints(['fr-1', 'fr-2'])
+        self.assertNotEqual(before['fr-1'], after['fr-1'])
+        self.assertEqual(before['fr-2'], after['fr-2'])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'empreinte SQL : PostgreSQL uniquement')
+    def test_sql_and_python_fingerprints_match(self):
+        in_sql = catalog._fingerprints(['fr-1', 'fr-2'])
+        with mock.patch.object(catalog, 'connection', mock.Mock(vendor='sqlite')):
+            in_python = catalog._fingerprints(['fr-1', 'fr-2'])
+        self.assertEqual(in_sql, in_python)
+        self.assertEqual(len(in_sql['fr-1']), 32)
+
+
+class ResultStatusTests(TestCase):
+    def test_result_status(self):
+        self.assertEqual(result_status('success', 'abc', 'abc', 3), 'success')
+        self.assertEqual(result_status('success', '', 'abc', 3), 'success')
+        self.assertEqual(result_status('success', 'abc', 'def', 3), STATUS_STALE)
+        self.assertEqual(result_status('error', 'abc', 'def', 3), STATUS_STALE)
+        self.assertEqual(result_status('obsolete', '', '', 0), 'obsolete')
+        self.assertEqual(result_status('obsolete', '', 'abc', 3), STATUS_STALE)
+
+    def test_set_result_status_compares_fingerprints(self):
+        create_account_data(account_rows('fr-1', 2))
+        mark_reports_changed(['fr-1'])
+        fingerprint = report_catalog(['fr-1'])['fr-1']['fingerprint']
+
+        set_result_status('fr-1', 'success', fingerprint)
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], 'success')
+        set_result_status('fr-1', 'success', 'd' * 32)
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], STATUS_STALE)
+        set_result_status('fr-1', 'error')
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], 'error')
@@ -0,0 +1,251 @@
+"""
+File des traitements (jobs.py) : single-flight, réservation, backoff et libération
+"""
+
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.reports import jobs
+from api.reports.jobs import (
+    JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SKIPPED, JOB_SUCCEEDED,
+    PRIORITY_BACKFILL, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED,
+    JobSkipped, claim_job, enqueue_report_job, enqueue_upload_job, job_status, pin_recent_results,
+    release_worker_jobs, run_job,
+)
+from api.reports.models import BalanceUpload, GeneratedFile, ProcessingJob
+from api.reports.routers import PRIMARY_ALIAS, ReadReplicaRouter, use_replica
+
+from .utils import ReplicaMirrorMixin
+
+
+class StaleCandidates:
+    """Candidats lus par un worker avant qu'un autre ne réserve le premier (compare-and-set)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def values(self, *fields):
+        return self.rows
+
+
+class EnqueueTests(TestCase):
+    def test_second_enqueue_joins_active_job(self):
+        job, created = enqueue_report_job('fr-1')
+        again, created_again = enqueue_report_job('fr-1')
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(ProcessingJob.objects.filter(financial_report_id='fr-1').count(), 1)
+
+    def test_higher_priority_caller_promotes_job(self):
+        job, _ = enqueue_report_job('fr-1', priority=PRIORITY_BACKFILL)
+        enqueue_report_job('fr-1', priority=PRIORITY_INTERACTIVE)
+        job.refresh_from_db()
+        self.assertEqual(job.priority, PRIORITY_INTERACTIVE)
+
+    def test_finished_job_allows_new_one(self):
+        job, _ = enqueue_report_job('fr-1')
+        ProcessingJob.objects.filter(pk=job.pk).update(status=JOB_SUCCEEDED)
+        again, created = enqueue_report_job('fr-1')
+        self.assertTrue(created)
+        self.assertNotEqual(again.pk, job.pk)
+
+    def test_upload_jobs_are_not_single_flight(self):
+        uploads = [
+            BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', status='processing')
+            for _ in range(2)
+        ]
+        created = [enqueue_upload_job(upload) for upload in uploads]
+        self.assertEqual(len({job.pk for job in created}), 2)
+        self.assertEqual([job.balance_upload_id for job in created], [upload.pk for upload in uploads])
+
+
+class ClaimTests(TestCase):
+    def test_claims_by_priority_then_age(self):
+        scheduled, _ = enqueue_report_job('fr-1', priority=PRIORITY_SCHEDULED)
+        interactive, _ = enqueue_report_job('fr-2', priority=PRIORITY_INTERACTIVE)
+
+        job = claim_job('w1')
+        self.assertEqual(job.pk, interactive.pk)
+        self.assertEqual((job.status, job.locked_by, job.attempts), (JOB_RUNNING, 'w1', 1))
+        self.assertEqual(claim_job('w2').pk, scheduled.pk)
+        self.assertIsNone(claim_job('w3'))
+
+    def test_max_priority_limits_queues(self):
+        enqueue_report_job('fr-1', priority=PRIORITY_BACKFILL)
+        self.assertIsNone(claim_job('w1', max_priority=PRIORITY_INTERACTIVE))
+
+    def test_backoff_delays_claim(self):
+        job, _ = enqueue_report_job('fr-1')
+        ProcessingJob.objects.filter(pk=job.pk).update(run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(claim_job('w1'))
+        self.assertEqual(claim_job('w1', now=timezone.now() + timedelta(minutes=2)).pk, job.pk)
+
+    @override_settings(JOB_LEASE_SECONDS=60)
+    def test_expired_lease_is_reclaimed(self):
+        job, _ = enqueue_report_job('fr-1')
+        claim_job('w1')
+        self.assertIsNone(claim_job('w2'))
+        later = timezone.now() + timedelta(seconds=120)
+        reclaimed = claim_job('w2', now=later)
+        self.assertEqual((reclaimed.pk, reclaimed.locked_by, reclaimed.attempts), (job.pk, 'w2', 2))
+
+    def test_compare_and_set_skips_job_claimed_meanwhile(self):
+        first, _ = enqueue_report_job('fr-1')
+        second, _ = enqueue_report_job('fr-2')
+        stale = StaleCandidates([
+            {'id': first.pk, 'status': JOB_QUEUED, 'attempts': 0},
+            {'id': second.pk, 'status': JOB_QUEUED, 'attempts': 0},
+        ])
+        # Un autre worker a réservé `first` après la lecture des candidats
+        ProcessingJob.objects.filter(pk=first.pk).update(status=JOB_RUNNING, locked_by='other', attempts=1)
+
+        with mock.patch.object(type(connection.features), 'has_select_for_update_skip_locked', False), \
+                mock.patch.object(jobs, '_claimable_jobs', return_value=stale):
+            job = claim_job('w1')
+
+        self.assertEqual(job.pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual((first.locked_by, first.attempts), ('other', 1))
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class SkipLockedClaimTests(TransactionTestCase):
+    def test_row_locked_by_another_worker_is_skipped(self):
+        first, _ = enqueue_report_job('fr-1')
+        second, _ = enqueue_report_job('fr-2')
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # Un autre worker garde la ligne de `first` verrouillée (transaction ouverte)
+            try:
+                with transaction.atomic():
+                    list(ProcessingJob.objects.select_for_update().filter(pk=first.pk))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            job = claim_job('w1')
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(job.pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.status, JOB_QUEUED)
+
+
+@override_settings(JOB_RETRY_BACKOFF_SECONDS=30)
+class RunJobTests(TestCase):
+    def claimed_job(self, max_attempts=3):
+        enqueue_report_job('fr-1', max_attempts=max_attempts, start_date='2024-01-01', end_date='2024-12-31')
+        return claim_job('w1')
+
+    def test_failure_is_retried_with_exponential_backoff(self):
+        job = self.claimed_job()
+        with mock.patch.object(jobs, 'execute_report_job', side_effect=RuntimeError('boom')):
+            before = timezone.now()
+            run_job(job)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.last_error, job.locked_by), (JOB_QUEUED, 'boom', ''))
+            self.assertAlmostEqual((job.run_after - before).total_seconds(), 30, delta=5)
+
+            job = claim_job('w1', now=job.run_after)
+            before = timezone.now()
+            run_job(job)
+            job.refresh_from_db()
+            self.assertAlmostEqual((job.run_after - before).total_seconds(), 60, delta=5)
+
+            job = claim_job('w1', now=job.run_after)
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JOB_FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_skipped_job_is_not_retried(self):
+        job = self.claimed_job()
+        with mock.patch.object(jobs, 'execute_report_job', side_effect=JobSkipped('Données insuffisantes')):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JOB_SKIPPED, 1))
+
+    def test_success_links_result(self):
+        job = self.claimed_job()
+        upload = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-1')
+        with mock.patch.object(jobs, 'execute_report_job', return_value=upload):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.balance_upload_id, job.progress['stage']), (JOB_SUCCEEDED, upload.pk, 'done'))
+
+
+class ReleaseWorkerJobsTests(TestCase):
+    def test_requeues_or_fails_interrupted_jobs(self):
+        enqueue_report_job('fr-1', max_attempts=2)
+        enqueue_report_job('fr-2', max_attempts=1, start_date='2024-01-01', end_date='2024-12-31')
+        retried, failed = claim_job('w1'), claim_job('w1')
+
+        self.assertEqual(release_worker_jobs('w1', 'Délai dépassé'), 2)
+
+        retried.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((retried.status, retried.locked_by, retried.last_error), (JOB_QUEUED, '', 'Délai dépassé'))
+        self.assertEqual((failed.status, failed.last_error), (JOB_FAILED, 'Délai dépassé'))
+        # L'échec définitif est historisé comme une génération en erreur
+        upload = BalanceUpload.objects.get(financial_report_id=failed.financial_report_id)
+        self.assertEqual((upload.status, upload.error_message), ('error', 'Délai dépassé'))
+        self.assertFalse(BalanceUpload.objects.filter(financial_report_id=retried.financial_report_id).exists())
+
+    def test_other_workers_are_untouched(self):
+        enqueue_report_job('fr-1')
+        job = claim_job('w1')
+        self.assertEqual(release_worker_jobs('w2', 'Délai dépassé'), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_RUNNING)
+
+
+@override_settings(REPLICA_PIN_SECONDS=30)
+class RecentResultsPinningTests(ReplicaMirrorMixin, TestCase):
+    def setUp(self):
+        self.upload = BalanceUpload.objects.create(
+            start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-1', tft_json={'ZA': {'montant': 1}},
+        )
+        self.file = GeneratedFile.objects.create(
+            balance_upload=self.upload, file_type='TFT', file_content=b'tft', content_hash='abc',
+        )
+        self.job = ProcessingJob.objects.create(
+            financial_report_id='fr-1', status=JOB_SUCCEEDED, balance_upload=self.upload, finished_at=timezone.now(),
+        )
+
+    def read_alias(self, **filters):
+        with use_replica():
+            pin_recent_results(**filters)
+            return ReadReplicaRouter().db_for_read(BalanceUpload)
+
+    def test_recently_finished_job_results_are_read_on_primary(self):
+        self.assertEqual(self.read_alias(balance_upload_id=self.upload.pk), PRIMARY_ALIAS)
+        self.assertEqual(self.read_alias(balance_upload__generated_files=self.file.pk), PRIMARY_ALIAS)
+
+    def test_older_results_are_read_on_replica(self):
+        ProcessingJob.objects.filter(pk=self.job.pk).update(finished_at=timezone.now() - timedelta(seconds=31))
+        self.assertEqual(self.read_alias(balance_upload_id=self.upload.pk), 'replica')
+
+    def test_status_links_are_served_before_replication(self):
+        # Données non validées : invisibles sur le miroir, comme sur un réplica en retard
+        links = job_status(self.job)['result']['generated_files']
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            download = self.client.get(links[0]['download_url'])
+            rubric = self.client.get(f'/api/reports/results/{self.upload.pk}/tft/ZA/')
+        self.assertEqual((download.status_code, rubric.status_code), (200, 200))
+        self.assertEqual(len(replica_queries), 0)
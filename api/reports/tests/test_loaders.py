@@ -0,0 +1,159 @@
+"""
+Chargement CSV (loaders.py) : COPY / bulk_create, remplacement et upsert, rejets
+"""
+
+import csv
+import tempfile
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from api.reports import loaders
+from api.reports.catalog import report_catalog
+from api.reports.loaders import LoadError, delete_report_rows, load_account_data_csv
+from api.reports.models import AccountData, AccountDataChange, BalanceUpload
+
+from .utils import account_row, account_rows, create_account_data, write_csv
+
+
+class LoaderCases:
+    """Cas communs aux deux modes d'écriture (`mode`)"""
+
+    mode = None
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, rows, name='balance.csv', **options):
+        path = write_csv(self.directory.name, rows, name)
+        return load_account_data_csv(path, mode=self.mode, **options)
+
+    def read_rejects(self, summary):
+        with open(summary['rejects_path'], newline='', encoding='utf-8') as f:
+            return [(int(row['line']), row['reason']) for row in csv.DictReader(f)]
+
+    def test_replace_loads_and_replaces_reports(self):
+        summary = self.load(account_rows('fr-a', 3) + account_rows('fr-b', 2))
+        self.assertEqual(summary['mode'], self.mode)
+        self.assertEqual(summary['rows'], 5)
+        self.assertEqual(sorted(summary['financial_report_ids']), ['fr-a', 'fr-b'])
+        upload = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-a')
+
+        replacement = account_rows('fr-a', 4, prefix='602')
+        self.load(replacement)
+
+        self.assertEqual(
+            set(AccountData.objects.filter(financial_report_id='fr-a').values_list('id', flat=True)),
+            {row['id'] for row in replacement},
+        )
+        self.assertEqual(AccountData.objects.filter(financial_report_id='fr-b').count(), 2)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'obsolete')
+        self.assertEqual(report_catalog(['fr-a'])['fr-a']['count'], 4)
+
+    def test_rows_without_report_are_not_replaced(self):
+        existing = create_account_data([account_row('')])
+        loaded = account_row('', '70100000')
+        self.load(account_rows('fr-a', 2) + [loaded])
+
+        self.assertEqual(
+            set(AccountData.objects.filter(financial_report_id='').values_list('id', flat=True)),
+            {existing[0].id, loaded['id']},
+        )
+
+    def test_invalid_and_duplicate_rows_are_rejected(self):
+        rows = account_rows('fr-a', 4)
+        rows[1]['balance'] = 'abc'
+        duplicate = dict(rows[0], balance='999.00')
+        # chunk_size=2 : le doublon arrive dans un autre bloc que sa première occurrence
+        summary = self.load(rows + [duplicate], chunk_size=2)
+
+        self.assertEqual(summary['rows'], 3)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(sorted(self.read_rejects(summary)), [(3, 'balance non numérique'), (6, 'id en double')])
+        self.assertEqual(AccountData.objects.get(pk=rows[0]['id']).balance, 100.5)
+
+    def test_upsert_writes_only_changes(self):
+        rows = account_rows('fr-a', 4)
+        self.load(rows, strategy='upsert')
+
+        rows[0]['balance'] = '555.00'
+        removed = rows.pop(1)
+        added = account_row('fr-a', '70100000')
+        summary = self.load(rows + [added], strategy='upsert')
+
+        changes = summary['changes']
+        self.assertEqual(
+            (changes['inserted'], changes['updated'], changes['deleted'], changes['unchanged']), (1, 1, 1, 2)
+        )
+        self.assertEqual(changes['accounts'], sorted([rows[0]['account_number'], removed['account_number'], '70100000']))
+        self.assertEqual(changes['prefixes'], ['601', '701'])
+        self.assertFalse(AccountData.objects.filter(pk=removed['id']).exists())
+        self.assertEqual(float(AccountData.objects.get(pk=rows[0]['id']).balance), 555.0)
+
+    def test_upsert_without_change_writes_nothing(self):
+        rows = account_rows('fr-a', 3)
+        self.load(rows, strategy='upsert')
+        summary = self.load(rows, strategy='upsert')
+        self.assertEqual(summary['changes']['unchanged'], 3)
+        self.assertEqual(summary['changes']['inserted'] + summary['changes']['updated'], 0)
+
+    def test_orm_save_keeps_loaded_row_hash(self):
+        rows = account_rows('fr-a', 2)
+        rows[0]['account_lookup_key'] = ''
+        self.load(rows)
+        for row in AccountData.objects.all():
+            loaded = row.row_hash
+            row.save()
+            self.assertEqual(AccountData.objects.get(pk=row.pk).row_hash, loaded)
+
+        row.balance = '1.00'
+        row.save(update_fields=['balance'])
+        self.assertNotEqual(AccountData.objects.get(pk=row.pk).row_hash, loaded)
+
+    def test_change_log_is_written_with_the_load(self):
+        self.load(account_rows('fr-a', 2))
+        self.assertEqual(list(AccountDataChange.objects.values_list('financial_report_id', 'kind')), [('fr-a', 'write')])
+
+    def test_failed_change_log_rolls_back_the_load(self):
+        with mock.patch.object(loaders, 'record_report_changes', side_effect=RuntimeError('journal')):
+            with self.assertRaises(RuntimeError):
+                self.load(account_rows('fr-a', 2))
+        self.assertFalse(AccountData.objects.exists())
+
+    def test_missing_columns_are_refused(self):
+        path = write_csv(self.directory.name, [])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('id,account_number\n1,601\n')
+        with self.assertRaises(LoadError):
+            load_account_data_csv(path, mode=self.mode)
+
+
+class OrmLoaderTests(LoaderCases, TransactionTestCase):
+    mode = 'orm'
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'COPY FROM STDIN : PostgreSQL uniquement')
+class CopyLoaderTests(LoaderCases, TransactionTestCase):
+    mode = 'copy'
+
+
+class DeleteReportRowsTests(TransactionTestCase):
+    def test_purge_deletes_in_batches_and_invalidates_results(self):
+        create_account_data(account_rows('fr-a', 5) + account_rows('fr-b', 1))
+        upload = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-a')
+
+        self.assertEqual(delete_report_rows(['fr-a'], batch_size=2), 5)
+
+        self.assertFalse(AccountData.objects.filter(financial_report_id='fr-a').exists())
+        self.assertEqual(AccountData.objects.count(), 1)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'obsolete')
+        self.assertTrue(AccountDataChange.objects.filter(financial_report_id='fr-a', kind='delete').exists())
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_report_rows(['fr-a']), 0)
+        self.assertFalse(AccountDataChange.objects.exists())
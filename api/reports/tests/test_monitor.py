@@ -0,0 +1,76 @@
+"""
+Passage de surveillance commun aux moniteurs (monitor_pool.ReportMonitor)
+"""
+
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.reports import monitor_pool
+from api.reports.catalog import mark_reports_changed
+from api.reports.changes import get_watermark
+from api.reports.jobs import JOB_FAILED, JOB_SUCCEEDED
+from api.reports.monitor_pool import ReportMonitor
+from api.reports.triggers import touch_report_triggers
+
+from .utils import account_rows, create_account_data
+
+
+class ReportMonitorTests(TestCase):
+    def setUp(self):
+        create_account_data(account_rows('fr-1', 3) + account_rows('fr-2', 3) + account_rows('fr-3', 1))
+        mark_reports_changed(['fr-1', 'fr-2', 'fr-3'])
+        self.monitor = ReportMonitor('test', min_accounts=2, node='node-a', log=mock.Mock())
+        self.process = self.enterContext(mock.patch.object(
+            monitor_pool, 'process_financial_report_async', return_value=SimpleNamespace(status=JOB_SUCCEEDED),
+        ))
+
+    def processed(self):
+        return [call.args[0] for call in self.process.call_args_list]
+
+    def test_pass_processes_eligible_reports_and_advances_watermark(self):
+        summary = self.monitor.run_pass()
+
+        self.assertEqual(summary['pending'], ['fr-1', 'fr-2', 'fr-3'])
+        self.assertEqual((summary['succeeded'], summary['failed']), (2, 0))
+        self.assertEqual(self.processed(), ['fr-1', 'fr-2'])  # fr-3 : sous le seuil
+        self.assertIsNotNone(get_watermark(self.monitor.coordinator.cursor_name))
+        # Aucun changement depuis le passage précédent
+        self.assertEqual(self.monitor.run_pass()['pending'], [])
+
+    def test_failures_are_counted(self):
+        self.process.side_effect = [SimpleNamespace(status=JOB_FAILED), RuntimeError('génération')]
+        summary = self.monitor.run_pass()
+        self.assertEqual((summary['succeeded'], summary['failed']), (0, 2))
+
+    def test_stop_during_pass_finishes_current_report_and_keeps_watermark(self):
+        def stop_after_first(financial_report_id, min_accounts):
+            self.monitor.request_stop()  # Pendant un traitement : pas d'interruption
+            return SimpleNamespace(status=JOB_SUCCEEDED)
+
+        self.process.side_effect = stop_after_first
+        summary = self.monitor.run_pass()
+
+        self.assertEqual(self.processed(), ['fr-1'])
+        self.assertEqual(summary['succeeded'], 1)
+        self.assertIsNone(get_watermark(self.monitor.coordinator.cursor_name))
+
+    def test_stop_outside_pass_is_immediate(self):
+        with self.assertRaises(KeyboardInterrupt):
+            self.monitor.request_stop()
+        self.assertTrue(self.monitor.stop_requested)
+
+    def test_due_triggers_are_queued(self):
+        touch_report_triggers(['fr-1'], now=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.monitor.run_pass()['queued'], ['fr-1'])
+
+    def test_leave_hands_over_share(self):
+        self.monitor.run_pass()
+        other = ReportMonitor('test', node='node-b')
+        other.coordinator.heartbeat()
+        self.assertEqual(other.coordinator.refresh(), ['node-a', 'node-b'])
+        self.monitor.leave()
+        self.assertEqual(other.coordinator.refresh(), ['node-b'])
@@ -0,0 +1,140 @@
+"""
+Résultats partiels (results.py) : rubrique du TFT et page d'onglet de feuille maîtresse
+
+Les mêmes cas couvrent l'extraction en base (PostgreSQL, jsonb) et le découpage en Python
+des autres bases.
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api.reports import results
+from api.reports.models import BalanceUpload
+from api.reports.results import ResultNotFound, encode_json, sheet_page, tft_rubric
+
+TFT = {'ZA': {'libelle': 'Trésorerie à l’ouverture', 'montant': 1250.5}, 'FA': {'montant': -3}}
+SHEETS = {
+    'clients': {
+        'exercices': [2024, 2023],
+        'has_two_exercices': True,
+        'comparatif': [{'Compte': f'411{index:05d}', 'Solde': index * 10.5} for index in range(5)],
+        'exercice_n': [],
+    },
+    # Feuille incomplète : sans exercices, onglets qui ne sont pas des listes de lignes
+    'fournisseurs': {'comparatif': 'indisponible', 'exercice_n': {'401': 1}, 'exercice_n1': [{'Compte': '401'}]},
+    'stocks': None,
+}
+
+
+class PartialResultCases:
+    """Cas communs ; `in_database` choisit l'extraction en base ou en Python"""
+
+    in_database = None
+
+    def setUp(self):
+        self.upload = BalanceUpload.objects.create(
+            start_date='2024-01-01', end_date='2024-12-31', tft_json=TFT, feuilles_maitresses_json=SHEETS,
+        )
+        self.empty = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', status='error')
+        if not self.in_database:
+            self.enterContext(mock.patch.object(
+                results, '_upload_results', lambda upload_id: (BalanceUpload.objects.filter(pk=upload_id), False)
+            ))
+
+    def decoded(self, payload):
+        return json.loads(encode_json(payload))
+
+    def assertNotFound(self, message, function, *args):
+        with self.assertRaisesMessage(ResultNotFound, message):
+            function(*args)
+
+    def test_tft_rubric(self):
+        self.assertEqual(
+            self.decoded(tft_rubric(self.upload.pk, 'ZA')),
+            {'balance_upload_id': self.upload.pk, 'ref': 'ZA', 'rubrique': TFT['ZA']},
+        )
+
+    def test_tft_rubric_errors(self):
+        self.assertNotFound('Rubrique ZZ non trouvée', tft_rubric, self.upload.pk, 'ZZ')
+        self.assertNotFound('Résultats non disponibles', tft_rubric, self.empty.pk, 'ZA')
+        self.assertNotFound('Traitement non trouvé', tft_rubric, 0, 'ZA')
+
+    def test_sheet_pages(self):
+        page = self.decoded(sheet_page(self.upload.pk, 'clients', 'comparatif', 2, 2))
+        self.assertEqual(page, {
+            'balance_upload_id': self.upload.pk,
+            'group': 'clients',
+            'tab': 'comparatif',
+            'exercices': [2024, 2023],
+            'has_two_exercices': True,
+            'count': 5,
+            'page': 2,
+            'page_size': 2,
+            'num_pages': 3,
+            'rows': SHEETS['clients']['comparatif'][2:4],
+        })
+        last = self.decoded(sheet_page(self.upload.pk, 'clients', 'comparatif', 3, 2))
+        self.assertEqual(last['rows'], SHEETS['clients']['comparatif'][4:])
+        self.assertEqual(self.decoded(sheet_page(self.upload.pk, 'clients', 'comparatif', 4, 2))['rows'], [])
+
+    def test_empty_tab(self):
+        page = self.decoded(sheet_page(self.upload.pk, 'clients', 'exercice_n', 1, 50))
+        self.assertEqual((page['count'], page['num_pages'], page['rows']), (0, 1, []))
+
+    def test_sheet_without_exercices(self):
+        page = self.decoded(sheet_page(self.upload.pk, 'fournisseurs', 'exercice_n1', 1, 10))
+        self.assertEqual((page['exercices'], page['count'], page['rows']), (None, 1, [{'Compte': '401'}]))
+
+    def test_tab_that_is_not_a_list(self):
+        for tab in ('comparatif', 'exercice_n'):
+            with self.subTest(tab=tab):
+                self.assertNotFound(
+                    f'Onglet {tab} absent de la feuille maîtresse fournisseurs',
+                    sheet_page, self.upload.pk, 'fournisseurs', tab, 1, 10,
+                )
+
+    def test_sheet_page_errors(self):
+        self.assertNotFound('Feuille maîtresse stocks non trouvée', sheet_page, self.upload.pk, 'stocks', 'comparatif', 1, 10)
+        self.assertNotFound('Feuille maîtresse autres non trouvée', sheet_page, self.upload.pk, 'autres', 'comparatif', 1, 10)
+        self.assertNotFound('Onglet exercice_n1 absent', sheet_page, self.upload.pk, 'clients', 'exercice_n1', 1, 10)
+        self.assertNotFound('Résultats non disponibles', sheet_page, self.empty.pk, 'clients', 'comparatif', 1, 10)
+        self.assertNotFound('Traitement non trouvé', sheet_page, 0, 'clients', 'comparatif', 1, 10)
+
+
+class PythonPartialResultTests(PartialResultCases, TestCase):
+    in_database = False
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'extraction jsonb : PostgreSQL uniquement')
+class DatabasePartialResultTests(PartialResultCases, TestCase):
+    in_database = True
+
+
+@override_settings(RESULTS_PAGE_SIZE=2, RESULTS_MAX_PAGE_SIZE=3)
+class ResultViewTests(TestCase):
+    def setUp(self):
+        self.upload = BalanceUpload.objects.create(
+            start_date='2024-01-01', end_date='2024-12-31', tft_json=TFT, feuilles_maitresses_json=SHEETS,
+        )
+        self.url = f'/api/reports/results/{self.upload.pk}/sheets/clients/'
+
+    def test_default_page(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['page_size'], len(response.json()['rows'])), (2, 2))
+
+    def test_invalid_parameters(self):
+        for params in ({'tab': 'autre'}, {'page': 'x'}, {'page': 0}, {'page_size': 4}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get(f'/api/reports/results/{self.upload.pk}/tft/ZZ/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/reports/results/{self.upload.pk}/sheets/stocks/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/reports/results/{self.upload.pk}/sheets/autres/').status_code, 404)
+        # Onglet qui n'est pas une liste : 404, pas d'erreur de jsonb_array_length
+        self.assertEqual(self.client.get(f'/api/reports/results/{self.upload.pk}/sheets/fournisseurs/').status_code, 404)
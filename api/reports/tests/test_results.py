@@ -0,0 +1,116 @@
+"""
+Encodage des résultats : encode_json / RawJSON (results.py), json_records et feuilles
+maîtresses (tft_generator.py)
+"""
+
+import json
+from datetime import date, datetime
+from io import BytesIO
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+
+from api.reports.models import BalanceUpload
+from api.reports.results import RawJSON, encode_json, raw_results, with_raw_results
+from api.reports.tft_generator import generate_tft_and_sheets_from_df, json_records
+
+
+class EncodeJSONTests(SimpleTestCase):
+    def test_matches_drf_rendering(self):
+        payload = {'label': 'Trésorerie « nette »', 'montant': Decimal('12.50'), 'date': date(2024, 12, 31), 'ids': [1, 2]}
+        self.assertEqual(encode_json(payload).encode('utf-8'), JSONRenderer().render(payload))
+
+    def test_raw_json_is_spliced_verbatim(self):
+        stored = '{"b": 1.50, "a": [1, 2]}'
+        text = encode_json({'id': 7, 'result': RawJSON(stored), 'items': [RawJSON('[]'), RawJSON(None)]})
+        self.assertEqual(text, '{"id":7,"result":{"b": 1.50, "a": [1, 2]},"items":[[],null]}')
+
+    def test_strings_resembling_placeholders_are_kept(self):
+        payload = {'note': 'abc:0', 'raw': RawJSON('true')}
+        self.assertEqual(json.loads(encode_json(payload)), {'note': 'abc:0', 'raw': True})
+
+    def test_nan_is_refused(self):
+        with self.assertRaises(ValueError):
+            encode_json({'value': float('nan')})
+
+
+class RawResultsTests(TestCase):
+    def test_stored_results_round_trip(self):
+        tft = {'ZA': {'libelle': 'Trésorerie', 'montant': 1250.5}, 'ZB': None}
+        upload = BalanceUpload.objects.create(
+            start_date='2024-01-01', end_date='2024-12-31', tft_json=tft, feuilles_maitresses_json={'clients': {}},
+        )
+        upload = with_raw_results(BalanceUpload.objects.filter(pk=upload.pk)).get()
+        self.assertEqual(
+            json.loads(encode_json(raw_results(upload))),
+            {'tft_json': tft, 'feuilles_maitresses_json': {'clients': {}}, 'coherence': None},
+        )
+
+
+class JSONRecordsTests(SimpleTestCase):
+    def assertIsoformat(self, column):
+        expected = [None if ts is pd.NaT else ts.isoformat() for ts in column]
+        self.assertEqual([row['date'] for row in json_records(pd.DataFrame({'date': column}))], expected)
+
+    def test_naive_dates(self):
+        column = pd.to_datetime(['2024-01-31 10:00:00', '2024-06-30 12:30:15.250', None], format='ISO8601')
+        self.assertIsoformat(pd.Series(column))
+
+    def test_utc_dates_keep_their_offset(self):
+        column = pd.Series(pd.to_datetime(['2024-01-31 10:00', '2024-06-30 12:30'], utc=True))
+        self.assertIsoformat(column)
+        self.assertTrue(json_records(pd.DataFrame({'date': column}))[0]['date'].endswith('+00:00'))
+
+    def test_offsets_across_dst(self):
+        column = pd.Series(pd.to_datetime(['2024-01-31 10:00', '2024-06-30 12:30', None], utc=True))
+        self.assertIsoformat(column.dt.tz_convert('Europe/Paris'))
+
+    def test_native_values(self):
+        frame = pd.DataFrame({
+            'compte': ['601', '701', None],
+            'solde': [1.5, np.nan, np.inf],
+            'lignes': np.array([1, 2, 3], dtype=np.int64),
+        })
+        records = json_records(frame)
+        self.assertEqual(records, [
+            {'compte': '601', 'solde': 1.5, 'lignes': 1},
+            {'compte': '701', 'solde': None, 'lignes': 2},
+            {'compte': None, 'solde': None, 'lignes': 3},
+        ])
+        self.assertIs(type(records[0]['lignes']), int)
+        self.assertEqual(json.loads(encode_json(records)), records)
+
+    def test_empty_frame(self):
+        self.assertEqual(json_records(pd.DataFrame(index=range(2))), [{}, {}])
+
+
+class MasterSheetTests(SimpleTestCase):
+    def test_workbook_keeps_typed_cells(self):
+        frame = pd.DataFrame({
+            'account_number': ['60100002', '60100001', '60100001'],
+            'account_name': ['Client B', 'Client A', 'Client A'],
+            'balance': [200.0, 100.0, 80.0],
+            'total_debit': [200.0, 100.0, 80.0],
+            'total_credit': [0.0, 0.0, 0.0],
+            'created_at': pd.to_datetime(['2024-06-30 12:00', '2024-03-31 08:30', '2023-12-31 18:00']),
+        })
+        frame['exercice'] = frame['created_at'].dt.year
+        _, sheets_contents, _, sheets_data, _ = generate_tft_and_sheets_from_df(frame, '2023-01-01', '2024-12-31')
+
+        workbook = openpyxl.load_workbook(BytesIO(sheets_contents['Fournisseurs - Achats']))
+        rows = list(workbook['Exercice_2024'].iter_rows(min_row=2, values_only=True))
+        self.assertEqual(rows, [
+            ('60100001', 'Client A', 100, 100, 0, 2024, datetime(2024, 3, 31, 8, 30)),
+            ('60100002', 'Client B', 200, 200, 0, 2024, datetime(2024, 6, 30, 12)),
+        ])
+        comparison = list(workbook['Comparatif_2024_2023'].iter_rows(min_row=2, values_only=True))
+        self.assertEqual(comparison[0][10:12], (datetime(2024, 3, 31, 8, 30), datetime(2023, 12, 31, 18)))
+
+        sheet = json.loads(encode_json(sheets_data['Fournisseurs - Achats']))
+        self.assertEqual(sheet['exercice_n'][0]['Date_Creation'], '2024-03-31T08:30:00')
+        self.assertEqual(sheet['comparatif'][0]['Date_Creation_N-1'], '2023-12-31T18:00:00')
+        self.assertEqual(sheet['comparatif'][1]['Date_Creation_N-1'], '')
@@ -0,0 +1,118 @@
+"""
+Routage primaire / réplica (routers.py) : lectures autorisées, épinglage après écriture, cookie
+"""
+
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.reports.catalog import mark_reports_changed
+from api.reports.models import AccountData, ReportCatalog
+from api.reports.routers import (
+    PIN_COOKIE_NAME, PRIMARY_ALIAS, ReadReplicaRouter, ReplicaPinningMiddleware,
+    begin_routing, current_routing, end_routing, read_from_replica, use_replica,
+)
+
+from .utils import ReplicaMirrorMixin, account_rows, create_account_data
+
+REPLICA = 'replica'
+
+
+class RouterTests(ReplicaMirrorMixin, TestCase):
+    router = ReadReplicaRouter()
+
+    def read_alias(self):
+        return self.router.db_for_read(AccountData)
+
+    def test_reads_outside_replica_blocks_use_primary(self):
+        self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+        token = begin_routing()
+        self.addCleanup(end_routing, token)
+        self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+
+    def test_use_replica_routes_reads_and_restores_state(self):
+        with use_replica():
+            self.assertEqual(self.read_alias(), REPLICA)
+            with use_replica():
+                self.assertEqual(self.read_alias(), REPLICA)
+            self.assertEqual(self.read_alias(), REPLICA)
+        self.assertIsNone(current_routing())
+        self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+
+    def test_read_from_replica_decorator(self):
+        @read_from_replica
+        def view():
+            return self.read_alias()
+
+        self.assertEqual(view(), REPLICA)
+        self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+
+    def test_write_pins_later_reads_on_primary(self):
+        with use_replica():
+            self.assertEqual(self.router.db_for_write(AccountData), PRIMARY_ALIAS)
+            self.assertTrue(current_routing().wrote)
+            self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+
+    def test_pinned_state_reads_primary(self):
+        token = begin_routing(pinned=True)
+        self.addCleanup(end_routing, token)
+        with use_replica():
+            self.assertEqual(self.read_alias(), PRIMARY_ALIAS)
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'reports'))
+        self.assertTrue(self.router.allow_migrate(PRIMARY_ALIAS, 'reports'))
+
+
+class PinningMiddlewareTests(ReplicaMirrorMixin, TestCase):
+    def respond(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinningMiddleware(view)(request)
+
+    @override_settings(REPLICA_PIN_SECONDS=10)
+    def test_write_sets_pin_cookie(self):
+        def writing_view(request):
+            ReadReplicaRouter().db_for_write(AccountData)
+            return HttpResponse()
+
+        cookie = self.respond(writing_view).cookies[PIN_COOKIE_NAME]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+        self.assertNotIn(PIN_COOKIE_NAME, self.respond(lambda request: HttpResponse()).cookies)
+
+    def test_pin_cookie_is_honored(self):
+        aliases = []
+
+        @read_from_replica
+        def reading_view(request):
+            aliases.append(ReadReplicaRouter().db_for_read(AccountData))
+            return HttpResponse()
+
+        self.respond(reading_view, {PIN_COOKIE_NAME: '1'})
+        self.respond(reading_view)
+        self.assertEqual(aliases, [PRIMARY_ALIAS, REPLICA])
+        self.assertIsNone(current_routing())
+
+    def test_pinned_client_reads_primary_through_views(self):
+        self.client.cookies[PIN_COOKIE_NAME] = '1'
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            response = self.client.get('/api/reports/balance-history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica_queries), 0)
+
+
+class ReportListingTests(ReplicaMirrorMixin, TestCase):
+    def test_listing_does_not_refresh_catalog(self):
+        create_account_data(account_rows('fr-1', 2))
+        mark_reports_changed(['fr-1'])
+
+        self.client.cookies[PIN_COOKIE_NAME] = '1'  # Lecture sur le primaire (données non validées)
+        with CaptureQueriesContext(connections[PRIMARY_ALIAS]) as queries:
+            response = self.client.get('/api/reports/process-account-data/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')])
+        entry = ReportCatalog.objects.get(financial_report_id='fr-1')
+        self.assertGreater(entry.version, entry.refreshed_version)
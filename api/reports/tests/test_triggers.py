@@ -0,0 +1,168 @@
+"""
+Déclencheurs différés (triggers.py, signals.py) et régénération des rapports périmés
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.reports import jobs
+from api.reports.catalog import STATUS_STALE, report_catalog
+from api.reports.changes import unprocessed_changed_reports
+from api.reports.jobs import JOB_SUCCEEDED, run_report_job_now
+from api.reports.models import AccountData, AccountDataChange, BalanceUpload, PendingReportTrigger, ProcessingJob
+from api.reports.signals import coalesce_processing, process_due_reports
+from api.reports.triggers import due_report_triggers, release_trigger, touch_report_triggers
+
+from .utils import account_row, account_rows, create_account_data
+
+GENERATED = (b'tft', {'clients': b'feuille'}, {'tft': 1}, {'clients': {}}, {})
+
+
+@override_settings(PROCESSING_QUIET_SECONDS=60)
+class DebounceTests(TestCase):
+    def test_each_write_pushes_the_deadline(self):
+        start = timezone.now()
+        touch_report_triggers(['fr-1'], now=start)
+        touch_report_triggers(['fr-1'], now=start + timedelta(seconds=45))
+
+        trigger = PendingReportTrigger.objects.get(financial_report_id='fr-1')
+        self.assertEqual(trigger.first_change_at, start)
+        self.assertEqual(trigger.due_at, start + timedelta(seconds=105))
+        self.assertEqual(due_report_triggers(now=start + timedelta(seconds=100)), [])
+        self.assertEqual(due_report_triggers(now=start + timedelta(seconds=105)), [trigger])
+
+    def test_row_write_schedules_processing(self):
+        AccountData.objects.create(**account_row('fr-1'))
+        self.assertTrue(PendingReportTrigger.objects.filter(financial_report_id='fr-1').exists())
+        self.assertEqual(list(AccountDataChange.objects.values_list('financial_report_id', flat=True)), ['fr-1'])
+        # Rapport encore en cours d'écriture : pas de traitement
+        self.assertEqual(process_due_reports(), [])
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    def test_due_trigger_is_queued_once(self):
+        touch_report_triggers(['fr-1'], now=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(process_due_reports(min_accounts=1), ['fr-1'])
+        self.assertEqual(process_due_reports(min_accounts=1), [])
+        job = ProcessingJob.objects.get(financial_report_id='fr-1')
+        self.assertEqual(job.payload['min_accounts'], 1)
+        self.assertFalse(PendingReportTrigger.objects.exists())
+
+    def test_trigger_pushed_after_read_is_not_consumed(self):
+        touch_report_triggers(['fr-1'], now=timezone.now() - timedelta(minutes=5))
+        trigger, = due_report_triggers()
+        touch_report_triggers(['fr-1'])
+        self.assertFalse(release_trigger(trigger))
+        self.assertTrue(PendingReportTrigger.objects.filter(financial_report_id='fr-1').exists())
+
+
+class CoalesceProcessingTests(TestCase):
+    def test_bulk_writes_touch_one_trigger_per_report(self):
+        with coalesce_processing():
+            for row in account_rows('fr-1', 3) + account_rows('fr-2', 2):
+                AccountData.objects.create(**row)
+            with coalesce_processing():
+                AccountData.objects.create(**account_row('fr-3'))
+            self.assertFalse(PendingReportTrigger.objects.exists())
+
+        self.assertEqual(
+            sorted(PendingReportTrigger.objects.values_list('financial_report_id', flat=True)), ['fr-1', 'fr-2', 'fr-3']
+        )
+        self.assertEqual(AccountDataChange.objects.count(), 3)
+
+    def test_error_in_block_schedules_nothing(self):
+        with self.assertRaises(ValueError):
+            with coalesce_processing():
+                AccountData.objects.create(**account_row('fr-1'))
+                raise ValueError('chargement interrompu')
+        self.assertFalse(PendingReportTrigger.objects.exists())
+
+    def test_emptied_reports_are_marked_obsolete(self):
+        rows = create_account_data(account_rows('fr-1', 2) + account_rows('fr-2', 2))
+        upload = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-1')
+        kept = BalanceUpload.objects.create(start_date='2024-01-01', end_date='2024-12-31', financial_report_id='fr-2')
+
+        with coalesce_processing():
+            for row in rows[:3]:
+                row.delete()
+
+        upload.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual((upload.status, kept.status), ('obsolete', 'success'))
+        # Rapport partiellement supprimé : à régénérer ; rapport vidé : rien à traiter
+        self.assertEqual(list(PendingReportTrigger.objects.values_list('financial_report_id', flat=True)), ['fr-2'])
+        self.assertEqual(
+            sorted(AccountDataChange.objects.filter(kind='delete').values_list('financial_report_id', flat=True)),
+            ['fr-1', 'fr-2'],
+        )
+
+
+@override_settings(PROCESSING_QUIET_SECONDS=0)
+class StaleReportTests(TestCase):
+    def setUp(self):
+        with coalesce_processing():
+            create_account_data(account_rows('fr-1', 3))
+            AccountData.objects.create(**account_row('fr-1', '70100000'))
+        self.generate = self.enterContext(
+            mock.patch.object(jobs, 'generate_tft_and_sheets_from_database', return_value=GENERATED)
+        )
+
+    def process(self):
+        job = run_report_job_now('fr-1', start_date='2024-01-01', end_date='2024-12-31')
+        self.assertEqual(job.status, JOB_SUCCEEDED)
+        return job.balance_upload
+
+    def test_processed_report_is_not_regenerated(self):
+        upload = self.process()
+        self.assertEqual(upload.data_fingerprint, report_catalog(['fr-1'])['fr-1']['fingerprint'])
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], 'success')
+
+        self.assertEqual(self.process().pk, upload.pk)
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(unprocessed_changed_reports('test', after=0)[0], [])
+
+    def test_late_row_makes_report_stale_and_regenerates_it(self):
+        first = self.process()
+        AccountData.objects.create(**account_row('fr-1', '70200000'))
+
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], STATUS_STALE)
+        self.assertEqual(unprocessed_changed_reports('test', after=0)[0], ['fr-1'])
+
+        second = self.process()
+        first.refresh_from_db()
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(first.status, 'obsolete')
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], 'success')
+        self.assertEqual(unprocessed_changed_reports('test', after=0)[0], [])
+
+    def test_edited_row_makes_report_stale(self):
+        upload = self.process()
+        row = AccountData.objects.filter(financial_report_id='fr-1').order_by('id').first()
+        PendingReportTrigger.objects.all().delete()
+
+        row.balance = '999.00'
+        row.save()
+
+        self.assertNotEqual(AccountData.objects.get(pk=row.pk).row_hash, '')
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], STATUS_STALE)
+        self.assertTrue(PendingReportTrigger.objects.filter(financial_report_id='fr-1').exists())
+        self.assertNotEqual(self.process().pk, upload.pk)
+
+    def test_deleted_row_makes_report_stale(self):
+        self.process()
+        AccountData.objects.filter(financial_report_id='fr-1').order_by('id').first().delete()
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], STATUS_STALE)
+        self.assertTrue(PendingReportTrigger.objects.filter(financial_report_id='fr-1').exists())
+
+    def test_rows_written_during_generation_leave_report_stale(self):
+        def generate_while_loading(*args, **kwargs):
+            AccountData.objects.create(**account_row('fr-1', '70200000'))
+            return GENERATED
+
+        self.generate.side_effect = generate_while_loading
+        upload = self.process()
+
+        self.assertEqual(upload.status, 'success')
+        self.assertEqual(report_catalog(['fr-1'])['fr-1']['processing_status'], STATUS_STALE)
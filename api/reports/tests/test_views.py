@@ -0,0 +1,101 @@
+"""
+Endpoints de traitement (views.py) : génération dans la requête par défaut, mise en file avec "async"
+"""
+
+import json
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from api.reports import jobs, views
+from api.reports.catalog import mark_reports_changed
+from api.reports.models import BalanceUpload, ProcessingJob
+
+from .utils import account_rows, create_account_data
+
+GENERATED = (b'tft', {'clients': b'feuille'}, {'ZA': {'montant': 10}}, {'clients': {}}, {})
+
+
+class ProcessAccountDataTests(TestCase):
+    url = '/api/reports/process-account-data/'
+
+    def setUp(self):
+        create_account_data(account_rows('fr-1', 3))
+        mark_reports_changed(['fr-1'])
+        self.enterContext(
+            mock.patch.object(jobs, 'generate_tft_and_sheets_from_database', return_value=GENERATED)
+        )
+
+    def post(self, **data):
+        return self.client.post(
+            self.url, {'financial_report_id': 'fr-1', 'start_date': '2024-01-01', 'end_date': '2024-12-31', **data},
+            content_type='application/json',
+        )
+
+    def test_generates_in_request_by_default(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['tft_json'], GENERATED[2])
+        self.assertEqual(BalanceUpload.objects.get().pk, response.json()['balance_upload_id'])
+
+    def test_async_queues_job(self):
+        for value in (True, '1', 'yes'):
+            with self.subTest(value=value):
+                ProcessingJob.objects.all().delete()
+                response = self.post(**{'async': value})
+                self.assertEqual(response.status_code, 202)
+                job = ProcessingJob.objects.get()
+                self.assertEqual((response.json()['job_id'], response['Location']), (job.pk, f'/api/reports/jobs/{job.pk}/'))
+        self.assertFalse(BalanceUpload.objects.exists())
+
+    def test_async_false_generates_in_request(self):
+        self.assertEqual(self.post(**{'async': False}).status_code, 201)
+
+
+class AutoProcessAsyncTests(TestCase):
+    def test_async_queues_pending_reports(self):
+        create_account_data(account_rows('fr-1', 2) + account_rows('fr-2', 2))
+        mark_reports_changed(['fr-1', 'fr-2'])
+        response = self.client.post('/api/reports/auto-process/', {'async': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual([job['financial_report_id'] for job in response.json()['jobs']], ['fr-1', 'fr-2'])
+        self.assertEqual(ProcessingJob.objects.filter(priority=jobs.PRIORITY_BACKFILL).count(), 2)
+
+    def test_streams_by_default(self):
+        response = self.client.post('/api/reports/auto-process/', content_type='application/json')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertFalse(ProcessingJob.objects.exists())
+
+
+class AutoProcessStreamTests(TestCase):
+    def setUp(self):
+        create_account_data(account_rows('fr-1', 2) + account_rows('fr-2', 2))
+        mark_reports_changed(['fr-1', 'fr-2'])
+
+    def auto_process_report(self, financial_report_id, user_id):
+        # Résultat préparé : pas d'accès à la base depuis les threads du pool
+        if financial_report_id == 'fr-2':
+            return {'financial_report_id': financial_report_id, 'status': 'error', 'error': 'Échec'}
+        return {
+            'financial_report_id': financial_report_id, 'status': 'success', 'balance_upload_id': 7,
+            'start_date': date(2024, 1, 1), 'end_date': date(2024, 12, 31), 'montant': Decimal('12.50'),
+        }
+
+    def test_stream_lines(self):
+        with mock.patch.object(views, '_auto_process_report', side_effect=self.auto_process_report):
+            response = self.client.post('/api/reports/auto-process/', content_type='application/json')
+            body = b''.join(response.streaming_content).decode('utf-8')
+
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('Traitement automatique démarré', body)  # UTF-8, sans échappement
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([line['event'] for line in lines], ['start', 'result', 'result', 'summary'])
+        self.assertEqual(lines[0]['total'], 2)
+        results = {line['financial_report_id']: line for line in lines[1:3]}
+        self.assertEqual(results['fr-1']['start_date'], '2024-01-01')
+        self.assertEqual(results['fr-1']['montant'], 12.5)  # Comme le rendu JSON de DRF
+        self.assertEqual(results['fr-2']['error'], 'Échec')
+        self.assertEqual((lines[-1]['success_count'], lines[-1]['error_count']), (1, 1))
@@ -0,0 +1,84 @@
+"""
+Données de test : lignes AccountData, fichiers CSV de balance, réplica miroir
+"""
+
+import csv
+import os
+import uuid
+
+from django.conf import settings
+from django.db import connections
+
+from api.reports.loaders import ACCOUNT_DATA_COLUMNS
+from api.reports.models import AccountData
+
+CSV_COLUMNS = [column for column in ACCOUNT_DATA_COLUMNS if column != 'row_hash']
+
+
+def account_row(financial_report_id, account_number='60100000', balance='100.50', year=2024, **fields):
+    """Ligne de balance (valeurs texte, comme dans un export CSV)"""
+    row = {
+        'id': str(uuid.uuid4()),
+        'account_number': account_number,
+        'account_label': f'Compte {account_number}',
+        'account_class': account_number[0],
+        'balance': balance,
+        'total_debit': balance,
+        'total_credit': '0.00',
+        'entries_count': '1',
+        'created_at': f'{year}-06-30T12:00:00+00:00',
+        'financial_report_id': financial_report_id,
+        'account_lookup_key': account_number[:4],
+    }
+    row.update(fields)
+    return row
+
+
+def account_rows(financial_report_id, count=3, year=2024, prefix='601'):
+    return [
+        account_row(financial_report_id, f'{prefix}{index:05d}', f'{100 + index}.50', year)
+        for index in range(count)
+    ]
+
+
+def write_csv(directory, rows, name='balance.csv'):
+    path = os.path.join(directory, name)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def create_account_data(rows):
+    """Enregistre des lignes (bulk_create, sans signal par ligne)"""
+    return AccountData.objects.bulk_create([AccountData(**row) for row in rows])
+
+
+class ReplicaMirrorMixin:
+    """
+    Ajoute l'alias du réplica en miroir de la base de test (TEST MIRROR) s'il n'est pas
+    configuré : une seconde connexion qui, comme un réplica en retard, ne voit pas les
+    écritures non validées d'un TestCase
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        alias = settings.DB_REPLICA_ALIAS
+        if alias not in connections.settings:
+            connections.settings[alias] = dict(connections.settings['default'], TEST={'MIRROR': 'default'})
+            cls.addClassCleanup(cls.remove_replica, alias)
+        # Déclaré ici : l'alias n'existe pas encore quand le runner prépare les bases
+        cls.databases = {*cls.databases, alias}
+        super().setUpClass()
+
+    def _should_check_constraints(self, connection):
+        # Contraintes vérifiées sur le primaire : en SQLite (cache partagé), la transaction
+        # du TestCase verrouille les tables pour la connexion miroir
+        return connection.alias != settings.DB_REPLICA_ALIAS and super()._should_check_constraints(connection)
+
+    @staticmethod
+    def remove_replica(alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
@@ -1,8 +1,93 @@
+import math
+import numpy as np
 import pandas as pd
-import os
 from io import BytesIO
 from .models import AccountData
 
+
+def json_number(value):
+    """Scalaire NumPy ou Python en nombre JSON natif (NaN et infini : None)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _isoformat(column):
+    """
+    Équivalent vectorisé de `Timestamp.isoformat()` : microsecondes si non nulles et, pour
+    une colonne avec fuseau, heure locale suivie de son décalage (« +00:00 »).
+    """
+    local = column.dt.tz_localize(None) if column.dt.tz is not None else column
+    values = np.datetime_as_string(local.to_numpy(dtype='datetime64[us]'), unit='us').astype(object)
+    whole = (local.dt.microsecond == 0).to_numpy()
+    values[whole] = [value[:-7] for value in values[whole]]
+    if column.dt.tz is None:
+        return values
+
+    minutes = ((local - column.dt.tz_convert(None)).dt.total_seconds() // 60).to_numpy()
+    offsets = {
+        m: f"{'+' if m >= 0 else '-'}{int(abs(m)) // 60:02d}:{int(abs(m)) % 60:02d}"
+        for m in np.unique(minutes[~np.isnan(minutes)])
+    }
+    if len(offsets) == 1:
+        return values + next(iter(offsets.values()))
+    return values + pd.Series(minutes).map(offsets).fillna('').to_numpy(dtype=object)
+
+
+def json_records(frame):
+    """
+    Lignes d'un DataFrame en valeurs JSON natives, converties colonne par colonne :
+    dates en ISO 8601, scalaires NumPy en types Python, NaN et infini en None.
+    """
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        missing = column.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(column):
+            values = _isoformat(column)
+        else:
+            values = column.to_numpy(dtype=object)
+            if pd.api.types.is_float_dtype(column):
+                missing = missing | np.isinf(column.to_numpy())
+        values[missing] = None
+        columns.append(values.tolist())
+    names = list(frame.columns)
+    return [dict(zip(names, row)) for row in zip(*columns)] if names else [{} for _ in range(len(frame))]
+
+
+def json_value(value):
+    """Valeur d'une ligne de feuille en valeur JSON native : dates en ISO 8601, nombres via json_number"""
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return json_number(value)
+
+
+def sheet_frame(frame, exercice):
+    """Lignes d'un onglet de feuille maîtresse, triées par compte (valeurs typées : dates en datetime)"""
+    def column(name, default):
+        return frame[name] if name in frame.columns else default
+
+    rows = pd.DataFrame({
+        'Compte': frame['account_number'],
+        'Libellé': column('account_name', ''),
+        'Solde': frame['balance'],
+        'Débit': column('total_debit', 0),
+        'Crédit': column('total_credit', 0),
+        'Exercice': exercice,
+        'Date_Creation': column('created_at', ''),
+    }, index=frame.index)
+    return rows.sort_values('Compte', key=lambda accounts: accounts.astype(str), kind='stable')
+
+
+def append_rows(ws, frame):
+    """Écrit les lignes de `frame` dans la feuille : les dates restent des cellules date Excel"""
+    for values in frame.itertuples(index=False, name=None):
+        ws.append(values)
+
 def generate_tft_and_sheets(csv_path, start_date, end_date):
     # Contrôle de cohérence TFT
     # Contrôles de cohérence conformes à la documentation SYSCOHADA
@@ -228,7 +313,7 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
     montant_refs = {}
     # On prépare les DataFrames N et N-1
     if 'exercice' in df.columns:
-        exercices = sorted(df['exercice'].unique())
+        exercices = sorted(int(year) for year in df['exercice'].dropna().unique())
         n = exercices[-1]
         if len(exercices) > 1:
             n_1 = exercices[-2]
@@ -261,7 +346,7 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
                 comptes_n = filter_by_prefix(df_n, item['prefixes'])
                 solde = comptes_n['balance'].sum() if not comptes_n.empty else 0
                 montant += item['sign'] * solde
-                comptes.extend(comptes_n.to_dict(orient='records'))
+                comptes.extend(json_records(comptes_n))
             solde_n = montant
             # Si N-1 existe, calculer, sinon mettre à zéro
             solde_n1 = 0 if df_n1.empty else 0
@@ -286,7 +371,7 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
                 solde_actif_n1 = treso_actif_n1['balance'].sum() if not treso_actif_n1.empty else 0
                 solde_passif_n1 = treso_passif_n1['balance'].sum() if not treso_passif_n1.empty else 0
                 montant = (solde_actif_n1 or 0) - (solde_passif_n1 or 0)
-                comptes = treso_actif_n1.to_dict(orient='records') + treso_passif_n1.to_dict(orient='records')
+                comptes = json_records(treso_actif_n1) + json_records(treso_passif_n1)
                 variation = montant
                 debit_n = treso_actif_n1['total_debit'].sum() if 'total_debit' in treso_actif_n1 else 0
                 credit_n = treso_actif_n1['total_credit'].sum() if 'total_credit' in treso_actif_n1 else 0
@@ -313,7 +398,7 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
             debit_n = comptes_n['total_debit'].sum() if 'total_debit' in comptes_n else 0
             credit_n = comptes_n['total_credit'].sum() if 'total_credit' in comptes_n else 0
             montant = 0
-            comptes = comptes_n.to_dict(orient='records')
+            comptes = json_records(comptes_n)
             if ligne['formule']:
                 formule = ligne['formule']
                 for ref in montant_refs:
@@ -345,12 +430,12 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
         })
         tft_data[ligne['ref']] = {
             'libelle': ligne['libelle'],
-            'montant': montant,
-            'solde_n': solde_n,
-            'solde_n1': solde_n1,
-            'variation': variation,
-            'debit_n': debit_n,
-            'credit_n': credit_n,
+            'montant': json_number(montant),
+            'solde_n': json_number(solde_n),
+            'solde_n1': json_number(solde_n1),
+            'variation': json_number(variation),
+            'debit_n': json_number(debit_n),
+            'credit_n': json_number(credit_n),
             'formule': ligne['formule'],
             'comptes': comptes
         }
@@ -365,7 +450,6 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
     sheets_data = {}
     import openpyxl
     from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils.dataframe import dataframe_to_rows
     
     for group_name, prefixes in groups.items():
         # Filtrer les données par groupe et exercice
@@ -388,49 +472,19 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
             ws_n = wb.create_sheet(f"Exercice_{n}")
             ws_n.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N
-            n_data = []
-            for _, row in group_n.iterrows():
-                n_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n_data:
-                ws_n.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                           row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N (triées par numéro de compte)
+            n_frame = sheet_frame(group_n, n)
+            n_data = json_records(n_frame)
+            append_rows(ws_n, n_frame)
             
             # 2. Onglet Exercice N-1
             ws_n1 = wb.create_sheet(f"Exercice_{n_1}")
             ws_n1.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N-1
-            n1_data = []
-            for _, row in group_n1.iterrows():
-                n1_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n_1,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n1_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n1_data:
-                ws_n1.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                            row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N-1 (triées par numéro de compte)
+            n1_frame = sheet_frame(group_n1, n_1)
+            n1_data = json_records(n1_frame)
+            append_rows(ws_n1, n1_frame)
             
             # 3. Onglet Comparatif
             ws_comp = wb.create_sheet(f"Comparatif_{n}_{n_1}")
@@ -438,8 +492,8 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
                           '%_Evolution', 'Débit_N', 'Crédit_N', 'Débit_N-1', 'Crédit_N-1', 'Date_Creation_N', 'Date_Creation_N-1', 'Exercices'])
             
             # Créer un dictionnaire pour faciliter la comparaison
-            n_dict = {row['Compte']: row for row in n_data}
-            n1_dict = {row['Compte']: row for row in n1_data}
+            n_dict = {row['Compte']: row for row in n_frame.to_dict('records')}
+            n1_dict = {row['Compte']: row for row in n1_frame.to_dict('records')}
             
             # Obtenir tous les comptes uniques
             all_accounts = set(n_dict.keys()) | set(n1_dict.keys())
@@ -520,7 +574,7 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
             sheets_data[group_name] = {
                 'exercice_n': n_data,
                 'exercice_n1': n1_data,
-                'comparatif': comp_data,
+                'comparatif': [{key: json_value(value) for key, value in row.items()} for row in comp_data],
                 'has_two_exercices': True,
                 'exercices': [n, n_1]
             }
@@ -530,25 +584,10 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
             ws_n = wb.create_sheet(f"Exercice_{n}")
             ws_n.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N
-            n_data = []
-            for _, row in group_n.iterrows():
-                n_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n_data:
-                ws_n.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                           row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N (triées par numéro de compte)
+            n_frame = sheet_frame(group_n, n)
+            n_data = json_records(n_frame)
+            append_rows(ws_n, n_frame)
             
             # Appliquer le formatage
             for cell in ws_n[1]:
@@ -585,34 +624,38 @@ def generate_tft_and_sheets(csv_path, start_date, end_date):
     coherence = controle_coherence_complet(tft_data)
     return tft_content, sheets_contents, tft_data, sheets_data, coherence
 
-def generate_tft_and_sheets_from_database(financial_report_id, start_date, end_date):
-    """Génère le TFT et les feuilles maîtresses à partir des données de la base"""
-    # Récupérer les données depuis AccountData
-    account_data = AccountData.objects.filter(financial_report_id=financial_report_id)
-    
-    if not account_data.exists():
+def generate_tft_and_sheets_from_database(financial_report_id, start_date, end_date, progress=None):
+    """
+    Génère le TFT et les feuilles maîtresses à partir des données de la base
+
+    `progress(stage, current=None, total=None, detail=None)` est appelé à chaque étape :
+    'load', 'aggregate', puis 'render' pour chaque feuille maîtresse (k sur 10).
+    """
+    if progress:
+        progress('load')
+    # Récupérer les données depuis AccountData (tuples, sans instancier les modèles)
+    rows = AccountData.objects.filter(financial_report_id=financial_report_id).values_list(
+        'account_number', 'account_label', 'balance', 'total_debit', 'total_credit', 'created_at'
+    )
+    # account_label sert de account_name ; colonnes typées converties en bloc
+    df = pd.DataFrame.from_records(
+        list(rows),
+        columns=['account_number', 'account_name', 'balance', 'total_debit', 'total_credit', 'created_at'],
+    )
+    if df.empty:
         raise ValueError(f"Aucune donnée trouvée pour financial_report_id: {financial_report_id}")
-    
-    # Convertir en DataFrame
-    df_data = []
-    for data in account_data:
-        df_data.append({
-            'account_number': data.account_number,
-            'account_name': data.account_label,  # Utiliser account_label comme account_name
-            'balance': float(data.balance),
-            'total_debit': float(data.total_debit),
-            'total_credit': float(data.total_credit),
-            'created_at': data.created_at,
-            'exercice': data.created_at.year
-        })
-    
-    df = pd.DataFrame(df_data)
+    for column in ('balance', 'total_debit', 'total_credit'):
+        df[column] = df[column].astype(float)
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    df['exercice'] = df['created_at'].dt.year
     
     # Utiliser la même logique que la fonction originale
-    return generate_tft_and_sheets_from_df(df, start_date, end_date)
+    return generate_tft_and_sheets_from_df(df, start_date, end_date, progress=progress)
 
-def generate_tft_and_sheets_from_df(df, start_date, end_date):
+def generate_tft_and_sheets_from_df(df, start_date, end_date, progress=None):
     """Génère le TFT et les feuilles maîtresses à partir d'un DataFrame"""
+    if progress:
+        progress('aggregate')
     # Contrôle de cohérence TFT
     # Contrôles de cohérence conformes à la documentation SYSCOHADA
     def controle_coherence_complet(tft_data):
@@ -827,7 +870,7 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
     montant_refs = {}
     # On prépare les DataFrames N et N-1
     if 'exercice' in df.columns:
-        exercices = sorted(df['exercice'].unique())
+        exercices = sorted(int(year) for year in df['exercice'].dropna().unique())
         n = exercices[-1]
         if len(exercices) > 1:
             n_1 = exercices[-2]
@@ -860,7 +903,7 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
                 comptes_n = filter_by_prefix(df_n, item['prefixes'])
                 solde = comptes_n['balance'].sum() if not comptes_n.empty else 0
                 montant += item['sign'] * solde
-                comptes.extend(comptes_n.to_dict(orient='records'))
+                comptes.extend(json_records(comptes_n))
             solde_n = montant
             # Si N-1 existe, calculer, sinon mettre à zéro
             solde_n1 = 0 if df_n1.empty else 0
@@ -885,7 +928,7 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
                 solde_actif_n1 = treso_actif_n1['balance'].sum() if not treso_actif_n1.empty else 0
                 solde_passif_n1 = treso_passif_n1['balance'].sum() if not treso_passif_n1.empty else 0
                 montant = (solde_actif_n1 or 0) - (solde_passif_n1 or 0)
-                comptes = treso_actif_n1.to_dict(orient='records') + treso_passif_n1.to_dict(orient='records')
+                comptes = json_records(treso_actif_n1) + json_records(treso_passif_n1)
                 variation = montant
                 debit_n = treso_actif_n1['total_debit'].sum() if 'total_debit' in treso_actif_n1 else 0
                 credit_n = treso_actif_n1['total_credit'].sum() if 'total_credit' in treso_actif_n1 else 0
@@ -912,7 +955,7 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
             debit_n = comptes_n['total_debit'].sum() if 'total_debit' in comptes_n else 0
             credit_n = comptes_n['total_credit'].sum() if 'total_credit' in comptes_n else 0
             montant = 0
-            comptes = comptes_n.to_dict(orient='records')
+            comptes = json_records(comptes_n)
             if ligne['formule']:
                 formule = ligne['formule']
                 for ref in montant_refs:
@@ -944,12 +987,12 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
         })
         tft_data[ligne['ref']] = {
             'libelle': ligne['libelle'],
-            'montant': montant,
-            'solde_n': solde_n,
-            'solde_n1': solde_n1,
-            'variation': variation,
-            'debit_n': debit_n,
-            'credit_n': credit_n,
+            'montant': json_number(montant),
+            'solde_n': json_number(solde_n),
+            'solde_n1': json_number(solde_n1),
+            'variation': json_number(variation),
+            'debit_n': json_number(debit_n),
+            'credit_n': json_number(credit_n),
             'formule': ligne['formule'],
             'comptes': comptes
         }
@@ -964,9 +1007,10 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
     sheets_data = {}
     import openpyxl
     from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils.dataframe import dataframe_to_rows
     
-    for group_name, prefixes in groups.items():
+    for group_index, (group_name, prefixes) in enumerate(groups.items(), start=1):
+        if progress:
+            progress('render', group_index, len(groups), group_name)
         # Filtrer les données par groupe et exercice
         group_n = filter_by_prefix(df_n, prefixes)
         group_n1 = filter_by_prefix(df_n1, prefixes)
@@ -987,49 +1031,19 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
             ws_n = wb.create_sheet(f"Exercice_{n}")
             ws_n.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N
-            n_data = []
-            for _, row in group_n.iterrows():
-                n_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n_data:
-                ws_n.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                           row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N (triées par numéro de compte)
+            n_frame = sheet_frame(group_n, n)
+            n_data = json_records(n_frame)
+            append_rows(ws_n, n_frame)
             
             # 2. Onglet Exercice N-1
             ws_n1 = wb.create_sheet(f"Exercice_{n_1}")
             ws_n1.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N-1
-            n1_data = []
-            for _, row in group_n1.iterrows():
-                n1_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n_1,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n1_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n1_data:
-                ws_n1.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                            row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N-1 (triées par numéro de compte)
+            n1_frame = sheet_frame(group_n1, n_1)
+            n1_data = json_records(n1_frame)
+            append_rows(ws_n1, n1_frame)
             
             # 3. Onglet Comparatif
             ws_comp = wb.create_sheet(f"Comparatif_{n}_{n_1}")
@@ -1037,8 +1051,8 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
                           '%_Evolution', 'Débit_N', 'Crédit_N', 'Débit_N-1', 'Crédit_N-1', 'Date_Creation_N', 'Date_Creation_N-1', 'Exercices'])
             
             # Créer un dictionnaire pour faciliter la comparaison
-            n_dict = {row['Compte']: row for row in n_data}
-            n1_dict = {row['Compte']: row for row in n1_data}
+            n_dict = {row['Compte']: row for row in n_frame.to_dict('records')}
+            n1_dict = {row['Compte']: row for row in n1_frame.to_dict('records')}
             
             # Obtenir tous les comptes uniques
             all_accounts = set(n_dict.keys()) | set(n1_dict.keys())
@@ -1119,7 +1133,7 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
             sheets_data[group_name] = {
                 'exercice_n': n_data,
                 'exercice_n1': n1_data,
-                'comparatif': comp_data,
+                'comparatif': [{key: json_value(value) for key, value in row.items()} for row in comp_data],
                 'has_two_exercices': True,
                 'exercices': [n, n_1]
             }
@@ -1129,25 +1143,10 @@ def generate_tft_and_sheets_from_df(df, start_date, end_date):
             ws_n = wb.create_sheet(f"Exercice_{n}")
             ws_n.append(['Compte', 'Libellé', 'Solde', 'Débit', 'Crédit', 'Exercice', 'Date_Creation'])
             
-            # Remplir les données N
-            n_data = []
-            for _, row in group_n.iterrows():
-                n_data.append({
-                    'Compte': row['account_number'],
-                    'Libellé': row.get('account_name', ''),
-                    'Solde': row['balance'],
-                    'Débit': row.get('total_debit', 0),
-                    'Crédit': row.get('total_credit', 0),
-                    'Exercice': n,
-                    'Date_Creation': row.get('created_at', '')
-                })
-            
-            # Trier par numéro de compte
-            n_data.sort(key=lambda x: str(x['Compte']))
-            
-            for row_data in n_data:
-                ws_n.append([row_data['Compte'], row_data['Libellé'], row_data['Solde'], 
-                           row_data['Débit'], row_data['Crédit'], row_data['Exercice'], row_data['Date_Creation']])
+            # Remplir les données N (triées par numéro de compte)
+            n_frame = sheet_frame(group_n, n)
+            n_data = json_records(n_frame)
+            append_rows(ws_n, n_frame)
             
             # Appliquer le formatage
             for cell in ws_n[1]:
@@ -0,0 +1,83 @@
+"""
+Déclencheurs de traitement différés (debounce) par financial_report_id
+
+Chaque écriture AccountData repousse l'échéance (`due_at`) du rapport de
+PROCESSING_QUIET_SECONDS. Le moniteur ne traite un rapport qu'une fois son échéance
+dépassée, c'est-à-dire quand ses lignes ont cessé d'arriver : le rapport est généré une
+seule fois, sur des données complètes.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PendingReportTrigger
+
+
+def quiet_period():
+    return timedelta(seconds=getattr(settings, 'PROCESSING_QUIET_SECONDS', 30))
+
+
+def touch_report_triggers(financial_report_ids, now=None):
+    """Crée ou repousse (une requête) le déclencheur de chaque financial_report_id"""
+    financial_report_ids = sorted({fid for fid in financial_report_ids if fid})
+    if not financial_report_ids:
+        return
+    now = now or timezone.now()
+    due_at = now + quiet_period()
+    PendingReportTrigger.objects.bulk_create(
+        [
+            PendingReportTrigger(
+                financial_report_id=fid,
+                first_change_at=now,
+                last_change_at=now,
+                due_at=due_at,
+            )
+            for fid in financial_report_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['financial_report_id'],
+        update_fields=['last_change_at', 'due_at'],
+    )
+
+
+def due_report_triggers(now=None, limit=None):
+    """Déclencheurs dont la période de calme est écoulée, les plus anciens d'abord"""
+    queryset = PendingReportTrigger.objects.filter(
+        due_at__lte=now or timezone.now()
+    ).order_by('due_at')
+    if limit:
+        queryset = queryset[:limit]
+    return list(queryset)
+
+
+def seconds_until_next_due(now=None):
+    """Délai avant l'échéance du prochain déclencheur, None s'il n'y en a aucun"""
+    now = now or timezone.now()
+    due_at = PendingReportTrigger.objects.order_by('due_at').values_list('due_at', flat=True).first()
+    if due_at is None:
+        return None
+    return max((due_at - now).total_seconds(), 0)
+
+
+def pending_report_ids():
+    """financial_report_id dont les données arrivent encore (déclencheur non échu)"""
+    return set(
+        PendingReportTrigger.objects.filter(
+            due_at__gt=timezone.now()
+        ).values_list('financial_report_id', flat=True)
+    )
+
+
+def release_trigger(trigger):
+    """
+    Consomme un déclencheur échu.
+
+    La suppression est conditionnée à l'échéance lue : si une écriture l'a repoussée
+    entre-temps (ou si un autre moniteur l'a déjà consommé), retourne False.
+    """
+    deleted, _ = PendingReportTrigger.objects.filter(
+        pk=trigger.pk, due_at=trigger.due_at
+    ).delete()
+    return deleted > 0
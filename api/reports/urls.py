@@ -1,13 +1,20 @@
 from django.urls import path
 
-from .views import BalanceUploadView, GeneratedFileDownloadView, GeneratedFileCommentView, ProcessAccountDataView, AutoProcessView
-from .models import BalanceUpload
+from .views import BalanceUploadView, GeneratedFileDownloadView, GeneratedFileCommentView, ProcessAccountDataView, AutoProcessView, AccountDataIngestView, AccountDataBulkView, ProcessingJobStatusView, ResultTFTView, ResultSheetView
+from django.db.models import Prefetch
+
+from .models import BalanceUpload, GeneratedFile
+from .results import conditional_json_response, raw_results, with_raw_results
+from .routers import read_from_replica
 from rest_framework.views import APIView
-from rest_framework.response import Response
 
 class BalanceHistoryView(APIView):
+    @read_from_replica
     def get(self, request):
-        uploads = BalanceUpload.objects.order_by('-uploaded_at')
+        # Résultats JSON lus sous forme de texte, fichiers sans leur contenu binaire
+        uploads = with_raw_results(BalanceUpload.objects.order_by('-uploaded_at')).prefetch_related(
+            Prefetch('generated_files', queryset=GeneratedFile.objects.defer('file_content'))
+        )
         history = []
         for upload in uploads:
             history.append({
@@ -28,11 +35,10 @@ class BalanceHistoryView(APIView):
                         'created_at': f.created_at
                     } for f in upload.generated_files.all()
                 ],
-                'tft_json': upload.tft_json,
-                'feuilles_maitresses_json': upload.feuilles_maitresses_json,
-                'coherence': upload.coherence_json
+                **raw_results(upload)
             })
-        return Response({'history': history})
+        # ETag sur le corps : pas de Last-Modified, statuts et commentaires changent sans date
+        return conditional_json_response(request, {'history': history})
 
 urlpatterns = [
     path('upload-balance/', BalanceUploadView.as_view(), name='upload-balance'),
@@ -42,4 +48,10 @@ urlpatterns = [
     # Nouvelles URLs pour le traitement automatique
     path('process-account-data/', ProcessAccountDataView.as_view(), name='process-account-data'),
     path('auto-process/', AutoProcessView.as_view(), name='auto-process'),
+    path('ingest-account-data/', AccountDataIngestView.as_view(), name='ingest-account-data'),
+    path('jobs/<int:job_id>/', ProcessingJobStatusView.as_view(), name='job-status'),
+    path('account-data/bulk/', AccountDataBulkView.as_view(), name='account-data-bulk'),
+    # Parties de résultats : une rubrique du TFT, une page d'un onglet de feuille maîtresse
+    path('results/<int:upload_id>/tft/<str:ref>/', ResultTFTView.as_view(), name='result-tft'),
+    path('results/<int:upload_id>/sheets/<str:group>/', ResultSheetView.as_view(), name='result-sheet'),
 ]
@@ -3,12 +3,9 @@ from rest_framework.response import Response
 from django.http import HttpResponse, Http404
 from .models import GeneratedFile, BalanceUpload, AccountData
 from .serializers import GeneratedFileCommentSerializer
-from .tft_generator import generate_tft_and_sheets_from_database
-import os
-from datetime import datetime, date
-import math
-import pandas as pd
-import numpy as np
+from .routers import read_from_replica
+from .caching import not_modified, set_validators
+from .stats import report_period
 
 def determine_tft_dates(financial_report_id):
     """
@@ -16,41 +13,26 @@ def determine_tft_dates(financial_report_id):
     - Si N et N-1 disponibles : 01/01/N-1 à 31/12/N
     - Si N uniquement : 01/01/N à 31/12/N
     """
-    account_data = AccountData.objects.filter(financial_report_id=financial_report_id)
-    
-    # Analyser les exercices disponibles
-    exercices = set()
-    for data in account_data:
-        exercices.add(data.created_at.year)
-    
-    exercices = sorted(exercices)
-    
-    if len(exercices) >= 2:
-        # N-1 et N disponibles : 01/01/N-1 à 31/12/N
-        n_1 = exercices[-2]  # N-1
-        n = exercices[-1]    # N
-        start_date = date(n_1, 1, 1)   # 01/01/N-1
-        end_date = date(n, 12, 31)     # 31/12/N
-    elif len(exercices) == 1:
-        # Un seul exercice : 01/01/N à 31/12/N
-        n = exercices[0]
-        start_date = date(n, 1, 1)     # 01/01/N
-        end_date = date(n, 12, 31)     # 31/12/N
-    else:
-        # Aucun exercice détecté
-        raise ValueError("Aucun exercice détecté dans les données")
-    
-    return start_date, end_date
+    # Exercices disponibles en une requête groupée (plus de parcours des lignes)
+    return report_period(financial_report_id)
 
 class GeneratedFileDownloadView(APIView):
+    @read_from_replica
     def get(self, request, pk):
+        # Fichier d'un job tout juste terminé (lien download_url du statut) : primaire
+        pin_recent_results(balance_upload__generated_files=pk)
+        # Métadonnées d'abord : une requête conditionnelle à jour ne lit pas le contenu
         try:
-            gen_file = GeneratedFile.objects.get(pk=pk)
+            gen_file = GeneratedFile.objects.defer('file_content').get(pk=pk)
         except GeneratedFile.DoesNotExist:
             raise Http404("Fichier non trouvé")
+        cached = not_modified(request, etag=gen_file.content_hash, last_modified=gen_file.created_at)
+        if cached is not None:
+            return cached
         if not gen_file.file_content:
             return Response({'error': 'Aucun contenu binaire enregistré.'}, status=404)
         response = HttpResponse(gen_file.file_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        set_validators(response, etag=gen_file.content_hash, last_modified=gen_file.created_at)
         
         # Génération du nom de fichier avec type et "generated"
         if gen_file.file_type == 'TFT':
@@ -63,20 +45,65 @@ class GeneratedFileDownloadView(APIView):
         
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
-import pandas as pd
-from rest_framework.views import APIView
-from rest_framework.response import Response
 from rest_framework import status
 from .serializers import BalanceUploadSerializer
-from django.core.files.storage import default_storage
 from django.conf import settings
-import os
 from .tft_generator import generate_tft_and_sheets
+from .persistence import persist_generation_results, persist_generation_error
+from .catalog import PENDING_STATUSES, STATUS_UNPROCESSED, report_catalog
+from .results import (
+    conditional_json_response, encode_json, json_response, raw_results, with_raw_results,
+    tft_rubric, sheet_page, ResultNotFound, SHEET_TABS,
+)
+from .ingestion import (
+    format_from_content_type, ingest_account_data_stream, bulk_write_account_data,
+    iter_json_array_chunks, iter_stream_chunks, RequestBodyReader, INGEST_FORMATS,
+)
+from .loaders import LoadError
+from .triggers import pending_report_ids
+from .jobs import (
+    enqueue_report_job, enqueue_upload_job, run_report_job_now, job_status, background_capacity,
+    pin_recent_results,
+    JOB_SUCCEEDED, ACTIVE_JOB_STATUSES, PRIORITY_INTERACTIVE, PRIORITY_BACKFILL,
+)
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.db import connection
+from django.http import StreamingHttpResponse
+from .models import ProcessingJob
+from django.db import IntegrityError
+
+
+def run_async(request):
+    """
+    "async": true (ou ?async=1) met le traitement en file (réponse 202 et suivi via
+    jobs/<id>/) ; par défaut, la génération est faite dans la requête
+    """
+    value = request.data.get('async', request.query_params.get('async'))
+    return value is not None and str(value).lower() in ('1', 'true', 'yes')
+
+
+def job_accepted_response(job, message, **extra):
+    """Réponse 202 d'un traitement mis en file : identifiant du job et URL de son statut (Location)"""
+    status_url = f'/api/reports/jobs/{job.id}/'
+    response = Response({
+        'message': message,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': status_url,
+        **extra
+    }, status=202)
+    response['Location'] = status_url
+    return response
 
-from .models import BalanceUpload, GeneratedFile
 
 class BalanceUploadView(APIView):
     def post(self, request):
+        """
+        Enregistre un fichier de balance et génère ses rapports.
+
+        La génération est faite dans la requête (201 avec les résultats) ; avec
+        "async": true, elle est mise en file (202, suivi via jobs/<id>/).
+        """
         serializer = BalanceUploadSerializer(data=request.data)
         if serializer.is_valid():
             file = serializer.validated_data['file']
@@ -87,28 +114,22 @@ class BalanceUploadView(APIView):
                 file=file,
                 start_date=start_date,
                 end_date=end_date,
-                user=request.user if request.user.is_authenticated else None
+                user=request.user if request.user.is_authenticated else None,
+                status='processing'
             )
+            if run_async(request):
+                job = enqueue_upload_job(balance_upload)
+                return job_accepted_response(job, 'Traitement mis en file', balance_upload_id=balance_upload.id)
+
             abs_path = balance_upload.file.path
             try:
                 # Nouvelle version : la fonction doit retourner le contenu binaire des fichiers générés
-                tft_content, sheets_contents, tft_data, sheets_data, coherence = generate_tft_and_sheets(abs_path, start_date, end_date)
-                # Enregistrement du fichier TFT uniquement en base
-                GeneratedFile.objects.create(
-                    balance_upload=balance_upload,
-                    file_type='TFT',
-                    file_content=tft_content
+                results = generate_tft_and_sheets(abs_path, start_date, end_date)
+                # Enregistrement des fichiers et des données JSON en une seule transaction
+                balance_upload, tft_data, sheets_data = persist_generation_results(
+                    results, balance_upload=balance_upload
                 )
-                # Enregistrement des feuilles maîtresses uniquement en base
-                for group_name, sheet_content in sheets_contents.items():
-                    GeneratedFile.objects.create(
-                        balance_upload=balance_upload,
-                        file_type='feuille_maitresse',
-                        group_name=group_name,
-                        file_content=sheet_content
-                    )
-                balance_upload.status = 'success'
-                balance_upload.save()
+                coherence = results[4]
                 # Préparation de la réponse avec les fichiers et les données JSON
                 # Préparation de l'historique avec liens de téléchargement
                 history = {
@@ -129,47 +150,15 @@ class BalanceUploadView(APIView):
                         } for f in balance_upload.generated_files.all()
                     ]
                 }
-                import math
-                import pandas as pd
-                import numpy as np
-                def sanitize(obj):
-                    if isinstance(obj, dict):
-                        return {k: sanitize(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [sanitize(v) for v in obj]
-                    elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                        return int(obj)
-                    elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                        if math.isnan(obj) or math.isinf(obj):
-                            return None
-                        return float(obj)
-                    elif isinstance(obj, float):
-                        if math.isnan(obj) or math.isinf(obj):
-                            return None
-                        return obj
-                    elif isinstance(obj, pd.Timestamp):
-                        return obj.isoformat()
-                    elif isinstance(obj, np.ndarray):
-                        return obj.tolist()
-                    else:
-                        return obj
-                tft_data_clean = sanitize(tft_data)
-                sheets_data_clean = sanitize(sheets_data)
-                # Stockage des données JSON dans BalanceUpload
-                balance_upload.tft_json = tft_data_clean
-                balance_upload.feuilles_maitresses_json = sheets_data_clean
-                balance_upload.coherence_json = coherence
-                balance_upload.save()
-                return Response({
-                    'tft_json': tft_data_clean,
-                    'feuilles_maitresses_json': sheets_data_clean,
+                # Valeurs JSON natives du moteur : encodage direct, sans rendu DRF
+                return json_response({
+                    'tft_json': tft_data,
+                    'feuilles_maitresses_json': sheets_data,
                     'coherence': coherence,
                     'history': history
                 }, status=status.HTTP_201_CREATED)
             except Exception as e:
-                balance_upload.status = 'error'
-                balance_upload.error_message = str(e)
-                balance_upload.save()
+                persist_generation_error(e, balance_upload=balance_upload)
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -206,7 +195,12 @@ class ProcessAccountDataView(APIView):
     """Vue pour traiter automatiquement les données AccountData et générer les rapports"""
     
     def post(self, request):
-        """Traite les données AccountData et génère les rapports automatiquement"""
+        """
+        Traite les données AccountData et génère les rapports automatiquement
+
+        Avec "async": true (ou ?async=1), le traitement est mis en file et la réponse 202
+        contient l'identifiant du job et l'URL de son statut.
+        """
         financial_report_id = request.data.get('financial_report_id')
         start_date = request.data.get('start_date')
         end_date = request.data.get('end_date')
@@ -223,8 +217,11 @@ class ProcessAccountDataView(APIView):
                 'error': f'Aucune donnée trouvée pour financial_report_id: {financial_report_id}'
             }, status=404)
         
-        # Vérifier si un traitement existe déjà pour ce financial_report_id
-        existing_upload = BalanceUpload.objects.filter(financial_report_id=financial_report_id).first()
+        # Vérifier si un traitement à jour existe déjà (un traitement périmé est régénéré)
+        report = report_catalog([financial_report_id]).get(financial_report_id)
+        existing_upload = None
+        if report and report['processing_status'] not in PENDING_STATUSES:
+            existing_upload = BalanceUpload.objects.filter(financial_report_id=financial_report_id).order_by('-id').first()
         if existing_upload:
             return Response({
                 'message': 'Traitement déjà effectué pour ce financial_report_id',
@@ -232,71 +229,34 @@ class ProcessAccountDataView(APIView):
                 'status': existing_upload.status
             }, status=200)
         
-        try:
-            # Créer un BalanceUpload pour l'historique
-            balance_upload = BalanceUpload.objects.create(
-                file=None,  # Pas de fichier uploadé
+        if run_async(request):
+            job, created = enqueue_report_job(
+                financial_report_id,
+                priority=PRIORITY_INTERACTIVE,
                 start_date=start_date,
                 end_date=end_date,
-                user=request.user if request.user.is_authenticated else None,
-                status='processing',
-                financial_report_id=financial_report_id
+                user_id=request.user.id if request.user.is_authenticated else None,
             )
-            
-            # Générer les rapports depuis la base de données
-            tft_content, sheets_contents, tft_data, sheets_data, coherence = generate_tft_and_sheets_from_database(
-                financial_report_id, start_date, end_date
+            return job_accepted_response(
+                job, 'Traitement mis en file' if created else 'Traitement déjà en cours pour ce financial_report_id'
             )
-            
-            # Enregistrer le fichier TFT
-            GeneratedFile.objects.create(
-                balance_upload=balance_upload,
-                file_type='TFT',
-                file_content=tft_content
+        
+        try:
+            # Générer les rapports (single-flight : un traitement déjà en cours est attendu)
+            job = run_report_job_now(
+                financial_report_id,
+                priority=PRIORITY_INTERACTIVE,
+                start_date=start_date,
+                end_date=end_date,
+                user_id=request.user.id if request.user.is_authenticated else None,
             )
+            if job.status in ACTIVE_JOB_STATUSES:
+                return job_accepted_response(job, 'Traitement toujours en cours pour ce financial_report_id')
+            if job.status != JOB_SUCCEEDED:
+                raise Exception(job.last_error)
             
-            # Enregistrer les feuilles maîtresses
-            for group_name, sheet_content in sheets_contents.items():
-                GeneratedFile.objects.create(
-                    balance_upload=balance_upload,
-                    file_type='feuille_maitresse',
-                    group_name=group_name,
-                    file_content=sheet_content
-                )
-            
-            # Fonction de nettoyage des données pour JSON
-            def sanitize(obj):
-                if isinstance(obj, dict):
-                    return {k: sanitize(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [sanitize(v) for v in obj]
-                elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                    return int(obj)
-                elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                    if math.isnan(obj) or math.isinf(obj):
-                        return None
-                    return float(obj)
-                elif isinstance(obj, float):
-                    if math.isnan(obj) or math.isinf(obj):
-                        return None
-                    return obj
-                elif isinstance(obj, pd.Timestamp):
-                    return obj.isoformat()
-                elif isinstance(obj, np.ndarray):
-                    return obj.tolist()
-                else:
-                    return obj
-            
-            # Nettoyer les données pour le JSON
-            tft_data_clean = sanitize(tft_data)
-            sheets_data_clean = sanitize(sheets_data)
-            
-            # Mettre à jour le BalanceUpload avec les résultats
-            balance_upload.status = 'success'
-            balance_upload.tft_json = tft_data_clean
-            balance_upload.feuilles_maitresses_json = sheets_data_clean
-            balance_upload.coherence_json = coherence
-            balance_upload.save()
+            # Résultats JSON lus sous forme de texte et renvoyés sans être décodés
+            balance_upload = with_raw_results(BalanceUpload.objects).get(pk=job.balance_upload_id)
             
             # Préparer l'historique avec liens de téléchargement
             history = {
@@ -315,158 +275,307 @@ class ProcessAccountDataView(APIView):
                         'download_url': f'/api/reports/download-generated/{f.id}/',
                         'comment': f.comment,
                         'created_at': f.created_at
-                    } for f in balance_upload.generated_files.all()
+                    } for f in balance_upload.generated_files.defer('file_content')
                 ]
             }
             
-            return Response({
+            return json_response({
                 'message': 'Traitement effectué avec succès',
                 'balance_upload_id': balance_upload.id,
-                'tft_json': tft_data_clean,
-                'feuilles_maitresses_json': sheets_data_clean,
-                'coherence': coherence,
+                **raw_results(balance_upload),
                 'history': history
             }, status=201)
             
         except Exception as e:
-            # En cas d'erreur, marquer le traitement comme échoué
-            if 'balance_upload' in locals():
-                balance_upload.status = 'error'
-                balance_upload.error_message = str(e)
-                balance_upload.save()
-            
+            # L'échec est historisé par le job (BalanceUpload en erreur)
             return Response({
                 'error': f'Erreur lors du traitement: {str(e)}'
             }, status=500)
     
+    @read_from_replica
     def get(self, request):
         """Liste tous les financial_report_id disponibles dans AccountData"""
-        financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        processed_ids = BalanceUpload.objects.filter(
-            financial_report_id__isnull=False
-        ).values_list('financial_report_id', flat=True).distinct()
-        
+        # Une lecture du catalogue des rapports (plus de comptage par rapport), sans le
+        # recalculer : pas d'écriture sur le primaire depuis une lecture routée vers le réplica
         available_ids = []
-        for fid in financial_report_ids:
-            if fid:  # Ignorer les valeurs vides
-                available_ids.append({
-                    'financial_report_id': fid,
-                    'processed': fid in processed_ids,
-                    'account_count': AccountData.objects.filter(financial_report_id=fid).count()
-                })
+        for fid, report in report_catalog(refresh=False).items():
+            available_ids.append({
+                'financial_report_id': fid,
+                'processed': report['processing_status'] != STATUS_UNPROCESSED,
+                'processing_status': report['processing_status'],
+                'account_count': report['count'],
+                'years': report['years'],
+            })
         
         return Response({
             'available_financial_report_ids': available_ids
         })
 
+class ProcessingJobStatusView(APIView):
+    """Statut d'un traitement en file : état, étape (load / aggregate / render k/10 / persist), liens des résultats"""
+
+    # Lu sur le primaire : interrogé dès le 202, et modifié par les workers (l'épinglage du
+    # client ne couvre pas ces écritures), le job serait absent ou en retard sur le réplica
+    def get(self, request, job_id):
+        try:
+            job = ProcessingJob.objects.select_related('balance_upload').defer(
+                'balance_upload__tft_json', 'balance_upload__feuilles_maitresses_json', 'balance_upload__coherence_json'
+            ).get(pk=job_id)
+        except ProcessingJob.DoesNotExist:
+            return Response({'error': 'Job non trouvé'}, status=404)
+        # Suivi interrogé en boucle : 304 tant que le job n'a pas avancé
+        return conditional_json_response(request, job_status(job))
+
+
+class ResultTFTView(APIView):
+    """Une rubrique du TFT d'un traitement (au lieu du tft_json complet)"""
+
+    @read_from_replica
+    def get(self, request, upload_id, ref):
+        pin_recent_results(balance_upload_id=upload_id)
+        try:
+            return conditional_json_response(request, tft_rubric(upload_id, ref))
+        except ResultNotFound as e:
+            return Response({'error': str(e)}, status=404)
+
+
+class ResultSheetView(APIView):
+    """
+    Une page d'un onglet de feuille maîtresse d'un traitement
+
+    Paramètres (query string) :
+    - tab : comparatif, exercice_n ou exercice_n1 (défaut : comparatif)
+    - page : numéro de page, à partir de 1
+    - page_size : lignes par page (défaut RESULTS_PAGE_SIZE, au plus RESULTS_MAX_PAGE_SIZE)
+    """
+
+    @read_from_replica
+    def get(self, request, upload_id, group):
+        pin_recent_results(balance_upload_id=upload_id)
+        tab = request.query_params.get('tab', 'comparatif')
+        if tab not in SHEET_TABS:
+            return Response({'error': f"tab doit valoir {', '.join(SHEET_TABS)}"}, status=400)
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', settings.RESULTS_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'page et page_size doivent être des entiers'}, status=400)
+        if page < 1 or not 1 <= page_size <= settings.RESULTS_MAX_PAGE_SIZE:
+            return Response({
+                'error': f'page doit être >= 1 et page_size entre 1 et {settings.RESULTS_MAX_PAGE_SIZE}'
+            }, status=400)
+        try:
+            return conditional_json_response(request, sheet_page(upload_id, group, tab, page, page_size))
+        except ResultNotFound as e:
+            return Response({'error': str(e)}, status=404)
+
+
+class AccountDataIngestView(APIView):
+    """
+    Ingestion en flux d'une balance (CSV ou NDJSON) dans AccountData
+
+    Le corps brut de la requête est lu par blocs : rien n'est écrit dans MEDIA_ROOT,
+    sauf avec keep_raw=1.
+
+    Paramètres (query string) :
+    - financial_report_id : rapport cible (remplacé s'il existe), généré sinon
+    - input_format : csv ou ndjson (sinon déduit du Content-Type)
+    - keep_raw : 1 pour conserver le fichier brut
+    - filename : nom du fichier brut conservé
+    """
+
+    def post(self, request):
+        fmt = request.query_params.get('input_format') or format_from_content_type(request.content_type)
+        if fmt not in INGEST_FORMATS:
+            return Response({
+                'error': "Format non reconnu : utilisez Content-Type text/csv ou application/x-ndjson, ou ?input_format=csv|ndjson"
+            }, status=400)
+
+        stream = request.stream
+        if stream is None:
+            return Response({'error': 'Corps de requête vide'}, status=400)
+
+        keep_raw = request.query_params.get('keep_raw', '').lower() in ('1', 'true', 'yes')
+        try:
+            summary = ingest_account_data_stream(
+                stream,
+                fmt,
+                financial_report_id=request.query_params.get('financial_report_id'),
+                keep_raw=keep_raw,
+                raw_name=request.query_params.get('filename'),
+            )
+        except LoadError as e:
+            return Response({'error': str(e)}, status=400)
+        except IntegrityError as e:
+            return Response({'error': f'Identifiants déjà présents en base: {e}'}, status=409)
+
+        return Response({
+            'message': 'Données ingérées avec succès',
+            **summary
+        }, status=201)
+
+
+class AccountDataBulkView(APIView):
+    """
+    Écriture en masse d'AccountData : tableau JSON (application/json) ou NDJSON
+
+    Chaque ligne porte son financial_report_id. Les signaux par ligne sont suspendus et le
+    déclencheur de chaque rapport touché est mis à jour une seule fois.
+    """
+
+    def post(self, request):
+        media_type = (request.content_type or '').split(';')[0].strip().lower()
+        if media_type == 'application/json':
+            chunks = iter_json_array_chunks(request.body)
+        elif format_from_content_type(request.content_type) == 'ndjson':
+            if request.stream is None:
+                return Response({'error': 'Corps de requête vide'}, status=400)
+            chunks = iter_stream_chunks(RequestBodyReader(request.stream), 'ndjson')
+        else:
+            return Response({
+                'error': 'Content-Type attendu : application/json (tableau) ou application/x-ndjson'
+            }, status=400)
+
+        try:
+            summary = bulk_write_account_data(chunks)
+        except LoadError as e:
+            return Response({'error': str(e)}, status=400)
+        except IntegrityError as e:
+            return Response({'error': f'Identifiants déjà présents en base: {e}'}, status=409)
+
+        return Response({
+            'message': 'Données enregistrées avec succès',
+            **summary
+        }, status=201)
+
+
+def _auto_process_report(financial_report_id, user_id):
+    """Traite un rapport dans un thread du pool et retourne sa ligne de résultat"""
+    try:
+        # Dates SYSCOHADA déterminées par le job ; single-flight si le rapport
+        # est déjà en cours de traitement ailleurs (moniteur, worker)
+        job = run_report_job_now(financial_report_id, priority=PRIORITY_BACKFILL, user_id=user_id)
+        if job.status != JOB_SUCCEEDED:
+            raise Exception(job.last_error or f'Traitement {job.status}')
+        balance_upload = job.balance_upload
+        return {
+            'financial_report_id': financial_report_id,
+            'status': 'success',
+            'balance_upload_id': balance_upload.id,
+            'start_date': balance_upload.start_date,
+            'end_date': balance_upload.end_date
+        }
+    except Exception as e:
+        return {
+            'financial_report_id': financial_report_id,
+            'status': 'error',
+            'error': str(e)
+        }
+    finally:
+        # Chaque thread a sa propre connexion : elle est fermée avec lui
+        connection.close()
+
+
+def _ndjson_line(payload):
+    # Même encodage que les réponses JSON de l'API ; une ligne par événement
+    return encode_json(payload) + '\n'
+
+
+def _auto_process_stream(unprocessed_ids, waiting_count, user_id, workers):
+    """
+    Lignes NDJSON : `start`, un `result` par rapport terminé (dans l'ordre de fin), `summary`.
+
+    Au plus `workers` rapports sont en cours (moins la part réservée tant qu'une demande
+    interactive est active) ; le suivant n'est lancé qu'à la fin d'un traitement, et rien
+    n'est accumulé en mémoire hormis les compteurs.
+    """
+    yield _ndjson_line({
+        'event': 'start',
+        'message': 'Traitement automatique démarré' if unprocessed_ids else 'Aucune nouvelle donnée à traiter',
+        'total': len(unprocessed_ids),
+        'waiting_count': waiting_count,
+    })
+
+    success_count = 0
+    pending = iter(unprocessed_ids)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auto-process')
+    try:
+        running = set()
+        exhausted = False
+        while True:
+            capacity = background_capacity(workers) if not exhausted else 0
+            while len(running) < capacity:
+                financial_report_id = next(pending, None)
+                if financial_report_id is None:
+                    exhausted = True
+                    break
+                running.add(executor.submit(_auto_process_report, financial_report_id, user_id))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                success_count += result['status'] == 'success'
+                yield _ndjson_line({'event': 'result', **result})
+    finally:
+        # Client déconnecté : les rapports non lancés sont abandonnés, ceux en cours terminés
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    yield _ndjson_line({
+        'event': 'summary',
+        'message': 'Traitement automatique terminé',
+        'total_processed': len(unprocessed_ids),
+        'success_count': success_count,
+        'error_count': len(unprocessed_ids) - success_count,
+    })
+
+
 class AutoProcessView(APIView):
     """Vue pour traiter automatiquement toutes les nouvelles données AccountData"""
     
     def post(self, request):
-        """Traite automatiquement toutes les données AccountData non traitées"""
-        # Récupérer tous les financial_report_id non traités
-        all_financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        processed_ids = BalanceUpload.objects.filter(
-            financial_report_id__isnull=False
-        ).values_list('financial_report_id', flat=True).distinct()
-        
-        unprocessed_ids = [fid for fid in all_financial_report_ids if fid and fid not in processed_ids]
-        
-        if not unprocessed_ids:
-            return Response({
-                'message': 'Aucune nouvelle donnée à traiter',
-                'processed_count': 0
-            })
-        
-        results = []
-        success_count = 0
-        
-        for financial_report_id in unprocessed_ids:
-            try:
-                # Déterminer les dates selon la logique SYSCOHADA
-                start_date, end_date = determine_tft_dates(financial_report_id)
-                
-                # Créer un BalanceUpload
-                balance_upload = BalanceUpload.objects.create(
-                    file=None,
-                    start_date=start_date,
-                    end_date=end_date,
-                    user=request.user if request.user.is_authenticated else None,
-                    status='processing',
-                    financial_report_id=financial_report_id
-                )
-                
-                # Générer les rapports
-                tft_content, sheets_contents, tft_data, sheets_data, coherence = generate_tft_and_sheets_from_database(
-                    financial_report_id, start_date, end_date
-                )
-                
-                # Enregistrer les fichiers
-                GeneratedFile.objects.create(
-                    balance_upload=balance_upload,
-                    file_type='TFT',
-                    file_content=tft_content
-                )
-                
-                for group_name, sheet_content in sheets_contents.items():
-                    GeneratedFile.objects.create(
-                        balance_upload=balance_upload,
-                        file_type='feuille_maitresse',
-                        group_name=group_name,
-                        file_content=sheet_content
-                    )
-                
-                # Fonction de nettoyage
-                def sanitize(obj):
-                    if isinstance(obj, dict):
-                        return {k: sanitize(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [sanitize(v) for v in obj]
-                    elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                        return int(obj)
-                    elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                        if math.isnan(obj) or math.isinf(obj):
-                            return None
-                        return float(obj)
-                    elif isinstance(obj, float):
-                        if math.isnan(obj) or math.isinf(obj):
-                            return None
-                        return obj
-                    elif isinstance(obj, pd.Timestamp):
-                        return obj.isoformat()
-                    elif isinstance(obj, np.ndarray):
-                        return obj.tolist()
-                    else:
-                        return obj
-                
-                # Mettre à jour le BalanceUpload
-                balance_upload.status = 'success'
-                balance_upload.tft_json = sanitize(tft_data)
-                balance_upload.feuilles_maitresses_json = sanitize(sheets_data)
-                balance_upload.coherence_json = coherence
-                balance_upload.save()
-                
-                results.append({
-                    'financial_report_id': financial_report_id,
-                    'status': 'success',
-                    'balance_upload_id': balance_upload.id,
-                    'start_date': start_date,
-                    'end_date': end_date
-                })
-                success_count += 1
-                
-            except Exception as e:
-                results.append({
+        """
+        Traite automatiquement toutes les données AccountData non traitées (ou périmées).
+
+        Réponse en flux NDJSON (une ligne par rapport terminé) ; au plus
+        AUTO_PROCESS_WORKERS rapports sont traités en parallèle. Avec "async": true, chaque
+        rapport est mis en file (priorité backfill) et la réponse 202 liste les jobs.
+        """
+        # Rapports non traités lus dans le catalogue ; ceux encore en cours d'écriture
+        # attendent leur période de calme
+        waiting_ids = pending_report_ids()
+        unprocessed_ids = [
+            fid for fid, report in report_catalog().items()
+            if report['processing_status'] in PENDING_STATUSES and fid not in waiting_ids
+        ]
+        user_id = request.user.id if request.user.is_authenticated else None
+
+        if run_async(request):
+            jobs = []
+            for financial_report_id in unprocessed_ids:
+                # Single-flight : un rapport déjà en file ou en cours garde son job
+                job, created = enqueue_report_job(financial_report_id, priority=PRIORITY_BACKFILL, user_id=user_id)
+                jobs.append({
                     'financial_report_id': financial_report_id,
-                    'status': 'error',
-                    'error': str(e)
+                    'job_id': job.id,
+                    'status': job.status,
+                    'created': created,
+                    'status_url': f'/api/reports/jobs/{job.id}/',
                 })
-        
-        return Response({
-            'message': f'Traitement automatique terminé',
-            'total_processed': len(unprocessed_ids),
-            'success_count': success_count,
-            'error_count': len(unprocessed_ids) - success_count,
-            'results': results
-        })
+            return Response({
+                'message': 'Traitements mis en file' if jobs else 'Aucune nouvelle donnée à traiter',
+                'total': len(jobs),
+                'waiting_count': len(waiting_ids),
+                'jobs': jobs,
+            }, status=202 if jobs else 200)
+
+        workers = max(1, getattr(settings, 'AUTO_PROCESS_WORKERS', 2))
+        response = StreamingHttpResponse(
+            _auto_process_stream(unprocessed_ids, len(waiting_ids), user_id, workers),
+            content_type='application/x-ndjson',
+        )
+        # Les lignes doivent parvenir au client dès qu'elles sont produites
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +51,7 @@ CORS_ALLOWED_ORIGINS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.reports.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,16 +90,78 @@ WSGI_APPLICATION = 'fr_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'af_db',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'localhost',
-        'PORT': '5432',
+def env_bool(name, default=False):
+    """Lit un booléen depuis l'environnement (1/true/yes/on)"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.postgresql')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', 'af_db'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Base de test en UTF-8 (libellés accentués), quel que soit l'encodage de template1
+            'TEST': {'CHARSET': 'UTF8', 'TEMPLATE': 'template0'},
+        }
+    }
+
+# Réutilisation des connexions
+# - DB_CONN_MAX_AGE : durée de vie (secondes) d'une connexion persistante, 0 = une connexion par requête
+# - DB_CONN_HEALTH_CHECKS : vérifie la connexion persistante avant de la réutiliser
+# - DB_POOL : pool de connexions psycopg (nécessite psycopg 3 et psycopg_pool), exclusif avec CONN_MAX_AGE
+DB_POOL = env_bool('DB_POOL') and DB_ENGINE == 'django.db.backends.postgresql'
+
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '600')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+# Réplica en lecture (optionnel) : historique, téléchargements et listings en lecture seule
+# DB_REPLICA_HOST (PostgreSQL) ou DB_REPLICA_NAME (ex. second fichier SQLite en local)
+DB_REPLICA_ALIAS = 'replica'
+
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    replica = copy.deepcopy(DATABASES['default'])
+    replica['NAME'] = os.environ.get('DB_REPLICA_NAME', replica['NAME'])
+    if DB_ENGINE != 'django.db.backends.sqlite3':
+        replica['HOST'] = os.environ.get('DB_REPLICA_HOST', replica['HOST'])
+        replica['PORT'] = os.environ.get('DB_REPLICA_PORT', replica['PORT'])
+        replica['USER'] = os.environ.get('DB_REPLICA_USER', replica['USER'])
+        replica['PASSWORD'] = os.environ.get('DB_REPLICA_PASSWORD', replica['PASSWORD'])
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[DB_REPLICA_ALIAS] = replica
+
+DATABASE_ROUTERS = ['api.reports.routers.ReadReplicaRouter']
+
+# Durée (secondes) pendant laquelle un client relit le primaire après une écriture
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '10'))
 
 
 # Password validation
@@ -144,9 +209,37 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Traitement automatique : un rapport n'est traité qu'après PROCESSING_QUIET_SECONDS
+# sans nouvelle écriture AccountData (déclencheurs en attente, voir api/reports/triggers.py)
+PROCESSING_QUIET_SECONDS = int(os.environ.get('PROCESSING_QUIET_SECONDS', '30'))
+
+# File d'attente des traitements (manage.py run_workers)
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+# Attente avant nouvelle tentative : JOB_RETRY_BACKOFF_SECONDS * 2^(tentative - 1)
+JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', '30'))
+# Un job « running » sans nouvelles depuis ce délai (worker arrêté brutalement) est repris
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '1800'))
+# Attente maximale d'un appelant synchrone rattaché à un traitement déjà en cours
+JOB_WAIT_TIMEOUT_SECONDS = int(os.environ.get('JOB_WAIT_TIMEOUT_SECONDS', '600'))
+# Capacité réservée aux demandes interactives (workers run_workers, pools des moniteurs et
+# d'auto-process) : laissée libre par les traitements de fond tant qu'une demande est active
+JOB_INTERACTIVE_WORKERS = int(os.environ.get('JOB_INTERACTIVE_WORKERS', '1'))
+# Rapports traités en parallèle par /api/reports/auto-process/ (réponse NDJSON)
+AUTO_PROCESS_WORKERS = int(os.environ.get('AUTO_PROCESS_WORKERS', '2'))
+# Lignes par page des feuilles maîtresses servies par /api/reports/results/ (et maximum demandable)
+RESULTS_PAGE_SIZE = int(os.environ.get('RESULTS_PAGE_SIZE', '200'))
+RESULTS_MAX_PAGE_SIZE = int(os.environ.get('RESULTS_MAX_PAGE_SIZE', '1000'))
+
+# Journal des changements AccountData lu par les moniteurs (api/reports/changes.py)
+# Fenêtre relue à chaque passage (transactions validées après une entrée plus récente)
+CHANGE_LOG_GRACE_SECONDS = int(os.environ.get('CHANGE_LOG_GRACE_SECONDS', '300'))
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', '7'))
+# Moniteurs sur plusieurs nœuds : sans battement de cœur depuis ce délai, un nœud est
+# considéré arrêté et sa part des rapports est reprise (api/reports/coordination.py)
+MONITOR_NODE_TTL_SECONDS = int(os.environ.get('MONITOR_NODE_TTL_SECONDS', '120'))
+
 # Configuration des logs pour le traitement automatique
 # Configuration de logging robuste
-import os
 
 # Créer le dossier logs s'il n'existe pas
 LOGS_DIR = BASE_DIR / 'logs'
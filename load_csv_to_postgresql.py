@@ -1,22 +1,26 @@
 #!/usr/bin/env python
 """
 Script pour charger le fichier CSV dans PostgreSQL
-Usage: python load_csv_to_postgresql.py api_financialreportaccountdetail_with_previous_year.csv
+Usage: python load_csv_to_postgresql.py api_financialreportaccountdetail_with_previous_year.csv [--mode auto|copy|orm]
+       python load_csv_to_postgresql.py exports/ --workers 8
 """
 
 import os
 import sys
+import time
 import django
-import pandas as pd
-from datetime import datetime
 
 # Configuration Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fr_backend.settings')
 django.setup()
 
-from api.reports.models import AccountData
+from api.reports.stats import account_data_stats
+from api.reports.loaders import (
+    load_account_data_csv, load_account_data_files, expand_csv_sources,
+    LoadError, LOAD_MODES, DEFAULT_CHUNK_SIZE
+)
 
-def load_csv_to_postgresql(csv_file_path):
+def load_csv_to_postgresql(csv_file_path, mode='auto', batch_size=1000, chunk_size=DEFAULT_CHUNK_SIZE, rejects_path=None, strategy='replace'):
     """Charge le fichier CSV dans PostgreSQL"""
     
     print(f"🔄 Chargement du fichier: {csv_file_path}")
@@ -27,98 +31,90 @@ def load_csv_to_postgresql(csv_file_path):
         return False
     
     try:
-        # Lire le CSV
-        print("📖 Lecture du fichier CSV...")
-        df = pd.read_csv(csv_file_path)
-        print(f"✅ {len(df)} lignes lues")
-        
-        # Afficher les colonnes
-        print(f"📋 Colonnes disponibles: {list(df.columns)}")
-        
-        # Vérifier les colonnes requises
-        required_columns = ['id', 'account_number', 'balance', 'total_debit', 'total_credit', 'created_at']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            print(f"❌ ERREUR: Colonnes manquantes: {missing_columns}")
-            return False
-        
-        # Nettoyer les données existantes pour ce financial_report_id (si spécifié)
-        financial_report_id = df['financial_report_id'].iloc[0] if 'financial_report_id' in df.columns else None
-        if financial_report_id:
-            print(f"🧹 Nettoyage des données existantes pour financial_report_id: {financial_report_id}")
-            AccountData.objects.filter(financial_report_id=financial_report_id).delete()
-        
-        # Préparer les données pour l'insertion
-        print("🔄 Préparation des données...")
-        account_data_list = []
-        errors = 0
-        
-        for index, row in df.iterrows():
-            try:
-                # Convertir created_at en datetime
-                created_at = pd.to_datetime(row['created_at']).to_pydatetime()
-                
-                # Créer l'objet AccountData
-                account_data = AccountData(
-                    id=str(row['id']),
-                    account_number=str(row['account_number']),
-                    account_label=str(row.get('account_label', '')),
-                    account_class=str(row.get('account_class', '')),
-                    balance=float(row['balance']),
-                    total_debit=float(row['total_debit']),
-                    total_credit=float(row['total_credit']),
-                    entries_count=int(row.get('entries_count', 0)),
-                    created_at=created_at,
-                    financial_report_id=str(row.get('financial_report_id', '')),
-                    account_lookup_key=str(row.get('account_lookup_key', '')) if pd.notna(row.get('account_lookup_key')) else None
-                )
-                account_data_list.append(account_data)
-                
-                # Afficher le progrès
-                if (index + 1) % 500 == 0:
-                    print(f"   Traité {index + 1}/{len(df)} lignes...")
-                
-            except Exception as e:
-                errors += 1
-                if errors <= 5:  # Afficher seulement les 5 premières erreurs
-                    print(f"⚠️  Erreur à la ligne {index + 1}: {e}")
-                continue
-        
-        if errors > 0:
-            print(f"⚠️  {errors} erreurs rencontrées sur {len(df)} lignes")
-        
-        # Insérer en lot
-        print(f"💾 Insertion de {len(account_data_list)} enregistrements dans PostgreSQL...")
-        AccountData.objects.bulk_create(account_data_list, batch_size=1000)
-        
-        print(f"✅ {len(account_data_list)} enregistrements chargés avec succès!")
-        
-        # Afficher les statistiques
-        total_count = AccountData.objects.count()
-        financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        financial_report_ids = [fid for fid in financial_report_ids if fid]  # Filtrer les valeurs vides
-        
-        print(f"\n📊 Statistiques:")
-        print(f"   - Total enregistrements dans la base: {total_count}")
-        print(f"   - Financial Report IDs: {len(financial_report_ids)}")
-        
-        if financial_report_ids:
-            for fid in financial_report_ids:
-                count = AccountData.objects.filter(financial_report_id=fid).count()
-                print(f"     * {fid}: {count} enregistrements")
-        
-        # Analyser les exercices
-        exercices = AccountData.objects.values_list('created_at', flat=True).distinct()
-        years = set([ex.year for ex in exercices if ex])
-        print(f"   - Exercices disponibles: {sorted(years)}")
+        started = time.monotonic()
+        summary = load_account_data_csv(
+            csv_file_path, mode=mode, batch_size=batch_size,
+            chunk_size=chunk_size, rejects_path=rejects_path, strategy=strategy
+        )
+        elapsed = time.monotonic() - started
+        
+        if 'changes' in summary:
+            print_changes(summary['changes'])
+        elif summary['financial_report_ids']:
+            print(f"🧹 Données remplacées pour financial_report_id: {', '.join(summary['financial_report_ids'])}")
+        if summary['errors'] > 0:
+            print(f"⚠️  {summary['errors']} lignes rejetées, détail dans {summary['rejects_path']}")
+        
+        rate = summary['rows'] / elapsed if elapsed > 0 else summary['rows']
+        print(f"✅ {summary['rows']} enregistrements chargés avec succès! "
+              f"(mode {summary['mode']}, {elapsed:.2f}s, {rate:.0f} lignes/s)")
+        
+        print_statistics()
         
         return True
         
+    except LoadError as e:
+        print(f"❌ ERREUR: {str(e)}")
+        return False
     except Exception as e:
         print(f"❌ ERREUR lors du chargement: {str(e)}")
         return False
 
+def print_changes(changes):
+    """Affiche le résumé d'un chargement incrémental"""
+    print(f"🔁 Chargement incrémental: {changes['inserted']} ajout(s), {changes['updated']} modification(s), "
+          f"{changes['deleted']} suppression(s), {changes['unchanged']} inchangé(s)")
+    if changes['prefixes']:
+        print(f"   - Préfixes touchés: {', '.join(changes['prefixes'])}")
+
+def print_statistics():
+    """Affiche les statistiques de la table AccountData (une seule requête groupée)"""
+    stats = account_data_stats()
+    
+    print(f"\n📊 Statistiques:")
+    print(f"   - Total enregistrements dans la base: {stats['total']}")
+    print(f"   - Financial Report IDs: {len(stats['reports'])}")
+    
+    for fid, report in stats['reports'].items():
+        print(f"     * {fid}: {report['count']} enregistrements")
+    
+    print(f"   - Exercices disponibles: {stats['years']}")
+
+def load_many_csv(paths, workers, checkpoint_path, **options):
+    """Charge plusieurs fichiers CSV en parallèle (un processus et une transaction par fichier)"""
+    
+    print(f"🔄 {len(paths)} fichier(s) à charger avec {workers} processus")
+    
+    def report(result):
+        name = os.path.basename(result['path'])
+        if 'error' in result:
+            print(f"❌ {name}: {result['error']}")
+            return
+        rejected = f", {result['errors']} rejet(s)" if result['errors'] else ''
+        if 'changes' in result:
+            changes = result['changes']
+            rejected += f", +{changes['inserted']} ~{changes['updated']} -{changes['deleted']}"
+        print(f"✅ {name}: {result['rows']} lignes en {result['elapsed']:.2f}s "
+              f"({result['rows_per_second']:.0f} lignes/s{rejected})")
+    
+    started = time.monotonic()
+    outcome = load_account_data_files(
+        paths, workers=workers, checkpoint_path=checkpoint_path, on_result=report, **options
+    )
+    elapsed = time.monotonic() - started
+    
+    results = outcome['results']
+    failed = [r for r in results if 'error' in r]
+    total_rows = sum(r['rows'] for r in results)
+    
+    if outcome['skipped']:
+        print(f"⏭️  {outcome['skipped']} fichier(s) déjà chargé(s) d'après {checkpoint_path}")
+    print(f"\n📦 {len(results) - len(failed)}/{len(results)} fichier(s) chargé(s), "
+          f"{total_rows} lignes en {elapsed:.2f}s ({total_rows / elapsed if elapsed > 0 else total_rows:.0f} lignes/s)")
+    
+    print_statistics()
+    return not failed
+
 def test_database_connection():
     """Teste la connexion à la base de données"""
     try:
@@ -139,16 +135,34 @@ def test_database_connection():
 
 def main():
     """Fonction principale"""
-    if len(sys.argv) != 2:
-        print("Usage: python load_csv_to_postgresql.py <fichier_csv>")
-        print("Exemple: python load_csv_to_postgresql.py api_financialreportaccountdetail_with_previous_year.csv")
-        sys.exit(1)
+    import argparse
     
-    csv_file_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Chargement d\'un fichier CSV de balance dans AccountData')
+    parser.add_argument('source', help='Fichier CSV, répertoire ou motif glob (ex: "exports/*.csv")')
+    parser.add_argument('--mode', choices=LOAD_MODES, default='auto',
+                        help='copy (PostgreSQL COPY), orm (bulk_create) ou auto (défaut)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Taille des lots bulk_create (mode orm)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Nombre de lignes lues par bloc (défaut: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--upsert', action='store_true',
+                        help='Chargement incrémental : n\'écrit que les lignes ajoutées, modifiées ou supprimées')
+    parser.add_argument('--rejects', help='Fichier des lignes rejetées (défaut: <fichier>.rejects.csv)')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Nombre de processus pour un répertoire ou un motif (défaut: min(4, CPU))')
+    parser.add_argument('--checkpoint', default='load_checkpoint.jsonl',
+                        help='Fichier de reprise des chargements multi-fichiers (défaut: load_checkpoint.jsonl)')
+    
+    args = parser.parse_args()
+    paths = expand_csv_sources(args.source)
+    strategy = 'upsert' if args.upsert else 'replace'
     
     print("🚀 CHARGEMENT CSV VERS POSTGRESQL")
     print("=" * 50)
     
+    if not paths:
+        print(f"❌ ERREUR: Aucun fichier CSV trouvé pour {args.source}")
+        sys.exit(1)
+    
     # Test de connexion
     if not test_database_connection():
         print("\n❌ Impossible de continuer sans connexion à PostgreSQL")
@@ -156,7 +170,16 @@ def main():
         sys.exit(1)
     
     # Chargement des données
-    success = load_csv_to_postgresql(csv_file_path)
+    if len(paths) == 1 and os.path.isfile(args.source):
+        success = load_csv_to_postgresql(
+            paths[0], mode=args.mode, batch_size=args.batch_size,
+            chunk_size=args.chunk_size, rejects_path=args.rejects, strategy=strategy
+        )
+    else:
+        success = load_many_csv(
+            paths, args.workers, args.checkpoint,
+            mode=args.mode, batch_size=args.batch_size, chunk_size=args.chunk_size, strategy=strategy
+        )
     
     if success:
         print("\n🎉 CHARGEMENT TERMINÉ AVEC SUCCÈS!")
@@ -7,16 +7,18 @@ Peut être exécuté indépendamment de Django
 import os
 import sys
 import django
-import time
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Configuration Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fr_backend.settings')
 django.setup()
 
-from api.reports.models import AccountData, BalanceUpload
-from api.reports.signals import process_financial_report_async
+from django.db import close_old_connections
+from api.reports.monitor_pool import ReportMonitor
+from api.reports.triggers import pending_report_ids
+from api.reports.routers import read_from_replica
+from api.reports.catalog import PENDING_STATUSES, report_catalog
 
 # Configuration du logging
 logging.basicConfig(
@@ -29,91 +31,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Nom du moniteur : positions dans le journal (MonitorCursor) et nœuds (MonitorNode)
+MONITOR_NAME = 'monitor_realtime'
+
 class DataMonitor:
     """Moniteur de données pour traitement automatique"""
     
-    def __init__(self, interval=60, min_accounts=10):
+    def __init__(self, interval=60, min_accounts=10, listen=True, workers=1, timeout=None, node=None):
         self.interval = interval
         self.min_accounts = min_accounts
-        self.running = False
+        self.listen = listen
+        self.monitor = ReportMonitor(
+            MONITOR_NAME, min_accounts=min_accounts, workers=workers, timeout=timeout, node=node, log=logger.log,
+        )
         
     def start_monitoring(self):
         """Démarre la surveillance continue"""
+        listener = self.monitor.open_listener(self.listen)
         logger.info(f"🚀 Démarrage du moniteur de données")
         logger.info(f"   Intervalle: {self.interval} secondes")
         logger.info(f"   Seuil minimum: {self.min_accounts} comptes")
+        logger.info(f"   Workers: {self.monitor.workers}")
+        logger.info(f"   Nœud: {self.monitor.coordinator.node}")
+        logger.info(f"   Mode: {'Notifications PostgreSQL (LISTEN)' if listener else 'Polling'}")
         
-        self.running = True
+        self.monitor.handle_signals()
         
         try:
-            while self.running:
+            while not self.monitor.stop_requested:
+                # Recycle les connexions expirées ou cassées (CONN_MAX_AGE / CONN_HEALTH_CHECKS)
+                close_old_connections()
                 self.check_new_data()
-                logger.info(f"⏳ Attente de {self.interval} secondes...")
-                time.sleep(self.interval)
+                close_old_connections()
+                if not self.monitor.stop_requested:
+                    self.monitor.wait_for_changes(listener, self.interval)
+            logger.info("✅ Traitements en cours terminés, moniteur arrêté")
                 
         except KeyboardInterrupt:
             logger.info("🛑 Arrêt du moniteur demandé par l'utilisateur")
-            self.running = False
         except Exception as e:
             logger.error(f"❌ Erreur dans le moniteur: {str(e)}")
-            self.running = False
+        finally:
+            if listener is not None:
+                listener.close()
+            self.monitor.leave()
     
     def check_new_data(self):
         """Vérifie et traite les nouvelles données"""
         logger.info(f"🔍 Vérification des nouvelles données - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Récupérer les financial_report_id non traités
-        all_financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        processed_ids = BalanceUpload.objects.filter(
-            financial_report_id__isnull=False
-        ).values_list('financial_report_id', flat=True).distinct()
-        
-        unprocessed_ids = [fid for fid in all_financial_report_ids if fid and fid not in processed_ids]
-        
-        if not unprocessed_ids:
-            logger.info("✅ Aucune nouvelle donnée à traiter")
-            return
-        
-        logger.info(f"📊 {len(unprocessed_ids)} financial_report_id(s) non traité(s)")
-        
-        # Traiter chaque financial_report_id
-        for financial_report_id in unprocessed_ids:
-            try:
-                account_count = AccountData.objects.filter(financial_report_id=financial_report_id).count()
-                
-                if account_count < self.min_accounts:
-                    logger.warning(f"⚠️  {financial_report_id}: {account_count} comptes (seuil: {self.min_accounts})")
-                    continue
-                
-                logger.info(f"🔄 Traitement de {financial_report_id} ({account_count} comptes)...")
-                
-                # Traiter le financial_report_id
-                process_financial_report_async(financial_report_id)
-                
-                logger.info(f"✅ {financial_report_id}: Traité avec succès")
-                
-            except Exception as e:
-                logger.error(f"❌ {financial_report_id}: Erreur - {str(e)}")
+        return self.monitor.run_pass()
     
     def process_all_pending(self):
         """Traite toutes les données en attente une seule fois"""
         logger.info("🔄 Traitement unique de toutes les données en attente")
-        self.check_new_data()
+        try:
+            self.check_new_data()
+        finally:
+            self.monitor.leave()
     
+    @read_from_replica
     def get_status(self):
         """Retourne le statut actuel du système"""
-        all_financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-        processed_ids = BalanceUpload.objects.filter(
-            financial_report_id__isnull=False
-        ).values_list('financial_report_id', flat=True).distinct()
-        
-        unprocessed_ids = [fid for fid in all_financial_report_ids if fid and fid not in processed_ids]
+        # Une lecture du catalogue des rapports
+        reports = report_catalog()
+        unprocessed = [
+            fid for fid, report in reports.items() if report['processing_status'] in PENDING_STATUSES
+        ]
         
         status = {
-            'total_financial_report_ids': len(all_financial_report_ids),
-            'processed_ids': len(processed_ids),
-            'unprocessed_ids': len(unprocessed_ids),
-            'unprocessed_list': unprocessed_ids,
+            'total_financial_report_ids': len(reports),
+            'processed_ids': len(reports) - len(unprocessed),
+            'unprocessed_ids': len(unprocessed),
+            'unprocessed_list': unprocessed,
+            'total_accounts': sum(report['count'] for report in reports.values()),
+            'years': sorted({year for report in reports.values() for year in report['years']}),
+            'waiting_ids': len(pending_report_ids()),
             'timestamp': datetime.now().isoformat()
         }
         
@@ -128,10 +120,15 @@ def main():
     parser.add_argument('--min-accounts', type=int, default=10, help='Nombre minimum de comptes requis')
     parser.add_argument('--once', action='store_true', help='Exécuter une seule fois')
     parser.add_argument('--status', action='store_true', help='Afficher le statut actuel')
+    parser.add_argument('--poll', action='store_true', help='Polling seul, sans LISTEN/NOTIFY PostgreSQL')
+    parser.add_argument('--workers', type=int, default=1, help='Nombre de rapports traités en parallèle (un processus chacun)')
+    parser.add_argument('--timeout', type=float, default=None, help="Durée maximale du traitement d'un rapport en secondes")
+    parser.add_argument('--node', default=None, help="Nom de ce nœud pour la répartition des rapports (défaut: nom d'hôte)")
     
     args = parser.parse_args()
     
-    monitor = DataMonitor(interval=args.interval, min_accounts=args.min_accounts)
+    monitor = DataMonitor(interval=args.interval, min_accounts=args.min_accounts, listen=not args.poll,
+                          workers=args.workers, timeout=args.timeout, node=args.node)
     
     if args.status:
         status = monitor.get_status()
@@ -139,6 +136,8 @@ def main():
         print(f"   Total financial_report_ids: {status['total_financial_report_ids']}")
         print(f"   Traités: {status['processed_ids']}")
         print(f"   En attente: {status['unprocessed_ids']}")
+        print(f"   En cours d'écriture (période de calme): {status['waiting_ids']}")
+        print(f"   Comptes chargés: {status['total_accounts']} (exercices {status['years']})")
         if status['unprocessed_list']:
             print(f"   IDs en attente: {', '.join(map(str, status['unprocessed_list']))}")
         return
@@ -12,8 +12,9 @@ from datetime import datetime, date
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fr_backend.settings')
 django.setup()
 
-from api.reports.models import AccountData, BalanceUpload, GeneratedFile
+from api.reports.models import BalanceUpload, GeneratedFile
 from api.reports.tft_generator import generate_tft_and_sheets_from_database
+from api.reports.catalog import report_catalog
 
 def test_database_connection():
     """Test 1: Vérifier la connexion PostgreSQL"""
@@ -36,15 +37,12 @@ def test_database_connection():
 def test_account_data_loaded():
     """Test 2: Vérifier que les données sont chargées"""
     try:
-        account_count = AccountData.objects.count()
+        reports = report_catalog()
+        account_count = sum(report['count'] for report in reports.values())
         if account_count > 0:
-            # Analyser les données
-            financial_report_ids = AccountData.objects.values_list('financial_report_id', flat=True).distinct()
-            financial_report_ids = [fid for fid in financial_report_ids if fid]
-            
-            # Analyser les exercices
-            exercices = AccountData.objects.values_list('created_at', flat=True).distinct()
-            years = set([ex.year for ex in exercices if ex])
+            # Analyser les données et les exercices (catalogue des rapports)
+            financial_report_ids = list(reports)
+            years = {year for report in reports.values() for year in report['years']}
             
             print(f"✅ Données chargées: {account_count} enregistrements, {len(financial_report_ids)} financial_report_ids, Exercices: {sorted(years)}")
             
@@ -60,17 +58,13 @@ def test_tft_generation(financial_report_id):
     """Test 3: Tester la génération TFT"""
     try:
         # Déterminer les dates selon la logique SYSCOHADA
-        account_data = AccountData.objects.filter(financial_report_id=financial_report_id)
-        if not account_data.exists():
+        report = report_catalog([financial_report_id]).get(financial_report_id)
+        if report is None:
             print(f"❌ Génération TFT: Aucune donnée pour {financial_report_id}")
             return False
         
         # Analyser les exercices disponibles
-        exercices = set()
-        for data in account_data:
-            exercices.add(data.created_at.year)
-        
-        exercices = sorted(exercices)
+        exercices = report['years']
         print(f"📅 Exercices détectés: {exercices}")
         
         if len(exercices) >= 2:
@@ -130,14 +124,8 @@ def test_balance_upload_creation(financial_report_id):
     """Test 4: Tester la création d'un BalanceUpload"""
     try:
         # Déterminer les dates selon la logique SYSCOHADA
-        account_data = AccountData.objects.filter(financial_report_id=financial_report_id)
-        
-        # Analyser les exercices disponibles
-        exercices = set()
-        for data in account_data:
-            exercices.add(data.created_at.year)
-        
-        exercices = sorted(exercices)
+        report = report_catalog([financial_report_id]).get(financial_report_id)
+        exercices = report['years'] if report else []
         
         if len(exercices) >= 2:
             # N-1 et N disponibles : 01/01/N-1 à 31/12/N